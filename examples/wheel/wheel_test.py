@@ -615,6 +615,19 @@ Tag: cp38-abi3-{os_string}_{arch}
                 requires,
             )
 
+    def test_compression_policy(self):
+        filename = self._get_path("compression_policy-0.0.1-py3-none-any.whl")
+
+        with zipfile.ZipFile(filename) as zf:
+            self.assertIsNone(zf.testzip())
+            for zinfo in zf.infolist():
+                want = (
+                    zipfile.ZIP_STORED
+                    if zinfo.filename.endswith(".txt")
+                    else zipfile.ZIP_DEFLATED
+                )
+                self.assertEqual(zinfo.compress_type, want, msg=zinfo.filename)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,442 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The forkserver used by the stage 2 bootstrap.
+
+See the RULES_PYTHON_FORKSERVER environment variable. The stage 2 bootstrap
+loads this file from the runfiles only when the forkserver is enabled, so that
+other runs don't pay for compiling it.
+"""
+
+import os
+import sys
+
+
+def print_verbose(*args):
+    if os.environ.get("RULES_PYTHON_BOOTSTRAP_VERBOSE"):
+        print("bootstrap: forkserver:", *args, file=sys.stderr, flush=True)
+
+
+# Signals that a client forwards to the program.
+_FORWARDED_SIGNALS = (
+    "SIGHUP",
+    "SIGINT",
+    "SIGQUIT",
+    "SIGTERM",
+    "SIGUSR1",
+    "SIGUSR2",
+    "SIGWINCH",
+)
+
+# The sys.flags that interpreter options set, and the options. -i isn't
+# passed on, so that the server doesn't become interactive.
+_FLAG_OPTIONS = (
+    ("debug", "-d"),
+    ("optimize", "-O"),
+    ("dont_write_bytecode", "-B"),
+    ("no_user_site", "-s"),
+    ("no_site", "-S"),
+    ("ignore_environment", "-E"),
+    ("verbose", "-v"),
+    ("bytes_warning", "-b"),
+    ("quiet", "-q"),
+    ("isolated", "-I"),
+    ("safe_path", "-P"),
+)
+
+
+def _make_key(stage2_bootstrap):
+    """Returns the key that identifies the server for this process."""
+    # A server is specific to the binary and to how the interpreter was run.
+    # The server gets the key from the client that starts it because some
+    # flags, e.g. UTF-8 mode, also depend on the environment, which the
+    # client's interpreter modifies at startup.
+    return "\n".join(
+        [
+            os.path.realpath(stage2_bootstrap),
+            os.path.realpath(sys.executable),
+            sys.version,
+            repr(sys.flags),
+            repr(sorted(sys._xoptions.items())),
+        ]
+    )
+
+
+def _interpreter_args():
+    """Returns interpreter options that reproduce how this process was run.
+
+    They're rebuilt from the same state that `_make_key()` uses, so the
+    server gets the same key as its client.
+    """
+    args = []
+    for name, option in _FLAG_OPTIONS:
+        # Options like -v can be repeated; safe_path is new in 3.11.
+        args += [option] * int(getattr(sys.flags, name, 0))
+    for warnoption in sys.warnoptions:
+        args += ["-W", warnoption]
+    for name, value in sys._xoptions.items():
+        args += ["-X", name if value is True else "{}={}".format(name, value)]
+    return args
+
+
+def _preloadable_modules():
+    """Returns the names of the imported modules that the server preloads.
+
+    Only modules from the standard library and from site-packages directories,
+    where third-party packages are installed, are preloaded. Importing the
+    binary's own modules could have side effects that would then happen once
+    in the server, with the environment of the client that started it.
+    """
+    import sysconfig
+
+    stdlib_dirs = tuple(
+        {
+            os.path.realpath(sysconfig.get_path(name)) + os.sep
+            for name in ("stdlib", "platstdlib")
+        }
+    )
+    names = []
+    for name, module in list(sys.modules.items()):
+        spec = getattr(module, "__spec__", None)
+        if name.startswith("__") or spec is None:
+            continue
+        if not spec.has_location:
+            if spec.origin not in ("built-in", "frozen"):
+                continue
+        else:
+            origin = os.path.realpath(spec.origin)
+            parts = origin.split(os.sep)
+            if not (
+                origin.startswith(stdlib_dirs)
+                or "site-packages" in parts
+                or "dist-packages" in parts
+            ):
+                continue
+        names.append(name)
+    return sorted(names)
+
+
+def _get_paths(key):
+    """Returns the server's key and the paths of its files, or None."""
+    import zlib
+
+    state_dir = os.environ.get("RULES_PYTHON_FORKSERVER_DIR") or os.path.join(
+        os.environ.get("TMPDIR") or "/tmp", "rules_python_forkserver_%d" % os.getuid()
+    )
+    try:
+        os.makedirs(state_dir, mode=0o700, exist_ok=True)
+        st = os.stat(state_dir)
+    except OSError as e:
+        print_verbose("unable to create state dir:", e)
+        return None
+    # The server runs programs with the environment and files that clients
+    # send it, so other users must not be able to connect to it.
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        print_verbose("state dir isn't private:", state_dir)
+        return None
+    base = os.path.join(state_dir, "%08x" % zlib.crc32(key.encode("utf-8")))
+    # Unix socket paths are limited to about 100 bytes.
+    if len(base) > 96:
+        print_verbose("state dir path is too long:", state_dir)
+        return None
+    return key, base + ".sock", base + ".lock", base + ".modules", base + ".log"
+
+
+def run_in_server(stage2_bootstrap):
+    """Runs the program in the binary's forkserver, if one is running.
+
+    If no server can run the program, this returns so that the program runs
+    normally, and a server is started when this process exits. Otherwise, this
+    exits the same way that the program did.
+    """
+    # NOTE: The socket module isn't used because it imports enum and more,
+    # which would take up a good part of the time saved.
+    import _socket
+    import marshal
+
+    paths = _get_paths(_make_key(stage2_bootstrap))
+    if not paths:
+        return
+    key, sock_path, _, _, _ = paths
+
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    replies = b""
+
+    def read_reply():
+        nonlocal replies
+        while b"\n" not in replies:
+            chunk = sock.recv(64)
+            if not chunk:
+                return []
+            replies += chunk
+        reply, _, replies = replies.partition(b"\n")
+        return reply.split()
+
+    try:
+        sock.connect(sock_path)
+        request = marshal.dumps(
+            (key, sys.argv, dict(os.environ), os.getcwd(), sys.path)
+        )
+        # The program uses this process's stdin, stdout and stderr directly.
+        fds = b"".join(fd.to_bytes(4, sys.byteorder) for fd in (0, 1, 2))
+        sock.sendmsg(
+            [b"%d\n" % len(request)],
+            [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS, fds)],
+        )
+        sock.sendall(request)
+        reply = read_reply()
+    except OSError as e:
+        print_verbose("unable to connect:", e)
+        reply = []
+    if not reply or reply[0] != b"pid":
+        print_verbose("running normally, server replied:", reply)
+        sock.close()
+        import atexit
+
+        atexit.register(_start_server, paths, stage2_bootstrap)
+        return
+
+    import signal
+
+    pid = int(reply[1])
+    print_verbose("program pid:", pid)
+
+    def forward_signal(signum, frame):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    for name in _FORWARDED_SIGNALS:
+        signal.signal(getattr(signal, name), forward_signal)
+
+    reply = read_reply()
+    if not reply or reply[0] != b"status":
+        print("bootstrap: forkserver: connection lost", file=sys.stderr)
+        os._exit(1)
+    status = int(reply[1])
+    if os.WIFSIGNALED(status):
+        signum = os.WTERMSIG(status)
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+        # Not all signals terminate by default.
+        exit_code = 128 + signum
+    else:
+        exit_code = os.waitstatus_to_exitcode(status)
+    os._exit(exit_code)
+
+
+def _start_server(paths, stage2_bootstrap):
+    """Starts a forkserver that preloads modules this process imported.
+
+    See `_preloadable_modules()` for which modules are preloaded.
+    """
+    import subprocess
+
+    key, _, _, modules_path, log_path = paths
+    modules = _preloadable_modules()
+    tmp_path = "{}.{}.tmp".format(modules_path, os.getpid())
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(modules))
+    os.replace(tmp_path, modules_path)
+
+    env = dict(os.environ)
+    env["RULES_PYTHON_FORKSERVER_SERVE"] = key
+    # The server outlives this process, so it can't write to its stderr.
+    stderr = subprocess.DEVNULL
+    if os.environ.get("RULES_PYTHON_BOOTSTRAP_VERBOSE"):
+        print_verbose("server log:", log_path)
+        stderr = open(log_path, "a")
+    try:
+        subprocess.Popen(
+            [sys.executable] + _interpreter_args() + [stage2_bootstrap],
+            env=env,
+            cwd="/",
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
+            start_new_session=True,
+        )
+    finally:
+        if stderr is not subprocess.DEVNULL:
+            stderr.close()
+
+
+def serve(key):
+    """Runs the binary's forkserver.
+
+    Only returns in the processes that run the program, after they have taken
+    on the client's arguments, environment, working directory and stdio.
+    """
+    import fcntl
+    import importlib
+    import signal
+    import socket
+
+    paths = _get_paths(key)
+    if not paths:
+        sys.exit(1)
+    _, sock_path, lock_path, modules_path, _ = paths
+    lock = open(lock_path, "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        # Another server is already running.
+        sys.exit(0)
+
+    try:
+        with open(modules_path) as f:
+            module_names = f.read().split()
+    except OSError:
+        module_names = []
+    for name in module_names:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print_verbose("unable to preload {}: {!r}".format(name, e))
+    # The server stops when any loaded file changes so that programs don't
+    # run outdated code.
+    loaded_files = {}
+    for module in list(sys.modules.values()):
+        filename = getattr(module, "__file__", None)
+        if isinstance(filename, str):
+            # Runfiles are symlinks into the output tree, which outlives them.
+            filename = os.path.realpath(filename)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            loaded_files[filename] = (st.st_mtime_ns, st.st_size)
+
+    def is_stale():
+        for filename, identity in loaded_files.items():
+            try:
+                st = os.stat(filename)
+            except OSError:
+                return True
+            if (st.st_mtime_ns, st.st_size) != identity:
+                return True
+        return False
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        os.unlink(sock_path)
+    except FileNotFoundError:
+        pass
+    server.bind(sock_path)
+    server.listen(64)
+    server.settimeout(float(os.environ.get("RULES_PYTHON_FORKSERVER_IDLE_SECS", 600)))
+    # Let the request processes be reaped automatically.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            break
+        conn.settimeout(None)
+        if is_stale():
+            conn.sendall(b"stale\n")
+            conn.close()
+            break
+        if os.fork() == 0:
+            server.close()
+            lock.close()
+            _handle_request(key, conn)
+            return
+        conn.close()
+    # The socket is removed while holding the lock, so it can't remove the
+    # socket of a newer server.
+    try:
+        os.unlink(sock_path)
+    except FileNotFoundError:
+        pass
+    sys.exit(0)
+
+
+def _handle_request(key, conn):
+    """Forks the program for a client and reports how it exits.
+
+    Only returns in the program's process.
+    """
+    import marshal
+    import select
+    import signal
+    import socket
+
+    header, fds, _, _ = socket.recv_fds(conn, 64, 3)
+    size, _, request = header.partition(b"\n")
+    request = [request]
+    remaining = int(size) - len(request[0])
+    while remaining > 0:
+        chunk = conn.recv(remaining)
+        if not chunk:
+            os._exit(1)
+        request.append(chunk)
+        remaining -= len(chunk)
+    client_key, argv, environ, cwd, path = marshal.loads(b"".join(request))
+    if client_key != key or len(fds) != 3:
+        conn.sendall(b"reject\n")
+        os._exit(0)
+
+    # SIGCHLD interrupts select() below through the wakeup fd.
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.set_wakeup_fd(wakeup_w)
+    pid = os.fork()
+    if pid == 0:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        os.close(wakeup_r)
+        os.close(wakeup_w)
+        conn.close()
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+            os.close(fd)
+        os.environ.clear()
+        os.environ.update(environ)
+        os.chdir(cwd)
+        sys.argv[:] = argv
+        sys.path[:] = path
+        sys.stdout.reconfigure(line_buffering=sys.stdout.isatty())
+        return
+    for fd in fds:
+        os.close(fd)
+
+    client_gone = False
+    try:
+        conn.sendall(b"pid %d\n" % pid)
+    except OSError:
+        client_gone = True
+        os.kill(pid, signal.SIGKILL)
+    while True:
+        done_pid, status = os.waitpid(pid, os.WNOHANG)
+        if done_pid:
+            break
+        readable, _, _ = select.select(
+            [wakeup_r] if client_gone else [wakeup_r, conn], [], []
+        )
+        if wakeup_r in readable:
+            os.read(wakeup_r, 64)
+        # The client only closes the connection when it is killed, in which
+        # case the program is too, as it would be without the server.
+        if conn in readable and not conn.recv(64):
+            client_gone = True
+            os.kill(pid, signal.SIGKILL)
+    if not client_gone:
+        try:
+            conn.sendall(b"status %d\n" % status)
+        except OSError:
+            pass
+    os._exit(0)
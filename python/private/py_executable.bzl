@@ -195,6 +195,10 @@ accepting arbitrary Python versions.
         "_allowlist_function_transition": lambda: attrb.Label(
             default = "@bazel_tools//tools/allowlists/function_transition_allowlist",
         ),
+        "_bootstrap_forkserver": lambda: attrb.Label(
+            allow_single_file = True,
+            default = "//python/private:bootstrap_forkserver",
+        ),
         "_bootstrap_impl_flag": lambda: attrb.Label(
             default = labels.BOOTSTRAP_IMPL,
             providers = [BuildSettingInfo],
@@ -341,6 +345,7 @@ def _create_executable(
             output_prefix = base_executable_name,
             imports = imports,
             runtime_details = runtime_details,
+            runfiles = runfiles_details.default_runfiles,
         )
 
         stage2_bootstrap = _create_stage2_bootstrap(
@@ -353,7 +358,7 @@ def _create_executable(
             venv = venv,
         )
         extra_runfiles = ctx.runfiles(
-            [stage2_bootstrap] + (
+            [stage2_bootstrap, ctx.file._bootstrap_forkserver] + (
                 venv.files_without_interpreter if venv else []
             ),
         )
@@ -505,7 +510,7 @@ def _create_zip_main(ctx, *, stage2_bootstrap, runtime_details, venv):
 # * https://snarky.ca/how-virtual-environments-work/
 # * https://github.com/python/cpython/blob/main/Modules/getpath.py
 # * https://github.com/python/cpython/blob/main/Lib/site.py
-def _create_venv(ctx, output_prefix, imports, runtime_details):
+def _create_venv(ctx, output_prefix, imports, runtime_details, runfiles):
     create_full_venv = BootstrapImplFlag.get_value(ctx) == BootstrapImplFlag.SCRIPT
     venv = "_{}.venv".format(output_prefix.lstrip("_"))
 
@@ -587,17 +592,41 @@ def _create_venv(ctx, output_prefix, imports, runtime_details):
     ctx.actions.write(pth, "import _bazel_site_init\n")
 
     site_init = ctx.actions.declare_file("{}/_bazel_site_init.py".format(site_packages))
+    import_all = read_possibly_native_flag(ctx, "python_import_all_repositories")
+    subs = {
+        "%coverage_tool%": _get_coverage_tool_runfiles_path(ctx, runtime),
+        "%import_all%": "True" if import_all else "False",
+        "%site_init_runfiles_path%": "{}/{}".format(ctx.workspace_name, site_init.short_path),
+        "%workspace_name%": ctx.workspace_name,
+    }
     computed_subs = ctx.actions.template_dict()
     computed_subs.add_joined("%imports%", imports, join_with = ":", map_each = _map_each_identity)
+    if import_all:
+        # The repositories that have runfiles, and the top-level entries of
+        # root symlinks, i.e. the entries of the runfiles root, so that site
+        # init doesn't have to list them. Symlinks are under the workspace
+        # name, which site init always includes.
+        computed_subs.add_joined(
+            "%import_all_repos%",
+            runfiles.files,
+            join_with = ":",
+            map_each = _map_runfiles_repo,
+            uniquify = True,
+        )
+        computed_subs.add_joined(
+            "%import_all_root_symlinks%",
+            runfiles.root_symlinks,
+            join_with = ":",
+            map_each = _map_root_symlink_top_level,
+            uniquify = True,
+        )
+    else:
+        subs["%import_all_repos%"] = ""
+        subs["%import_all_root_symlinks%"] = ""
     ctx.actions.expand_template(
         template = runtime.site_init_template,
         output = site_init,
-        substitutions = {
-            "%coverage_tool%": _get_coverage_tool_runfiles_path(ctx, runtime),
-            "%import_all%": "True" if read_possibly_native_flag(ctx, "python_import_all_repositories") else "False",
-            "%site_init_runfiles_path%": "{}/{}".format(ctx.workspace_name, site_init.short_path),
-            "%workspace_name%": ctx.workspace_name,
-        },
+        substitutions = subs,
         computed_substitutions = computed_subs,
     )
 
@@ -635,6 +664,19 @@ def _create_venv(ctx, output_prefix, imports, runtime_details):
 def _map_each_identity(v):
     return v
 
+def _map_runfiles_repo(file):
+    # Files from other repositories have short paths like `../repo/path`.
+    # Files from the main repository are under the workspace name, which
+    # site init always includes.
+    if file.short_path.startswith("../"):
+        return file.short_path[3:].partition("/")[0]
+    return None
+
+def _map_root_symlink_top_level(entry):
+    # Root symlink paths are relative to the runfiles root. The top-level
+    # entry may be a file; site init only adds directories.
+    return entry.path.partition("/")[0]
+
 def _get_coverage_tool_runfiles_path(ctx, runtime):
     if (ctx.configuration.coverage_enabled and
         runtime and
@@ -675,6 +717,7 @@ def _create_stage2_bootstrap(
         output = output,
         substitutions = {
             "%coverage_tool%": _get_coverage_tool_runfiles_path(ctx, runtime),
+            "%forkserver%": runfiles_root_path(ctx, ctx.file._bootstrap_forkserver.short_path),
             "%import_all%": "True" if read_possibly_native_flag(ctx, "python_import_all_repositories") else "False",
             "%imports%": ":".join(imports.to_list()),
             "%main%": main_py_path,
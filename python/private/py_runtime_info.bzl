@@ -296,6 +296,8 @@ The following substitutions are made during template expansion:
   can be a `.py` or `.pyc` file, depending on precompile settings.
 * `%coverage_tool%`: Runfiles-relative path to the coverage library's entry point.
   If coverage is not enabled or available, an empty string.
+* `%forkserver%`: Runfiles-relative path to the Python file that implements
+  {envvar}`RULES_PYTHON_FORKSERVER`.
 * `%import_all%`: The string `True` if all repositories in the runfiles should
   be added to sys.path. The string `False` otherwise.
 * `%imports%`: A colon-delimited string of runfiles-relative paths to add to
@@ -42,6 +42,47 @@ _distribution_attrs = {
         default = True,
         doc = "Enable compression of the final archive.",
     ),
+    "compression_auto_min_savings": attr.int(
+        default = 10,
+        doc = """\
+The percentage of its size that deflating a file with the `auto` mode in
+{attr}`compression_policy` must save for the file to be deflated instead of
+stored.
+
+:::{versionadded} VERSION_NEXT_FEATURE
+:::
+""",
+    ),
+    "compression_level": attr.int(
+        default = -1,
+        values = [-1, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+        doc = """\
+The zlib compression level (0-9) of deflated files. `-1` uses zlib's default.
+With another level, each deflated file is read into memory to compress it.
+
+:::{versionadded} VERSION_NEXT_FEATURE
+:::
+""",
+    ),
+    "compression_policy": attr.string_dict(
+        default = {},
+        doc = """\
+How to compress the files whose path in the wheel matches a glob pattern,
+instead of as {attr}`compress` says. The keys are the patterns and the values
+are one of:
+* `stored`: not compressed, e.g. for files that are already compressed.
+* `deflated`: compressed.
+* `auto`: compressed, unless that saves less than
+  {attr}`compression_auto_min_savings`.
+
+`*` also matches `/`, so `*.so` matches all `.so` files. The first pattern
+that matches a file is used. For example:
+`{"*.so": "stored", "*.png": "stored", "*.bin": "auto"}`.
+
+:::{versionadded} VERSION_NEXT_FEATURE
+:::
+""",
+    ),
     "distribution": attr.string(
         mandatory = True,
         doc = """\
@@ -489,6 +530,14 @@ def _py_wheel_impl(ctx):
 
     if not ctx.attr.compress:
         args.add("--no_compress")
+    if ctx.attr.compression_level != -1:
+        args.add("--compression_level", str(ctx.attr.compression_level))
+    for pattern, mode in ctx.attr.compression_policy.items():
+        if mode not in ("stored", "deflated", "auto"):
+            fail("`compression_policy` mode `{}` for `{}` must be one of `stored`, `deflated` or `auto`. Please update {}".format(mode, pattern, ctx.label))
+        args.add("--compression_policy", pattern + ";" + mode)
+    if ctx.attr.compression_policy:
+        args.add("--compression_auto_min_savings", str(ctx.attr.compression_auto_min_savings))
 
     for target, filename in ctx.attr.extra_distinfo_files.items():
         target_files = target[DefaultInfo].files.to_list()
@@ -28,6 +28,7 @@ import logging
 import pathlib
 import sys
 import tempfile
+import zipfile
 
 from tools.wheelmaker import _WhlFile
 
@@ -63,6 +64,10 @@ def _unidiff_output(expected, actual, record):
 def _files_to_pack(dir: pathlib.Path, want_record: str) -> list[pathlib.Path]:
     """Check that the RECORD file entries are correct and print a unified diff on failure."""
 
+    # All the files, to check which RECORD entries exist and which files are
+    # extra without looking through lists.
+    all_files = {path for path in dir.rglob("*") if not path.is_dir()}
+
     # First get existing files by using the RECORD file
     got_files = []
     got_distinfos = []
@@ -70,7 +75,7 @@ def _files_to_pack(dir: pathlib.Path, want_record: str) -> list[pathlib.Path]:
         rec = row[0]
         path = dir / rec
 
-        if not path.exists():
+        if path not in all_files:
             # skip files that do not exist as they won't be present in the final
             # RECORD file.
             continue
@@ -83,8 +88,9 @@ def _files_to_pack(dir: pathlib.Path, want_record: str) -> list[pathlib.Path]:
     # Then get extra files present in the directory but not in the RECORD file
     extra_files = []
     extra_distinfos = []
-    for path in dir.rglob("*"):
-        if path.is_dir():
+    got = set(got_files).union(got_distinfos)
+    for path in all_files:
+        if path in got:
             continue
 
         elif path.parent.name.endswith(_DISTINFO):
@@ -92,10 +98,9 @@ def _files_to_pack(dir: pathlib.Path, want_record: str) -> list[pathlib.Path]:
                 # NOTE: we implement the following matching of what goes into the RECORD
                 # https://peps.python.org/pep-0491/#the-dist-info-directory
                 continue
-            elif path not in got_distinfos:
-                extra_distinfos.append(path)
+            extra_distinfos.append(path)
 
-        elif path not in got_files:
+        else:
             extra_files.append(path)
 
     # sort the extra files for reproducibility
@@ -153,15 +158,26 @@ def main(sys_argv):
         record_contents = record_path.read_text() if record_path.exists() else ""
         distribution_prefix = distinfo_dir.with_suffix("").name
 
+        # Files that the patches didn't change are copied from the original
+        # wheel as they are, instead of being compressed again.
         with _WhlFile(
-            args.output, mode="w", distribution_prefix=distribution_prefix
+            args.output,
+            mode="w",
+            distribution_prefix=distribution_prefix,
+            previous_wheel=args.whl_path,
+            keep_previous_compression=True,
         ) as out:
             for p in _files_to_pack(patched_wheel_dir, record_contents):
                 rel_path = p.relative_to(patched_wheel_dir)
                 out.add_file(str(rel_path), p)
 
             logging.debug(f"Writing RECORD file")
-            got_record = out.add_recordfile().decode("utf-8", "surrogateescape")
+            out.add_recordfile()
+
+        with zipfile.ZipFile(args.output) as repacked:
+            got_record = repacked.read(out.distinfo_path("RECORD")).decode(
+                "utf-8", "surrogateescape"
+            )
 
     if got_record == record_contents:
         logging.info(f"Created a whl file: {args.output}")
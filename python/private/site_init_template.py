@@ -16,12 +16,25 @@ import os
 import os.path
 import sys
 
+# Chrome trace file to write a profile of the startup to, if any.
+_PROFILE_FILE = os.environ.get("RULES_PYTHON_BOOTSTRAP_PROFILE")
+if _PROFILE_FILE:
+    import time
+
+    _PROFILE_START_US = time.time_ns() // 1000
+
 # Colon-delimited string of runfiles-relative import paths to add
 _IMPORTS_STR = "%imports%"
 # Though the import all value is the correct literal, we quote it
 # so this file is parsable by tools.
 _IMPORT_ALL = "%import_all%" == "True"
 _WORKSPACE_NAME = "%workspace_name%"
+# Colon-delimited names of the other repositories that have runfiles, i.e.
+# the other directories in the runfiles root. Only set if _IMPORT_ALL is.
+_IMPORT_ALL_REPOS_STR = "%import_all_repos%"
+# Colon-delimited top-level entries of the runfiles root symlinks. Only set if
+# _IMPORT_ALL is.
+_IMPORT_ALL_ROOT_SYMLINKS_STR = "%import_all_root_symlinks%"
 # runfiles-relative path to this file
 _SELF_RUNFILES_RELATIVE_PATH = "%site_init_runfiles_path%"
 # Runfiles-relative path to the coverage tool entry point, if any.
@@ -51,7 +64,51 @@ _print_verbose("self_runfiles_path:", _SELF_RUNFILES_RELATIVE_PATH)
 _print_verbose("coverage_tool:", _COVERAGE_TOOL)
 
 
+def _profile_now():
+    return time.time_ns() // 1000
+
+
+def _profile_write(text):
+    # A single append, so that writes from other processes aren't interleaved.
+    fd = os.open(_PROFILE_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, text.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def _profile_event(name, start_us, end_us):
+    _profile_write(
+        '{"name": "%s", "ph": "X", "ts": %d, "dur": %d, "pid": %d, "tid": 1},\n'
+        % (name, start_us, end_us - start_us, os.getpid())
+    )
+
+
+def _profile_start():
+    launch_us = os.environ.get("RULES_PYTHON_BOOTSTRAP_PROFILE_STAGE1")
+    if not launch_us:
+        # Not started by stage1 (e.g. a zip file), so start a new trace.
+        global _PROFILE_FILE
+        _PROFILE_FILE = os.path.abspath(_PROFILE_FILE)
+        with open(_PROFILE_FILE, "w") as f:
+            f.write("[\n")
+        return
+    _profile_event("interpreter startup", int(launch_us), _PROFILE_START_US)
+    # Stage1 filters stderr and places the `-X importtime` output that follows
+    # this marker after this time and in this process.
+    os.write(
+        2,
+        b"import time: @rules_python %d %d\n" % (os.getpid(), _PROFILE_START_US),
+    )
+
+
 def _find_runfiles_root():
+    # The bootstrap already found it. It's only set while the bootstrap runs,
+    # so it's always for this binary.
+    runfiles_dir = os.environ.get("RULES_PYTHON_BOOTSTRAP_RUNFILES_ROOT")
+    if runfiles_dir:
+        return runfiles_dir
+
     # Give preference to the environment variables
     runfiles_dir = os.environ.get("RUNFILES_DIR", None)
     if not runfiles_dir:
@@ -152,12 +209,18 @@ def _setup_sys_path():
         _maybe_add_path(abs_path)
 
     if _IMPORT_ALL:
-        repo_dirs = sorted(
-            os.path.join(_RUNFILES_ROOT, d) for d in os.listdir(_RUNFILES_ROOT)
-        )
-        for d in repo_dirs:
-            if os.path.isdir(d):
-                _maybe_add_path(d)
+        # The build determined the runfiles root's entries, so the root
+        # doesn't have to be listed (and every entry stat'ed) on every startup.
+        # Repositories are always directories, but a root symlink can be a
+        # file, which, as when the root was listed, isn't added.
+        names = set(_IMPORT_ALL_REPOS_STR.split(":"))
+        names.add(_WORKSPACE_NAME)
+        for name in _IMPORT_ALL_ROOT_SYMLINKS_STR.split(":"):
+            if name and os.path.isdir(os.path.join(_RUNFILES_ROOT, name)):
+                names.add(name)
+        names.discard("")
+        for d in sorted(os.path.join(_RUNFILES_ROOT, name) for name in names):
+            _maybe_add_path(d)
     else:
         _maybe_add_path(os.path.join(_RUNFILES_ROOT, _WORKSPACE_NAME))
 
@@ -223,7 +286,168 @@ def _fixup_sys_base_executable():
     sys._base_executable = exe
 
 
+class _LazyZip:
+    """Reads members of the zip a binary was run from."""
+
+    def __init__(self, zip_path):
+        import zipfile
+
+        self._zip_path = zip_path
+        self._pid = os.getpid()
+        self._zip_file = zipfile.ZipFile(zip_path)
+        self.members = frozenset(self._zip_file.namelist())
+
+    def read(self, member):
+        # A forked child shares the file offset with its parent, so it must
+        # not share the open zip file.
+        if self._pid != os.getpid():
+            import zipfile
+
+            self._pid = os.getpid()
+            self._zip_file = zipfile.ZipFile(self._zip_path)
+        return self._zip_file.read(member)
+
+
+class _LazyZipSourceLoader:
+    """Loads a module from a Python source file that is still in the zip."""
+
+    def __init__(self, lazy_zip, member, filename, is_package):
+        self._lazy_zip = lazy_zip
+        self._member = member
+        self._filename = filename
+        self._is_package = is_package
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        exec(self.get_code(module.__name__), module.__dict__)
+
+    def get_code(self, fullname):
+        return compile(
+            self._lazy_zip.read(self._member),
+            self._filename,
+            "exec",
+            dont_inherit=True,
+        )
+
+    def get_source(self, fullname):
+        from importlib.util import decode_source
+
+        return decode_source(self._lazy_zip.read(self._member))
+
+    def get_filename(self, fullname):
+        return self._filename
+
+    def get_data(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def is_package(self, fullname):
+        return self._is_package
+
+
+class _LazyZipPathFinder:
+    """Path entry finder for a runfiles directory whose .py files are in the zip.
+
+    Modules that are on disk are found as usual. Otherwise, modules are loaded
+    from the zip, but with `__file__` set to where the file would have been
+    extracted to, so that files next to it can still be found.
+    """
+
+    def __init__(self, path, lazy_zip, prefix):
+        from importlib import machinery
+
+        self._path = path
+        self._lazy_zip = lazy_zip
+        self._prefix = prefix
+        self._file_finder = machinery.FileFinder(
+            path,
+            (machinery.ExtensionFileLoader, machinery.EXTENSION_SUFFIXES),
+            (machinery.SourceFileLoader, machinery.SOURCE_SUFFIXES),
+            (machinery.SourcelessFileLoader, machinery.BYTECODE_SUFFIXES),
+        )
+
+    def invalidate_caches(self):
+        self._file_finder.invalidate_caches()
+
+    def find_spec(self, fullname, target=None):
+        spec = self._file_finder.find_spec(fullname, target)
+        if spec is not None and spec.loader is not None:
+            return spec
+
+        from importlib import machinery
+
+        name = fullname.rpartition(".")[2]
+        for rel_path, is_package in (
+            (name + "/__init__.py", True),
+            (name + ".py", False),
+        ):
+            member = self._prefix + rel_path
+            if member not in self._lazy_zip.members:
+                continue
+            filename = os.path.join(self._path, *rel_path.split("/"))
+            loader = _LazyZipSourceLoader(self._lazy_zip, member, filename, is_package)
+            zip_spec = machinery.ModuleSpec(
+                fullname, loader, origin=filename, is_package=is_package
+            )
+            zip_spec.has_location = True
+            if is_package:
+                zip_spec.submodule_search_locations.append(
+                    os.path.join(self._path, name)
+                )
+            return zip_spec
+
+        # Either a namespace package or not found.
+        return spec
+
+
+def _install_lazy_zip_importer():
+    """Makes the Python files that weren't extracted from the zip importable.
+
+    This is a no-op unless the zip's `__main__.py` extracted our runfiles with
+    `RULES_PYTHON_ZIP_LAZY_EXTRACT=1`.
+    """
+    lazy_zip_root, _, zip_path = os.environ.get("RULES_PYTHON_LAZY_ZIP", "").partition(
+        os.pathsep
+    )
+    root = os.path.normpath(_RUNFILES_ROOT)
+    if not zip_path or os.path.normpath(lazy_zip_root) != root:
+        return
+
+    _print_verbose("importing unextracted files from:", zip_path)
+    lazy_zip = _LazyZip(zip_path)
+    root_prefix = root + os.sep
+
+    def path_hook(path):
+        norm_path = os.path.normpath(path) if path else path
+        if norm_path == root:
+            rel_path = ""
+        elif norm_path.startswith(root_prefix):
+            rel_path = norm_path[len(root_prefix) :].replace(os.sep, "/") + "/"
+        else:
+            raise ImportError("not under the runfiles root: " + path)
+        # Python also asks path hooks about the script it runs.
+        if not os.path.isdir(path):
+            raise ImportError("not a directory: " + path)
+        return _LazyZipPathFinder(path, lazy_zip, "runfiles/" + rel_path)
+
+    sys.path_hooks.insert(0, path_hook)
+    sys.path_importer_cache.clear()
+
+
+if _PROFILE_FILE:
+    _profile_start()
+
 _fixup_sys_base_executable()
 
+_install_lazy_zip_importer()
+
+if _PROFILE_FILE:
+    _sys_path_start_us = _profile_now()
 COVERAGE_SETUP = _setup_sys_path()
+if _PROFILE_FILE:
+    _site_init_end_us = _profile_now()
+    _profile_event("site init: sys.path", _sys_path_start_us, _site_init_end_us)
+    _profile_event("site init", _PROFILE_START_US, _site_init_end_us)
 _print_verbose("DONE")
@@ -6,6 +6,93 @@ if [[ -n "${RULES_PYTHON_BOOTSTRAP_VERBOSE:-}" ]]; then
   set -x
 fi
 
+if [[ -n "${RULES_PYTHON_BOOTSTRAP_PROFILE:-}" ]]; then
+  # Sets profile_now_us to the current time in microseconds.
+  function profile_now() {
+    if [[ -n "${EPOCHREALTIME:-}" ]]; then
+      profile_now_us="${EPOCHREALTIME/[.,]/}"
+    else
+      # Bash before 5.0 (e.g. on Mac) doesn't have EPOCHREALTIME.
+      profile_now_us="$(date +%s)000000"
+    fi
+  }
+
+  # Adds an event named $1 for the span from $2 to $3 to the profile.
+  function profile_event() {
+    printf '{"name": "%s", "ph": "X", "ts": %s, "dur": %s, "pid": %s, "tid": 1},\n' \
+      "$1" "$2" "$(( $3 - $2 ))" "$$" >> "$RULES_PYTHON_BOOTSTRAP_PROFILE"
+  }
+
+  # Adds the `-X importtime` output in the file $1 to the profile.
+  # The output only has the durations of the imports, so they are laid out
+  # back to back, starting no earlier than the last marker the Python side of
+  # the bootstrap wrote before them, or $2 (the interpreter's launch).
+  function profile_add_imports() {
+    awk -v anchor="$2" '
+      /^import time: @rules_python / { pid = $4; anchor = $5; next }
+      /^import time: *[0-9]+ *\|/ {
+        split($0, fields, "|")
+        self_us = fields[1]
+        sub(/^import time: */, "", self_us)
+        name = substr(fields[3], 2)
+        module = name
+        sub(/^ +/, "", module)
+        n++
+        depth[n] = (length(name) - length(module)) / 2
+        modules[n] = module
+        self[n] = self_us + 0
+        cumulative[n] = fields[2] + 0
+        # Imports are reported when they finish, so nested imports come
+        # before the top-level import they are part of.
+        if (tree_anchor == "") tree_anchor = anchor
+        if (depth[n] == 0) {
+          anchors[n] = tree_anchor
+          tree_anchor = ""
+        }
+      }
+      END {
+        for (i = 1; i <= n; i++) {
+          if (depth[i] > 0) continue
+          start = anchors[i] + 0
+          if (start < cursor) start = cursor
+          ends[i] = start + cumulative[i]
+          cursor = ends[i]
+        }
+        # Nested imports are laid out back to back, ending where their parent
+        # ends. Trailing imports without a top-level parent are skipped.
+        for (i = n; i >= 1; i--) {
+          d = depth[i]
+          if (d == 0) {
+            end_us = ends[i]
+          } else if (!((d - 1) in next_end)) {
+            continue
+          } else {
+            end_us = next_end[d - 1]
+          }
+          next_end[d - 1] = end_us - cumulative[i]
+          next_end[d] = end_us
+          printf "{\"name\": \"%s\", \"cat\": \"import\", \"ph\": \"X\", \"ts\": %.0f, \"dur\": %.0f, \"pid\": %d, \"tid\": 2, \"args\": {\"self_us\": %.0f}},\n", modules[i], end_us - cumulative[i], cumulative[i], pid, self[i]
+        }
+        printf "{\"name\": \"process_name\", \"ph\": \"M\", \"pid\": %d, \"args\": {\"name\": \"python\"}},\n", pid
+        printf "{\"name\": \"thread_name\", \"ph\": \"M\", \"pid\": %d, \"tid\": 2, \"args\": {\"name\": \"imports (-X importtime)\"}},\n", pid
+      }
+    ' "$1" >> "$RULES_PYTHON_BOOTSTRAP_PROFILE"
+  }
+
+  if [[ "$RULES_PYTHON_BOOTSTRAP_PROFILE" != /* ]]; then
+    RULES_PYTHON_BOOTSTRAP_PROFILE="$PWD/$RULES_PYTHON_BOOTSTRAP_PROFILE"
+  fi
+  # The trace uses the JSON array format, which doesn't need the closing
+  # bracket, so each part of the bootstrap can append its events.
+  printf '[\n{"name": "process_name", "ph": "M", "pid": %s, "args": {"name": "stage1"}},\n' \
+    "$$" > "$RULES_PYTHON_BOOTSTRAP_PROFILE"
+else
+  function profile_now() { :; }
+  function profile_event() { :; }
+fi
+profile_now
+stage1_start_us=$profile_now_us
+
 # runfiles-relative path
 STAGE2_BOOTSTRAP="%stage2_bootstrap%"
 
@@ -36,6 +123,8 @@ declare -a INTERPRETER_ARGS_FROM_TARGET=(
 %interpreter_args%
 )
 
+profile_now
+runfiles_start_us=$profile_now_us
 if [[ "$IS_ZIPFILE" == "1" ]]; then
   # NOTE: Macs have an old version of mktemp, so we must use only the
   # minimal functionality of it.
@@ -104,6 +193,8 @@ else
   }
   RUNFILES_DIR=$(find_runfiles_root $0)
 fi
+profile_now
+profile_event "stage1: runfiles root" "$runfiles_start_us" "$profile_now_us"
 
 if [[ -n "$RULES_PYTHON_TESTING_TELL_MODULE_SPACE" ]]; then
   export RULES_PYTHON_TESTING_MODULE_SPACE="$RUNFILES_DIR"
@@ -124,6 +215,8 @@ function find_python_interpreter() {
   fi
 }
 
+profile_now
+venv_start_us=$profile_now_us
 python_exe=$(find_python_interpreter $RUNFILES_DIR $PYTHON_BINARY)
 
 # Zip files have to re-create the venv bin/python3 symlink because they
@@ -254,6 +347,9 @@ if [[ ! -x "$python_exe" ]]; then
   fi
 fi
 
+profile_now
+profile_event "stage1: venv" "$venv_start_us" "$profile_now_us"
+
 stage2_bootstrap="$RUNFILES_DIR/$STAGE2_BOOTSTRAP"
 
 declare -a interpreter_env
@@ -273,6 +369,10 @@ if [[ -z "${PYTHONSAFEPATH+x}" ]]; then
   interpreter_env+=("PYTHONSAFEPATH=${PYTHONSAFEPATH-1}")
 fi
 
+# Site init and stage2 use the runfiles root instead of finding it again.
+# Stage2 removes it from the environment.
+interpreter_env+=("RULES_PYTHON_BOOTSTRAP_RUNFILES_ROOT=$RUNFILES_DIR")
+
 if [[ "$IS_ZIPFILE" == "1" ]]; then
   interpreter_args+=("-XRULES_PYTHON_ZIP_DIR=$zip_dir")
 fi
@@ -283,6 +383,10 @@ if [[ -n "${RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS}" ]]; then
   unset RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS
 fi
 
+if [[ -n "${RULES_PYTHON_BOOTSTRAP_PROFILE:-}" ]]; then
+  interpreter_args+=("-X" "importtime")
+fi
+
 export RUNFILES_DIR
 
 command=(
@@ -305,7 +409,31 @@ command=(
 # However, we can't use exec when there is cleanup to do afterwards. Control
 # must return to this process so it can run the trap handlers. Such cases
 # occur when zip mode or recreate_venv_at_runtime creates temporary files.
-if [[ "$use_exec" == "0" ]]; then
+#
+# When profiling, the interpreter's stderr is copied to a file so that the
+# `-X importtime` output can be added to the profile afterwards, which also
+# requires a child process.
+if [[ -n "${RULES_PYTHON_BOOTSTRAP_PROFILE:-}" ]]; then
+  profile_now
+  profile_event "stage1" "$stage1_start_us" "$profile_now_us"
+  export RULES_PYTHON_BOOTSTRAP_PROFILE
+  # Tells the Python side of the bootstrap when the interpreter was launched
+  # and that it can write markers for the imports to stderr.
+  export RULES_PYTHON_BOOTSTRAP_PROFILE_STAGE1="$profile_now_us"
+  profile_stderr="$RULES_PYTHON_BOOTSTRAP_PROFILE.stderr"
+  profile_stderr_filter='^import time: ( *[0-9]+ \| +[0-9]+ \| |self \[us\] \| cumulative \| imported package$|@rules_python [0-9]+ [0-9]+$)'
+  exec 3>&1
+  # Only lines in the exact format of `-X importtime` and the markers are
+  # removed, so that the program's own lines that start with "import time: "
+  # are kept. Being a pipe, stderr isn't a tty for the program.
+  "${command[@]}" 2>&1 1>&3 3>&- | tee "$profile_stderr" | {
+    grep -Ev --line-buffered "$profile_stderr_filter" >&2 || true
+  }
+  exit_code=${PIPESTATUS[0]}
+  profile_add_imports "$profile_stderr" "$RULES_PYTHON_BOOTSTRAP_PROFILE_STAGE1"
+  rm -f "$profile_stderr"
+  exit $exit_code
+elif [[ "$use_exec" == "0" ]]; then
   "${command[@]}"
   exit $?
 else
@@ -17,10 +17,11 @@ if not getattr(sys.flags, "safe_path", False):
     del sys.path[0]
 
 import contextlib
+import io
 import os
-import re
-import runpy
-import uuid
+
+# NOTE: Modules that are only needed in some cases (e.g. re, runpy, uuid) are
+# imported where they are used to keep them out of the startup of every binary.
 
 # ===== Template substitutions start =====
 # We just put them in one place so its easy to tell which are used.
@@ -41,8 +42,28 @@ VENV_ROOT = "%venv_root%"
 # string otherwise.
 VENV_SITE_PACKAGES = "%venv_rel_site_packages%"
 
+# Runfiles-relative path to the forkserver implementation.
+FORKSERVER_PATH = "%forkserver%"
+
 # ===== Template substitutions end =====
 
+# Chrome trace file to write a profile of the startup to, if any. The
+# variables are removed so that the program's child processes don't also
+# write to it.
+_PROFILE_FILE = os.environ.pop("RULES_PYTHON_BOOTSTRAP_PROFILE", "")
+# If stage1 started the profile, when it launched the interpreter.
+_PROFILE_STAGE1 = os.environ.pop("RULES_PYTHON_BOOTSTRAP_PROFILE_STAGE1", "")
+if _PROFILE_FILE:
+    import time
+
+    _PROFILE_START_US = time.time_ns() // 1000
+    _PROFILE_FILE = os.path.abspath(_PROFILE_FILE)
+
+# The runfiles root, if the stage 1 bootstrap (or the zip's `__main__.py`)
+# already found it. It's removed so that programs started by this one, which
+# may be other binaries, search for their own.
+_BOOTSTRAP_RUNFILES_ROOT = os.environ.pop("RULES_PYTHON_BOOTSTRAP_RUNFILES_ROOT", "")
+
 
 # Return True if running on Windows
 def is_windows():
@@ -138,6 +159,10 @@ def is_verbose_coverage():
 
 def find_runfiles_root(main_rel_path):
     """Finds the runfiles tree."""
+    if _BOOTSTRAP_RUNFILES_ROOT:
+        # It was already checked to contain the stage 2 bootstrap.
+        return _BOOTSTRAP_RUNFILES_ROOT
+
     # When the calling process used the runfiles manifest to resolve the
     # location of this stub script, the path may be expanded. This means
     # argv[0] may no longer point to a location inside the runfiles
@@ -159,6 +184,8 @@ def find_runfiles_root(main_rel_path):
     if not os.path.isabs(stub_filename):
         stub_filename = os.path.join(os.getcwd(), stub_filename)
 
+    import re
+
     while True:
         module_space = stub_filename + (".exe" if is_windows() else "") + ".runfiles"
         if os.path.isdir(module_space):
@@ -219,18 +246,27 @@ def runfiles_envvar(module_space):
     return (None, None)
 
 
-def instrumented_file_paths():
-    """Yields tuples of realpath of each instrumented file with the relative path."""
+def instrumented_file_paths(fast=False):
+    """Yields tuples of realpath of each instrumented file with the relative path.
+
+    Args:
+        fast: bool, if True, files are resolved with `_resolve_runfile` instead
+            of `os.path.realpath`.
+    """
     manifest_filename = os.environ.get("COVERAGE_MANIFEST")
     if not manifest_filename:
         return
+    real_dirs = {}
     with open(manifest_filename, "r") as manifest:
         for line in manifest:
             filename = line.strip()
             if not filename:
                 continue
             try:
-                realpath = os.path.realpath(filename)
+                if fast:
+                    realpath = _resolve_runfile(filename, real_dirs)
+                else:
+                    realpath = os.path.realpath(filename)
             except OSError:
                 print(
                     "Could not find instrumented file {}".format(filename),
@@ -243,8 +279,31 @@ def instrumented_file_paths():
                 yield (realpath, filename)
 
 
-def unresolve_symlinks(output_filename):
-    # type: (str) -> None
+def _resolve_runfile(filename, real_dirs):
+    """Returns the same path as `os.path.realpath`, with less work.
+
+    Runfiles are symlinks directly to the real files, so the links are read
+    and only the directories that they point into are resolved, once each.
+
+    Args:
+        filename: str, the path to resolve.
+        real_dirs: dict[str, str], the directories resolved so far.
+    """
+    try:
+        target = os.path.join(os.path.dirname(filename), os.readlink(filename))
+    except OSError:
+        # Not a symlink.
+        target = filename
+    if os.path.islink(target):
+        return os.path.realpath(target)
+    dirname, basename = os.path.split(target)
+    if dirname not in real_dirs:
+        real_dirs[dirname] = os.path.realpath(dirname)
+    return os.path.join(real_dirs[dirname], basename)
+
+
+def unresolve_symlinks(output_filename, substitutions=None):
+    # type: (str, dict[str, str] | None) -> None
     """Replace realpath of instrumented files with the relative path in the lcov output.
 
     Though we are asking coveragepy to use relative file names, currently
@@ -255,21 +314,80 @@ def unresolve_symlinks(output_filename):
     upstream and the updated version is widely in use, this should be removed.
 
     See https://github.com/nedbat/coveragepy/issues/963.
+
+    Args:
+        output_filename: str, the lcov file to fix up.
+        substitutions: the relative paths of the instrumented files by their
+            realpath. If given, only source paths that are exactly a realpath
+            are replaced, instead of every realpath in every source path.
     """
-    substitutions = list(instrumented_file_paths())
-    if substitutions:
+    if substitutions is None:
+        realpaths = list(instrumented_file_paths())
+
+        def fix_source(source):
+            for realpath, filename in realpaths:
+                source = source.replace(realpath, filename)
+            return source
+
+    else:
+        realpaths = substitutions
+
+        def fix_source(source):
+            return substitutions.get(source, source)
+
+    if realpaths:
         unfixed_file = output_filename + ".tmp"
         os.rename(output_filename, unfixed_file)
         with open(unfixed_file, "r") as unfixed:
             with open(output_filename, "w") as output_file:
                 for line in unfixed:
                     if line.startswith("SF:"):
-                        for realpath, filename in substitutions:
-                            line = line.replace(realpath, filename)
+                        line = "SF:" + fix_source(line[3:].rstrip("\n")) + "\n"
                     output_file.write(line)
         os.unlink(unfixed_file)
 
 
+def _profile_now():
+    return time.time_ns() // 1000
+
+
+def _profile_write(text):
+    # A single append, so that writes from other processes aren't interleaved.
+    fd = os.open(_PROFILE_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, text.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def _profile_event(name, start_us, end_us):
+    _profile_write(
+        '{"name": "%s", "ph": "X", "ts": %d, "dur": %d, "pid": %d, "tid": 1},\n'
+        % (name, start_us, end_us - start_us, os.getpid())
+    )
+
+
+@contextlib.contextmanager
+def _profile_span(name):
+    """Adds an event for the duration of the block to the startup profile."""
+    if not _PROFILE_FILE:
+        yield
+        return
+    start_us = _profile_now()
+    try:
+        yield
+    finally:
+        _profile_event(name, start_us, _profile_now())
+
+
+def _profile_mark():
+    """Tells stage1 that the `-X importtime` output that follows is from now."""
+    if _PROFILE_STAGE1:
+        os.write(
+            2, b"import time: @rules_python %d %d\n" % (os.getpid(), _profile_now())
+        )
+
+
 def _run_py_path(main_filename, *, args, cwd=None):
     # type: (str, str, list[str], dict[str, str]) -> ...
     """Executes the given Python file using the various environment settings."""
@@ -284,13 +402,75 @@ def _run_py_path(main_filename, *, args, cwd=None):
         print_verbose("run_py: sys.argv: ", values=sys.argv)
         print_verbose("run_py: os.environ:", mapping=os.environ)
         print_verbose("run_py: sys.path:", values=sys.path)
-        runpy.run_path(main_filename, run_name="__main__")
+        _run_main_file(main_filename)
     finally:
         os.chdir(orig_cwd)
         sys.argv = orig_argv
 
 
+def _run_main_file(main_filename):
+    """Executes the main file as the `__main__` module.
+
+    For a Python source file, this is what `runpy.run_path` does, except that
+    the new module stays in `sys.modules` afterwards (as it does for a plain
+    `python main.py`), and runpy and its dependencies don't have to be
+    imported. Anything else, e.g. a pyc file, is left to runpy.
+    """
+    if not main_filename.endswith(".py"):
+        import runpy
+
+        runpy.run_path(main_filename, run_name="__main__")
+        return
+
+    with io.open_code(main_filename) as f:
+        code = compile(f.read(), main_filename, "exec")
+    main_module = type(sys)("__main__")
+    main_module.__file__ = main_filename
+    main_module.__cached__ = None
+    main_module.__loader__ = None
+    main_module.__package__ = ""
+    main_module.__spec__ = None
+    sys.modules["__main__"] = main_module
+    exec(code, main_module.__dict__)
+
+
+def _extract_main_from_lazy_zip():
+    """Extracts the main file if lazy zip extraction left it in the zip.
+
+    The main file is run as a file, not imported, so it has to be on disk.
+    """
+    runfiles_root, _, zip_path = os.environ["RULES_PYTHON_LAZY_ZIP"].partition(
+        os.pathsep
+    )
+    # The variable is inherited by programs the binary starts, which may be
+    # other binaries. It's only for us if it names our runfiles root, which
+    # the zip's `__main__.py` passes on when it extracts the zip.
+    if (
+        not zip_path
+        or not _BOOTSTRAP_RUNFILES_ROOT
+        or os.path.normpath(runfiles_root) != os.path.normpath(_BOOTSTRAP_RUNFILES_ROOT)
+    ):
+        return
+    dest = os.path.join(runfiles_root, MAIN_PATH)
+    if os.path.exists(dest):
+        return
+
+    import zipfile
+
+    print_verbose("extracting main file from lazy zip:", MAIN_PATH)
+    with zipfile.ZipFile(zip_path) as zf:
+        data = zf.read("runfiles/" + MAIN_PATH)
+    # The runfiles tree may be shared with other processes (see
+    # RULES_PYTHON_ZIP_CACHE), so don't let them see a partially written file.
+    tmp_dest = "{}.{}.tmp".format(dest, os.getpid())
+    with open(tmp_dest, "wb") as f:
+        f.write(data)
+    os.replace(tmp_dest, dest)
+
+
 def _run_py_module(module_name):
+    import runpy
+
     # Match `python -m` behavior, so modify sys.argv and the run name
     runpy.run_module(module_name, alter_sys=True, run_name="__main__")
 
@@ -302,7 +482,12 @@ def _maybe_collect_coverage(enable):
         yield
         return
 
-    instrumented_files = [abs_path for abs_path, _ in instrumented_file_paths()]
+    if _PROFILE_FILE:
+        setup_start_us = _profile_now()
+
+    fast = os.environ.get("RULES_PYTHON_FAST_COVERAGE") == "1"
+    substitutions = dict(instrumented_file_paths(fast=fast))
+    instrumented_files = list(substitutions)
     unique_dirs = {os.path.dirname(file) for file in instrumented_files}
     source = "\n\t".join(unique_dirs)
 
@@ -328,44 +513,68 @@ source =
 \t{source}
 """
         )
+    # The sys.monitoring based core (Python 3.12+) only calls back for code
+    # that hasn't run yet instead of tracing every line. Coverage can only
+    # use it for branch coverage from Python 3.14.
+    use_sysmon = (
+        fast
+        and "COVERAGE_CORE" not in os.environ
+        and _coverage_supports_sysmon_branches()
+    )
+    if use_sysmon:
+        os.environ["COVERAGE_CORE"] = "sysmon"
     try:
-        cov = coverage.Coverage(
-            config_file=rcfile_name,
-            branch=True,
-            # NOTE: The messages arg controls what coverage prints to stdout/stderr,
-            # which can interfere with the Bazel coverage command. Enabling message
-            # output is only useful for debugging coverage support.
-            messages=is_verbose_coverage(),
-            omit=[
-                # Pipes can't be read back later, which can cause coverage to
-                # throw an error when trying to get its source code.
-                "/dev/fd/*",
-                # The mechanism for finding third-party packages in coverage-py
-                # only works for installed packages, not for runfiles. e.g:
-                #'$HOME/.local/lib/python3.10/site-packages',
-                # '/usr/lib/python',
-                # '/usr/lib/python3.10/site-packages',
-                # '/usr/local/lib/python3.10/dist-packages'
-                # see https://github.com/nedbat/coveragepy/blob/bfb0c708fdd8182b2a9f0fc403596693ef65e475/coverage/inorout.py#L153-L164
-                "*/external/*",
-            ],
-        )
-        cov.start()
+        try:
+            cov = coverage.Coverage(
+                config_file=rcfile_name,
+                branch=True,
+                # NOTE: The messages arg controls what coverage prints to stdout/stderr,
+                # which can interfere with the Bazel coverage command. Enabling message
+                # output is only useful for debugging coverage support.
+                messages=is_verbose_coverage(),
+                omit=[
+                    # Pipes can't be read back later, which can cause coverage to
+                    # throw an error when trying to get its source code.
+                    "/dev/fd/*",
+                    # The mechanism for finding third-party packages in coverage-py
+                    # only works for installed packages, not for runfiles. e.g:
+                    #'$HOME/.local/lib/python3.10/site-packages',
+                    # '/usr/lib/python',
+                    # '/usr/lib/python3.10/site-packages',
+                    # '/usr/local/lib/python3.10/dist-packages'
+                    # see https://github.com/nedbat/coveragepy/blob/bfb0c708fdd8182b2a9f0fc403596693ef65e475/coverage/inorout.py#L153-L164
+                    "*/external/*",
+                ],
+            )
+            cov.start()
+        finally:
+            # Coverage reads it when it starts measuring. The program's child
+            # processes shouldn't inherit it, even if starting failed.
+            if use_sysmon:
+                del os.environ["COVERAGE_CORE"]
+        if _PROFILE_FILE:
+            _profile_event("coverage setup", setup_start_us, _profile_now())
         try:
             yield
         finally:
-            cov.stop()
-            lcov_path = os.path.join(coverage_dir, "pylcov.dat")
-            print_verbose_coverage("generating lcov from:", lcov_path)
-            cov.lcov_report(
-                outfile=lcov_path,
-                # Ignore errors because sometimes instrumented files aren't
-                # readable afterwards. e.g. if they come from /dev/fd or if
-                # they were transient code-under-test in /tmp
-                ignore_errors=True,
-            )
-            if os.path.isfile(lcov_path):
-                unresolve_symlinks(lcov_path)
+            with _profile_span("coverage report"):
+                cov.stop()
+                if os.environ.get("RULES_PYTHON_COVERAGE_RAW_DATA") == "1":
+                    _save_raw_coverage_data(cov, substitutions, unique_id)
+                else:
+                    lcov_path = os.path.join(coverage_dir, "pylcov.dat")
+                    print_verbose_coverage("generating lcov from:", lcov_path)
+                    cov.lcov_report(
+                        outfile=lcov_path,
+                        # Ignore errors because sometimes instrumented files aren't
+                        # readable afterwards. e.g. if they come from /dev/fd or if
+                        # they were transient code-under-test in /tmp
+                        ignore_errors=True,
+                    )
+                    if os.path.isfile(lcov_path):
+                        unresolve_symlinks(
+                            lcov_path, substitutions=substitutions if fast else None
+                        )
     finally:
         try:
             os.unlink(rcfile_name)
@@ -376,6 +585,46 @@ source =
             print_verbose_coverage("Error removing temporary coverage rc file:", err)
 
 
+def _save_raw_coverage_data(cov, substitutions, unique_id):
+    """Saves the measured coverage data instead of an lcov report.
+
+    The data is converted to lcov later by `//tools/coverage_merger`. The
+    files are saved with the same paths that the lcov report would have.
+    """
+    import coverage
+
+    output_dir = (
+        os.environ.get("TEST_UNDECLARED_OUTPUTS_DIR") or os.environ["COVERAGE_DIR"]
+    )
+    data_path = os.path.join(output_dir, "pycoverage-{}.db".format(unique_id))
+    print_verbose_coverage("saving raw coverage data to:", data_path)
+    data = cov.get_data()
+    filenames = {
+        filename: substitutions.get(filename, filename)
+        for filename in data.measured_files()
+    }
+    raw_data = coverage.CoverageData(basename=data_path)
+    if data.has_arcs():
+        raw_data.add_arcs(
+            {saved: data.arcs(filename) for filename, saved in filenames.items()}
+        )
+    else:
+        raw_data.add_lines(
+            {saved: data.lines(filename) for filename, saved in filenames.items()}
+        )
+    raw_data.write()
+
+
+def _coverage_supports_sysmon_branches():
+    from coverage import env as coverage_env
+
+    # These were added along with sys.monitoring support, and with support
+    # for measuring branches with it, respectively.
+    return getattr(coverage_env.PYBEHAVIOR, "pep669", False) and getattr(
+        coverage_env.PYBEHAVIOR, "branch_right_left", False
+    )
+
+
 def _add_site_packages(site_packages):
     first_global_offset = len(sys.path)
     for i, p in enumerate(sys.path):
@@ -397,7 +646,47 @@ def _add_site_packages(site_packages):
     sys.path[first_global_offset:0] = added_dirs
 
 
+def _is_forkserver_enabled():
+    if os.environ.get("RULES_PYTHON_FORKSERVER") != "1" or not FORKSERVER_PATH:
+        return False
+    if is_windows() or sys.version_info < (3, 9):
+        print_verbose("forkserver: not supported on this platform")
+        return False
+    # Coverage and profiling need to see the whole process. Stage 1 extracts
+    # zip files to a new directory every run, so a server wouldn't be reused.
+    if (
+        os.environ.get("COVERAGE_DIR")
+        or _PROFILE_FILE
+        or "RULES_PYTHON_ZIP_DIR" in sys._xoptions
+    ):
+        print_verbose("forkserver: disabled for this run")
+        return False
+    return True
+
+
+def _load_forkserver():
+    # The forkserver is a separate file so that it's only compiled when used.
+    import importlib.util
+
+    path = os.path.join(find_runfiles_root(FORKSERVER_PATH), FORKSERVER_PATH)
+    spec = importlib.util.spec_from_file_location("_bazel_forkserver", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
 def main():
+    forkserver_key = os.environ.pop("RULES_PYTHON_FORKSERVER_SERVE", None)
+    if forkserver_key:
+        _load_forkserver().serve(forkserver_key)
+    elif _is_forkserver_enabled():
+        _load_forkserver().run_in_server(os.path.abspath(__file__))
+
+    if _PROFILE_FILE and not _PROFILE_STAGE1 and "_bazel_site_init" not in sys.modules:
+        # Neither stage1 nor site init started the profile, so start it.
+        with open(_PROFILE_FILE, "w") as f:
+            f.write("[\n")
+
     print_verbose("initial argv:", values=sys.argv)
     print_verbose("initial cwd:", os.getcwd())
     print_verbose("initial environ:", mapping=os.environ)
@@ -412,6 +701,9 @@ def main():
         if is_windows():
             main_rel_path = main_rel_path.replace("/", os.sep)
 
+        if os.environ.get("RULES_PYTHON_LAZY_ZIP"):
+            _extract_main_from_lazy_zip()
+
         runfiles_root = find_runfiles_root(main_rel_path)
     else:
         runfiles_root = find_runfiles_root("")
@@ -467,12 +759,13 @@ def main():
 
         main_filename = os.path.join(runfiles_root, main_rel_path)
         main_filename = get_windows_path_with_unc_prefix(main_filename)
-        assert os.path.exists(main_filename), (
-            "Cannot exec() %r: file not found." % main_filename
-        )
-        assert os.access(main_filename, os.R_OK), (
-            "Cannot exec() %r: file not readable." % main_filename
-        )
+        # A single access() check covers the common case; the existence check
+        # is only needed to give a better error message.
+        if not os.access(main_filename, os.R_OK):
+            assert os.path.exists(main_filename), (
+                "Cannot exec() %r: file not found." % main_filename
+            )
+            raise AssertionError("Cannot exec() %r: file not readable." % main_filename)
 
         sys.stdout.flush()
 
@@ -487,13 +780,19 @@ def main():
     else:
         coverage_enabled = False
 
+    if _PROFILE_FILE:
+        _profile_event("stage2", _PROFILE_START_US, _profile_now())
+
     with _maybe_collect_coverage(enable=coverage_enabled):
-        if MAIN_PATH:
-            # The first arg is this bootstrap, so drop that for the re-invocation.
-            _run_py_path(main_filename, args=sys.argv[1:])
-        else:
-            _run_py_module(MAIN_MODULE)
+        with _profile_span("main"):
+            _profile_mark()
+            if MAIN_PATH:
+                # The first arg is this bootstrap, so drop that for the re-invocation.
+                _run_py_path(main_filename, args=sys.argv[1:])
+            else:
+                _run_py_module(MAIN_MODULE)
         sys.exit(0)
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,16 @@ import os
 import shutil
 import subprocess
 import tempfile
+import threading
 import zipfile
 
+try:
+    import fcntl
+except ImportError:
+    # e.g. Windows. The extraction cache still works, but without locking
+    # and eviction.
+    fcntl = None
+
 # runfiles-relative path
 _STAGE2_BOOTSTRAP = "%stage2_bootstrap%"
 # runfiles-relative path to venv's bin/python3. Empty if venv not being used.
@@ -149,7 +157,7 @@ def find_binary(module_space, bin_name):
         return search_path(bin_name)
 
 
-def extract_zip(zip_path, dest_dir):
+def extract_zip(zip_path, dest_dir, skip=None):
     """Extracts the contents of a zip file, preserving the unix file mode bits.
 
     These include the permission bits, and in particular, the executable bit.
@@ -157,35 +165,349 @@ def extract_zip(zip_path, dest_dir):
     Ideally the zipfile module should set these bits, but it doesn't. See:
     https://bugs.python.org/issue15795.
 
+    Directories are created upfront, then files are written by a pool of
+    threads: for zips with many members, the time goes to syscalls and
+    decompression, which both release the GIL.
+
     Args:
         zip_path: The path to the zip file to extract
         dest_dir: The path to the destination directory
+        skip: Optional callable that is passed each member's name. Members
+            for which it returns True aren't extracted, but their parent
+            directory is still created.
     """
     zip_path = get_windows_path_with_unc_prefix(zip_path)
     dest_dir = get_windows_path_with_unc_prefix(dest_dir)
     with zipfile.ZipFile(zip_path) as zf:
+        files = []
+        dir_infos = []
+        dirs = set()
         for info in zf.infolist():
-            zf.extract(info, dest_dir)
-            # UNC-prefixed paths must be absolute/normalized. See
-            # https://docs.microsoft.com/en-us/windows/desktop/fileio/naming-a-file#maximum-path-length-limitation
-            file_path = os.path.abspath(os.path.join(dest_dir, info.filename))
-            # The Unix st_mode bits (see "man 7 inode") are stored in the upper 16
-            # bits of external_attr. Of those, we set the lower 12 bits, which are the
-            # file mode bits (since the file type bits can't be set by chmod anyway).
-            attrs = info.external_attr >> 16
-            if attrs != 0:  # Rumor has it these can be 0 for zips created on Windows.
-                os.chmod(file_path, attrs & 0o7777)
+            name = info.filename
+            if skip is not None and skip(name):
+                dirs.add(os.path.dirname(name))
+            elif is_windows() or os.path.isabs(name) or ".." in name.split("/"):
+                # Leave names that need sanitizing to zipfile.
+                zf.extract(info, dest_dir)
+                set_mode(info, os.path.abspath(os.path.join(dest_dir, name)))
+            elif info.is_dir():
+                dir_infos.append(info)
+                dirs.add(name.rstrip("/"))
+            else:
+                files.append(info)
+                dirs.add(os.path.dirname(name))
+
+        # Sorting creates parents before their children, so each directory
+        # takes a single mkdir.
+        for name in sorted(dirs):
+            os.makedirs(os.path.join(dest_dir, name), exist_ok=True)
+
+        # Opening and closing members of a shared ZipFile isn't thread-safe,
+        # but reading them is.
+        open_lock = threading.Lock()
+
+        def extract_files(infos):
+            for info in infos:
+                path = os.path.join(dest_dir, info.filename)
+                with open_lock:
+                    src = zf.open(info)
+                try:
+                    with open(path, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+                        set_mode(info, path, dst.fileno())
+                finally:
+                    with open_lock:
+                        src.close()
+
+        num_threads = min(32, (os.cpu_count() or 1) + 4, len(files) // 64 + 1)
+        if num_threads > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            # Striding spreads big files, which tend to be next to each other,
+            # across the threads.
+            chunks = [files[i::num_threads] for i in range(num_threads)]
+            with ThreadPoolExecutor(num_threads) as executor:
+                for _ in executor.map(extract_files, chunks):
+                    pass
+        else:
+            extract_files(files)
+
+        # Done last in case a directory's mode doesn't allow writing to it.
+        for info in dir_infos:
+            set_mode(info, os.path.join(dest_dir, info.filename))
+
+
+def set_mode(info, path, fd=None):
+    """Sets the file mode bits of an extracted zip member.
+
+    The Unix st_mode bits (see "man 7 inode") are stored in the upper 16 bits
+    of external_attr. Of those, we set the lower 12 bits, which are the file
+    mode bits (since the file type bits can't be set by chmod anyway).
+    """
+    attrs = info.external_attr >> 16
+    if attrs == 0:  # Rumor has it these can be 0 for zips created on Windows.
+        return
+    if fd is not None and hasattr(os, "fchmod"):
+        os.fchmod(fd, attrs & 0o7777)
+    else:
+        os.chmod(path, attrs & 0o7777)
+
+
+def is_lazy_extract_enabled():
+    """Returns True if Python source files should be imported from the zip.
+
+    Coverage needs the source files on disk, so it disables lazy extraction.
+    """
+    if os.environ.get("COVERAGE_DIR"):
+        return False
+    return os.environ.get("RULES_PYTHON_ZIP_LAZY_EXTRACT") == "1"
+
+
+def skip_lazily_extracted(name):
+    """Tells if a zip member can be left in the zip in lazy extraction mode.
+
+    Only Python source files can be, because they are loaded through the
+    import system, which `_bazel_site_init` teaches to read them from the zip.
+    Files that are opened or loaded by path (data files, shared libraries,
+    extension modules), files that are run directly, and the interpreter's own
+    files have to be extracted.
+    """
+    if not name.endswith(".py") or not name.startswith("runfiles/"):
+        return False
+    rel_path = name[len("runfiles/") :]
+    if rel_path == _STAGE2_BOOTSTRAP or rel_path.endswith("/_bazel_site_init.py"):
+        return False
+    if "/" in _PYTHON_BINARY_ACTUAL and not os.path.isabs(_PYTHON_BINARY_ACTUAL):
+        runtime_repo = _PYTHON_BINARY_ACTUAL.split("/", 1)[0]
+        if rel_path.startswith(runtime_repo + "/"):
+            return False
+    return True
 
 
 # Create the runfiles tree by extracting the zip file
-def create_module_space():
+def create_module_space(lazy=False):
     temp_dir = tempfile.mkdtemp("", "Bazel.runfiles_")
-    extract_zip(os.path.dirname(__file__), temp_dir)
+    extract_zip(
+        os.path.dirname(__file__),
+        temp_dir,
+        skip=skip_lazily_extracted if lazy else None,
+    )
     # IMPORTANT: Later code does `rm -fr` on dirname(module_space) -- it's
     # important that deletion code be in sync with this directory structure
     return os.path.join(temp_dir, "runfiles")
 
 
+def is_exec_enabled(cache_dir):
+    """Tells if the program can replace this process instead of being a child.
+
+    That's the case when nothing has to be cleaned up after the program exits:
+    the extraction cache is used, or RULES_PYTHON_ZIP_EXEC=1 leaves deleting
+    the temporary runfiles to a later launch (see reap_module_spaces()).
+    """
+    # On Windows, os.execv doesn't handle arguments with spaces correctly, and
+    # it starts a subprocess anyway. Without fcntl, runfiles that are in use
+    # can't be told apart from stale ones.
+    if is_windows() or fcntl is None:
+        return False
+    return bool(cache_dir) or os.environ.get("RULES_PYTHON_ZIP_EXEC") == "1"
+
+
+def lock_module_space(module_space):
+    """Marks a temporary runfiles tree as in use until the program exits.
+
+    Returns:
+        The open lock file, which has to stay open, and be inherited by the
+        program, for as long as the runfiles tree is used.
+    """
+    lock_path = os.path.join(os.path.dirname(module_space), "lock")
+    # Lock the file before it gets its final name, so that a concurrent
+    # reap_module_spaces() can't mistake it for a stale one.
+    lock = open(lock_path + ".tmp", "w")
+    lock_file(lock, exclusive=False)
+    os.rename(lock_path + ".tmp", lock_path)
+    return lock
+
+
+def reap_module_spaces():
+    """Deletes the temporary runfiles of exec'ed programs that have exited.
+
+    Such programs hold a shared lock on the `lock` file next to their runfiles
+    for as long as they run (see lock_module_space()), so runfiles whose lock
+    can be taken exclusively are no longer used. Runfiles without a lock file
+    belong to launches that delete them themselves.
+    """
+    temp_root = tempfile.gettempdir()
+    try:
+        names = os.listdir(temp_root)
+    except OSError:
+        return
+    for name in names:
+        if not name.startswith("Bazel.runfiles_"):
+            continue
+        try:
+            lock = open(os.path.join(temp_root, name, "lock"))
+        except OSError:
+            continue
+        with lock:
+            if lock_file(lock, exclusive=True, blocking=False):
+                print_verbose("deleting stale runfiles:", name)
+                shutil.rmtree(os.path.join(temp_root, name), True)
+
+
+def get_zip_cache_dir():
+    """Returns the directory to cache extracted zips in, or None if disabled."""
+    if os.environ.get("RULES_PYTHON_ZIP_CACHE") != "1":
+        return None
+    cache_dir = os.environ.get("RULES_PYTHON_ZIP_CACHE_DIR")
+    if not cache_dir:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cache_dir = os.path.join(cache_home, "rules_python", "zips")
+    return os.path.abspath(cache_dir)
+
+
+def compute_zip_key(zip_path, lazy):
+    """Computes a key that identifies the contents of a zip file.
+
+    Hashing the whole file would cost about as much as extracting it, so the
+    central directory is hashed instead: it has the name, size, CRC-32 and
+    mode bits of every member.
+    """
+    import hashlib
+
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            digest.update(
+                "{}\0{}\0{}\0{}\n".format(
+                    info.filename, info.file_size, info.CRC, info.external_attr
+                ).encode("utf-8", "surrogateescape")
+            )
+    if lazy:
+        digest.update(b"lazy")
+    return digest.hexdigest()
+
+
+def lock_file(f, exclusive, blocking=True):
+    """Locks an open file. Returns False if a non-blocking lock is held elsewhere."""
+    if fcntl is None:
+        return True
+    flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(f.fileno(), flags)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def create_cached_module_space(cache_dir, lazy=False):
+    """Returns the runfiles tree for the zip from the cache, extracting it if needed.
+
+    The tree is extracted to a temporary directory and renamed into place, so
+    a cache entry that exists is always complete. Two lock files are used:
+
+    * `<entry>.lock`: a shared lock on it is held for as long as the runfiles
+      tree is in use, which keeps other processes from evicting the entry.
+      It's never upgraded, since an upgrade would have to wait for every
+      other program using the entry to exit.
+    * `<entry>.extract`: an exclusive lock on it is held only while
+      extracting, so concurrent launches of the same zip wait for one
+      extraction instead of each doing their own.
+
+    Args:
+        cache_dir: (str) Directory holding the cache entries.
+        lazy: (bool) Whether to skip lazily extracted files.
+
+    Returns:
+        A tuple of the runfiles tree path and the open `<entry>.lock` file,
+        which must be kept open while the runfiles tree is used.
+    """
+    zip_path = os.path.dirname(__file__)
+    key = compute_zip_key(zip_path, lazy)
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, key)
+    lock = open(entry + ".lock", "a")
+    lock_file(lock, exclusive=False)
+    if os.path.isdir(entry):
+        print_verbose("using cached runfiles:", entry)
+        # The mtime is what eviction uses to find the least recently used entry.
+        os.utime(entry)
+        return os.path.join(entry, "runfiles"), lock
+
+    with open(entry + ".extract", "a") as extract_lock:
+        lock_file(extract_lock, exclusive=True)
+        if os.path.isdir(entry):
+            print_verbose("using runfiles extracted concurrently:", entry)
+            return os.path.join(entry, "runfiles"), lock
+        print_verbose("extracting runfiles to cache:", entry)
+        skip = skip_lazily_extracted if lazy else None
+        temp_dir = tempfile.mkdtemp(".tmp", key + ".", dir=cache_dir)
+        try:
+            extract_zip(zip_path, temp_dir, skip=skip)
+            with zipfile.ZipFile(zip_path) as zf:
+                size = sum(
+                    info.file_size
+                    for info in zf.infolist()
+                    if skip is None or not skip(info.filename)
+                )
+            with open(os.path.join(temp_dir, "size"), "w") as f:
+                f.write(str(size))
+            try:
+                os.rename(temp_dir, entry)
+            except OSError:
+                # Without locking, another process may have won the race.
+                if not os.path.isdir(entry):
+                    raise
+        finally:
+            shutil.rmtree(temp_dir, True)
+    evict_zip_cache(cache_dir, keep=key)
+    return os.path.join(entry, "runfiles"), lock
+
+
+def evict_zip_cache(cache_dir, keep):
+    """Deletes least recently used entries until the cache is small enough.
+
+    The limit is RULES_PYTHON_ZIP_CACHE_MAX_MB, default 4096. Entries in use
+    by a running binary are skipped.
+    """
+    if fcntl is None:
+        # Without locks, entries in use can't be told apart.
+        return
+    max_size = int(os.environ.get("RULES_PYTHON_ZIP_CACHE_MAX_MB") or 4096) << 20
+    entries = []
+    total_size = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith((".lock", ".extract", ".tmp")):
+            continue
+        try:
+            with open(os.path.join(path, "size")) as f:
+                size = int(f.read())
+            mtime = os.stat(path).st_mtime
+        except (OSError, ValueError):
+            continue
+        total_size += size
+        entries.append((mtime, name, size))
+
+    for _, name, size in sorted(entries):
+        if total_size <= max_size:
+            break
+        if name == keep:
+            continue
+        with open(os.path.join(cache_dir, name + ".lock"), "a") as lock:
+            if not lock_file(lock, exclusive=True, blocking=False):
+                continue
+            print_verbose("evicting cached runfiles:", name)
+            # Rename first, so nobody starts using a partially deleted entry.
+            doomed = tempfile.mkdtemp(".tmp", name + ".", dir=cache_dir)
+            os.rename(os.path.join(cache_dir, name), os.path.join(doomed, "entry"))
+        shutil.rmtree(doomed, True)
+        total_size -= size
+
+
 def execute_file(
     python_program,
     main_filename,
@@ -193,8 +515,10 @@ def execute_file(
     env,
     module_space,
     workspace,
+    delete_module_space=True,
+    use_exec=False,
 ):
-    # type: (str, str, list[str], dict[str, str], str, str|None, str|None) -> ...
+    # type: (str, str, list[str], dict[str, str], str, str|None, bool, bool) -> ...
     """Executes the given Python file using the various environment settings.
 
     This will not return, and acts much like os.execv, except is much
@@ -208,6 +532,9 @@ def execute_file(
       module_space: (str) Path to the module space/runfiles tree directory
       workspace: (str|None) Name of the workspace to execute in. This is expected to be a
           directory under the runfiles tree.
+      delete_module_space: (bool) Whether to delete the module space afterwards.
+      use_exec: (bool) Whether to replace this process with the program. If
+          so, delete_module_space is ignored.
     """
     # We want to use os.execv instead of subprocess.call, which causes
     # problems with signal passing (making it difficult to kill
@@ -218,7 +545,17 @@ def execute_file(
     #   correctly, and it actually starts a subprocess just like
     #   subprocess.call.
     # - When running in a workspace or zip file, we need to clean up the
-    #   workspace after the process finishes so control must return here.
+    #   workspace after the process finishes so control must return here,
+    #   unless the cleanup is deferred (see is_exec_enabled()).
+    if use_exec:
+        exec_argv = [python_program, main_filename] + args
+        print_verbose("exec argv:", values=exec_argv)
+        print_verbose("exec env:", mapping=env)
+        print_verbose("exec cwd:", workspace)
+        if workspace:
+            os.chdir(workspace)
+        os.execve(python_program, exec_argv, env)
+
     try:
         subprocess_argv = [python_program, main_filename] + args
         print_verbose("subprocess argv:", values=subprocess_argv)
@@ -230,7 +567,8 @@ def execute_file(
         # NOTE: dirname() is called because create_module_space() creates a
         # sub-directory within a temporary directory, and we want to remove the
         # whole temporary directory.
-        shutil.rmtree(os.path.dirname(module_space), True)
+        if delete_module_space:
+            shutil.rmtree(os.path.dirname(module_space), True)
 
 
 def main():
@@ -251,10 +589,39 @@ def main():
     if is_windows():
         main_rel_path = main_rel_path.replace("/", os.sep)
 
-    module_space = create_module_space()
+    lazy = is_lazy_extract_enabled()
+    cache_dir = get_zip_cache_dir()
+    use_exec = is_exec_enabled(cache_dir)
+    module_space_lock = None
+    if cache_dir:
+        module_space, module_space_lock = create_cached_module_space(
+            cache_dir, lazy=lazy
+        )
+    else:
+        if use_exec:
+            reap_module_spaces()
+        module_space = create_module_space(lazy=lazy)
+        if use_exec:
+            module_space_lock = lock_module_space(module_space)
     print_verbose("extracted runfiles to:", module_space)
+    if use_exec and module_space_lock:
+        # The lock is released when the last process holding it exits, so pass
+        # it on to the program. It's only ever held shared, so it doesn't keep
+        # other launches from extracting or using the runfiles.
+        os.set_inheritable(module_space_lock.fileno(), True)
+
+    if lazy:
+        # Tells `_bazel_site_init` where to import the unextracted files from.
+        # It's an environment variable so that child processes of the binary
+        # (e.g. multiprocessing workers) get it too. Since it includes the
+        # runfiles root, other binaries ignore it.
+        new_env["RULES_PYTHON_LAZY_ZIP"] = (
+            module_space + os.pathsep + os.path.abspath(os.path.dirname(__file__))
+        )
 
     new_env["RUNFILES_DIR"] = module_space
+    # Site init and stage2 use it instead of finding the runfiles root again.
+    new_env["RULES_PYTHON_BOOTSTRAP_RUNFILES_ROOT"] = module_space
 
     # Don't prepend a potentially unsafe path to sys.path
     # See: https://docs.python.org/3.11/using/cmdline.html#envvar-PYTHONSAFEPATH
@@ -295,12 +662,19 @@ def main():
 
         # The bin/ directory may not exist if it is empty.
         os.makedirs(os.path.dirname(python_program), exist_ok=True)
-        try:
-            os.symlink(symlink_to, python_program)
-        except OSError as e:
-            raise Exception(
-                f"Unable to create venv python interpreter symlink: {python_program} -> {symlink_to}"
-            ) from e
+        # A cached runfiles tree already has the symlink, but it may point
+        # elsewhere, e.g. if PATH changed, so it's replaced atomically then.
+        if not (
+            os.path.islink(python_program) and os.readlink(python_program) == symlink_to
+        ):
+            tmp_link = "{}.{}.tmp".format(python_program, os.getpid())
+            try:
+                os.symlink(symlink_to, tmp_link)
+                os.replace(tmp_link, python_program)
+            except OSError as e:
+                raise Exception(
+                    f"Unable to create venv python interpreter symlink: {python_program} -> {symlink_to}"
+                ) from e
 
     # Some older Python versions on macOS (namely Python 3.7) may unintentionally
     # leave this environment variable set after starting the interpreter, which
@@ -326,6 +700,8 @@ def main():
         new_env,
         module_space,
         workspace,
+        delete_module_space=not cache_dir,
+        use_exec=use_exec,
     )
 
 
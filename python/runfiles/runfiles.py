@@ -22,13 +22,77 @@ This enables prefix-based repository mappings to reduce memory usage for large
 dependency graphs under bzlmod.
 :::
 """
+import array
+import atexit
+import bisect
 import collections.abc
-import inspect
+import hashlib
+import mmap
 import os
 import posixpath
+import struct
 import sys
-from collections import defaultdict
-from typing import Dict, Optional, Tuple, Union
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+
+class _PrefixTable:
+    """Prefixed repository mappings for a single target_apparent.
+
+    Prefixes are sorted so that the ones matching a source repository can be
+    found with a binary search, while preserving the rule that the matching
+    mapping that comes first in the mapping file wins.
+    """
+
+    def __init__(self, entries: List[Tuple[str, int, str]]) -> None:
+        """Initialize the table.
+
+        Args:
+            entries: List of (source_prefix, order, target_canonical), where
+                order is the position of the mapping in the mapping file.
+        """
+        entries = sorted(entries)
+        self._prefixes = [prefix for prefix, _, _ in entries]
+        self._targets = [target for _, _, target in entries]
+        # For each prefix, the index of the longest other prefix that is a
+        # prefix of it, or -1. All prefixes of a string are therefore on the
+        # parent chain of the greatest prefix not greater than that string.
+        self._parents = array.array("l")
+        # For each prefix, the index of the mapping that comes first in the
+        # mapping file among the prefix and all its parents.
+        self._winners = array.array("l")
+        ancestors: List[int] = []
+        for index, (prefix, order, _) in enumerate(entries):
+            while ancestors and not prefix.startswith(self._prefixes[ancestors[-1]]):
+                ancestors.pop()
+            parent = ancestors[-1] if ancestors else -1
+            winner = index
+            if parent != -1 and entries[self._winners[parent]][1] < order:
+                winner = self._winners[parent]
+            self._parents.append(parent)
+            self._winners.append(winner)
+            ancestors.append(index)
+
+    def lookup(self, source_repo: str) -> Optional[str]:
+        """Returns the target of the first mapping whose prefix matches, if any."""
+        index = bisect.bisect_right(self._prefixes, source_repo) - 1
+        while index != -1:
+            if source_repo.startswith(self._prefixes[index]):
+                return self._targets[self._winners[index]]
+            index = self._parents[index]
+        return None
 
 
 class _RepositoryMapping:
@@ -49,17 +113,31 @@ class _RepositoryMapping:
             exact_mappings: Dict mapping (source_canonical, target_apparent) -> target_canonical
             prefixed_mappings: Dict mapping (source_prefix, target_apparent) -> target_canonical
         """
-        self._exact_mappings = exact_mappings
-
-        # Group prefixed mappings by target_apparent for faster lookups
-        self._grouped_prefixed_mappings = defaultdict(list)
-        for (
-            prefix_source,
-            target_app,
-        ), target_canonical in prefixed_mappings.items():
-            self._grouped_prefixed_mappings[target_app].append(
-                (prefix_source, target_canonical)
+        # Exact mappings are nested by source repository instead of being keyed
+        # by tuples, which saves a tuple per entry. All names are interned
+        # since the same repositories appear in many entries.
+        self._exact_mappings: Dict[str, Dict[str, str]] = {}
+        for (source, target_app), target_canonical in exact_mappings.items():
+            self._exact_mappings.setdefault(sys.intern(source), {})[
+                sys.intern(target_app)
+            ] = sys.intern(target_canonical)
+
+        # Prefixed mappings are grouped by target_apparent for faster lookups.
+        # Each group is a table sorted by prefix, so that the prefixes matching
+        # a source repository are found with a binary search instead of a
+        # linear scan. The original order of the mappings is recorded because
+        # the first matching prefix in the mapping file wins.
+        grouped: Dict[str, List[Tuple[str, int, str]]] = {}
+        for order, ((prefix_source, target_app), target_canonical) in enumerate(
+            prefixed_mappings.items()
+        ):
+            grouped.setdefault(target_app, []).append(
+                (prefix_source, order, sys.intern(target_canonical))
             )
+        self._prefixed_mappings: Dict[str, _PrefixTable] = {
+            sys.intern(target_app): _PrefixTable(entries)
+            for target_app, entries in grouped.items()
+        }
 
     @staticmethod
     def create_from_file(repo_mapping_path: Optional[str]) -> "_RepositoryMapping":
@@ -114,19 +192,17 @@ class _RepositoryMapping:
         if source_repo is None:
             return None
 
-        key = (source_repo, target_apparent)
-
         # Try exact mapping first
-        if key in self._exact_mappings:
-            return self._exact_mappings[key]
+        exact_mappings = self._exact_mappings.get(source_repo)
+        if exact_mappings is not None:
+            target_canonical = exact_mappings.get(target_apparent)
+            if target_canonical is not None:
+                return target_canonical
 
         # Try prefixed mapping if no exact match found
-        if target_apparent in self._grouped_prefixed_mappings:
-            for prefix_source, target_canonical in self._grouped_prefixed_mappings[
-                target_apparent
-            ]:
-                if source_repo.startswith(prefix_source):
-                    return target_canonical
+        prefix_table = self._prefixed_mappings.get(target_apparent)
+        if prefix_table is not None:
+            return prefix_table.lookup(source_repo)
 
         # No mapping found
         return None
@@ -137,19 +213,249 @@ class _RepositoryMapping:
         Returns:
             True if there are no mappings, False otherwise
         """
-        return len(self._exact_mappings) == 0 and len(self._grouped_prefixed_mappings) == 0
+        return len(self._exact_mappings) == 0 and len(self._prefixed_mappings) == 0
+
+
+class _MmapManifest:
+    """Lazy, read-only view of a sorted runfiles manifest.
+
+    Instead of decoding every line into a dict up front, the manifest is
+    mmap-ed and each lookup binary searches its lines. This relies on the
+    manifest being sorted by (unescaped) link path, which is how Bazel writes
+    it. Lookups return the same values as the dict built by
+    `_ManifestBased._LoadRunfiles`, including the last-entry-wins behavior for
+    duplicate links.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap can't map an empty file; an empty manifest has no entries.
+            self._mm = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            )
+        self._size = size
+
+    def get(self, path: str) -> Optional[str]:
+        """Returns the target of `path`, or None if it's not in the manifest."""
+        mm = self._mm
+        if mm is None:
+            return None
+        key = path.encode("utf-8")
+        size = self._size
+
+        # Find the start of the first line whose link sorts after `key`. `lo`
+        # and `hi` always point at line starts (or the end of the mapping).
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = max(mm.rfind(b"\n", lo, mid) + 1, lo)
+            end = mm.find(b"\n", start, hi)
+            if end == -1:
+                end = hi
+            if _MmapManifest._ParseLink(mm[start:end]) <= key:
+                lo = min(end + 1, hi)
+            else:
+                hi = start
+
+        # The entry, if any, is the line right before `lo`.
+        if lo == 0:
+            return None
+        end = lo - 1 if mm[lo - 1 : lo] == b"\n" else lo
+        start = mm.rfind(b"\n", 0, end) + 1
+        line = mm[start:end]
+        if _MmapManifest._ParseLink(line) != key:
+            return None
+        return _MmapManifest._ParseTarget(line, path)
+
+    @staticmethod
+    def _ParseLink(line: bytes) -> bytes:
+        if line.startswith(b" "):
+            escaped_link = line[1:].split(b" ", 1)[0]
+            return (
+                escaped_link.replace(rb"\s", b" ")
+                .replace(rb"\n", b"\n")
+                .replace(rb"\b", b"\\")
+            )
+        return line.split(b" ", 1)[0]
+
+    @staticmethod
+    def _ParseTarget(line: bytes, link: str) -> str:
+        if line.startswith(b" "):
+            _, _, escaped_target = line[1:].partition(b" ")
+            target = (
+                escaped_target.replace(rb"\n", b"\n")
+                .replace(rb"\b", b"\\")
+                .decode("utf-8")
+            )
+        else:
+            target = line.partition(b" ")[2].decode("utf-8")
+        return target or link
+
+
+# Header of a manifest index file: magic, the manifest's size, mtime and inode,
+# and the number of entries. Native byte order is used; an index written on a
+# machine with a different byte order fails the magic check and is rebuilt.
+_INDEX_HEADER = struct.Struct("=5Q")
+_INDEX_MAGIC = 0x3130305844494652  # b"RFIDX001" in little-endian
+
+
+class _IndexedManifest:
+    """Read-only view of a compiled, mmap-ed runfiles manifest index.
+
+    The index stores the manifest's entries sorted by link and already
+    unescaped, so opening it is a single mmap and each lookup is a binary
+    search. Index files live in a cache directory keyed by the manifest's
+    path, which lets many processes that use the same manifest share one
+    index. The header records the manifest's size, mtime and inode, so an
+    index for an older version of the manifest is rebuilt in place.
+    """
+
+    def __init__(self, mm: mmap.mmap, count: int) -> None:
+        self._mm = mm
+        self._count = count
+        offsets_end = _INDEX_HEADER.size + (count + 1) * 8
+        self._offsets = memoryview(mm)[_INDEX_HEADER.size : offsets_end].cast("Q")
+        self._data_start = offsets_end
+
+    def get(self, path: str) -> Optional[str]:
+        """Returns the target of `path`, or None if it's not in the index."""
+        key = path.encode("utf-8")
+        mm = self._mm
+        offsets = self._offsets
+        base = self._data_start
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + offsets[mid]
+            if mm[start : mm.find(b"\0", start)] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._count:
+            return None
+        start = base + offsets[lo]
+        end = mm.find(b"\0", start)
+        if mm[start:end] != key:
+            return None
+        return mm[end + 1 : base + offsets[lo + 1]].decode("utf-8")
+
+    @staticmethod
+    def Load(manifest_path: str) -> Union[Dict[str, str], "_IndexedManifest"]:
+        """Opens the index for a manifest, building it first if necessary.
+
+        If the index can't be written, e.g. because the cache directory is
+        read-only, the manifest is parsed into a dict as usual.
+        """
+        manifest_stat = os.stat(manifest_path)
+        index_path = _IndexedManifest._IndexPath(manifest_path)
+        index = _IndexedManifest._Open(index_path, manifest_stat)
+        if index is not None:
+            return index
+        runfiles = _ManifestBased._LoadRunfiles(manifest_path)
+        try:
+            _IndexedManifest._Write(index_path, runfiles, manifest_stat)
+        except OSError:
+            pass
+        return runfiles
+
+    @staticmethod
+    def _IndexPath(manifest_path: str) -> str:
+        cache_dir = os.environ.get("RUNFILES_INDEX_DIR")
+        if not cache_dir:
+            cache_dir = os.path.join(
+                os.environ.get("XDG_CACHE_HOME")
+                or os.path.join(os.path.expanduser("~"), ".cache"),
+                "rules_python",
+                "runfiles_index",
+            )
+        key = os.path.abspath(manifest_path).encode("utf-8")
+        return os.path.join(cache_dir, hashlib.sha256(key).hexdigest() + ".idx")
+
+    @staticmethod
+    def _Open(
+        index_path: str, manifest_stat: os.stat_result
+    ) -> Optional["_IndexedManifest"]:
+        try:
+            with open(index_path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(mm) < _INDEX_HEADER.size:
+            mm.close()
+            return None
+        magic, size, mtime_ns, ino, count = _INDEX_HEADER.unpack_from(mm)
+        if (
+            magic != _INDEX_MAGIC
+            or size != manifest_stat.st_size
+            or mtime_ns != manifest_stat.st_mtime_ns
+            or ino != manifest_stat.st_ino
+            or len(mm) < _INDEX_HEADER.size + (count + 1) * 8
+        ):
+            mm.close()
+            return None
+        return _IndexedManifest(mm, count)
+
+    @staticmethod
+    def _Write(
+        index_path: str, runfiles: Dict[str, str], manifest_stat: os.stat_result
+    ) -> None:
+        entries = sorted(
+            (link.encode("utf-8"), target.encode("utf-8"))
+            for link, target in runfiles.items()
+        )
+        offsets = array.array("Q")
+        data = bytearray()
+        for link, target in entries:
+            offsets.append(len(data))
+            data += link
+            data += b"\0"
+            data += target
+        offsets.append(len(data))
+
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        # Write to a temporary file and rename it into place so that concurrent
+        # readers never see a partially written index. The name is unique per
+        # thread, as several threads of one process may build the same index.
+        tmp_path = "{}.{}.{}.tmp".format(index_path, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(
+                    _INDEX_HEADER.pack(
+                        _INDEX_MAGIC,
+                        manifest_stat.st_size,
+                        manifest_stat.st_mtime_ns,
+                        manifest_stat.st_ino,
+                        len(entries),
+                    )
+                )
+                f.write(offsets.tobytes())
+                f.write(data)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
 
 
 class _ManifestBased:
     """`Runfiles` strategy that parses a runfiles-manifest to look up runfiles."""
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, lazy: bool = False, index: bool = False) -> None:
         if not path:
             raise ValueError()
         if not isinstance(path, str):
             raise TypeError()
         self._path = path
-        self._runfiles = _ManifestBased._LoadRunfiles(path)
+        self._runfiles: Union[Dict[str, str], _MmapManifest, _IndexedManifest]
+        if index:
+            self._runfiles = _IndexedManifest.Load(path)
+        elif lazy:
+            self._runfiles = _MmapManifest(path)
+        else:
+            self._runfiles = _ManifestBased._LoadRunfiles(path)
 
     def RlocationChecked(self, path: str) -> Optional[str]:
         """Returns the runtime path of a runfile."""
@@ -169,6 +475,48 @@ class _ManifestBased:
             if prefix_match:
                 return prefix_match + "/" + path[prefix_end + 1 :]
 
+    def BatchRlocationChecked(self) -> Callable[[str], Optional[str]]:
+        """Returns a `RlocationChecked` function for resolving many paths.
+
+        The returned function remembers how each directory it has seen
+        resolves, so looking up many paths under the same directory doesn't
+        repeat the directory-prefix search of `RlocationChecked` for each of
+        them.
+        """
+        runfiles = self._runfiles
+        # Maps directories to the result of `RlocationChecked` for them.
+        directories: Dict[str, Optional[str]] = {}
+
+        def ResolveDirectory(directory: str) -> Optional[str]:
+            if directory in directories:
+                return directories[directory]
+            result = runfiles.get(directory)
+            if not result:
+                parent_end = directory.rfind("/")
+                if parent_end != -1:
+                    parent = ResolveDirectory(directory[:parent_end])
+                    if parent:
+                        result = parent + "/" + directory[parent_end + 1 :]
+            directories[directory] = result
+            return result
+
+        def RlocationChecked(path: str) -> Optional[str]:
+            exact_match = runfiles.get(path)
+            if exact_match:
+                return exact_match
+            # The same as the prefix search in `RlocationChecked`: the longest
+            # prefix of path that is in the manifest is the one that is found
+            # for the parent directory.
+            parent_end = path.rfind("/", 0, len(path) - 1)
+            if parent_end == -1:
+                return None
+            parent = ResolveDirectory(path[:parent_end])
+            if parent:
+                return parent + "/" + path[parent_end + 1 :]
+            return None
+
+        return RlocationChecked
+
     @staticmethod
     def _LoadRunfiles(path: str) -> Dict[str, str]:
         """Loads the runfiles manifest."""
@@ -216,18 +564,46 @@ class _ManifestBased:
 class _DirectoryBased:
     """`Runfiles` strategy that appends runfiles paths to the runfiles root."""
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, check_exists: bool = False) -> None:
         if not path:
             raise ValueError()
         if not isinstance(path, str):
             raise TypeError()
         self._runfiles_root = path
+        # If existence checks are enabled, maps directories to the set of
+        # names they contain, as listed once by os.scandir.
+        self._listings: Optional[Dict[str, FrozenSet[str]]] = (
+            {} if check_exists else None
+        )
 
-    def RlocationChecked(self, path: str) -> str:
+    def RlocationChecked(self, path: str) -> Optional[str]:
         # Use posixpath instead of os.path, because Bazel only creates a runfiles
         # tree on Unix platforms, so `Create()` will only create a directory-based
         # runfiles strategy on those platforms.
-        return posixpath.join(self._runfiles_root, path)
+        result = posixpath.join(self._runfiles_root, path)
+        if self._listings is None:
+            return result
+        directory, _, name = result.rstrip("/").rpartition("/")
+        if name in self._ListDirectory(directory):
+            return result
+        return None
+
+    def _ListDirectory(self, directory: str) -> FrozenSet[str]:
+        assert self._listings is not None
+        listing = self._listings.get(directory)
+        if listing is None:
+            try:
+                with os.scandir(directory or "/") as entries:
+                    listing = frozenset(entry.name for entry in entries)
+            except OSError:
+                # The directory doesn't exist or isn't a directory, so nothing
+                # exists under it.
+                listing = frozenset()
+            self._listings[directory] = listing
+        return listing
+
+    def BatchRlocationChecked(self) -> Callable[[str], Optional[str]]:
+        return self.RlocationChecked
 
     def EnvVars(self) -> Dict[str, str]:
         return {
@@ -238,6 +614,11 @@ class _DirectoryBased:
         }
 
 
+# Upper bound on the number of caller files whose repository names are cached
+# by `Runfiles.CurrentRepository`.
+_MAX_CACHED_CALLER_REPOSITORIES = 1024
+
+
 class Runfiles:
     """Returns the runtime location of runfiles.
 
@@ -250,6 +631,11 @@ class Runfiles:
         self._repo_mapping = _RepositoryMapping.create_from_file(
             strategy.RlocationChecked("_repo_mapping")
         )
+        # Maps the file paths of callers of `CurrentRepository` to their
+        # canonical repository names.
+        self._caller_repositories: Dict[str, str] = {}
+        if os.environ.get("RUNFILES_PROFILE") == "1":
+            _RunfilesProfile.Get().Instrument(self)
 
     def Rlocation(self, path: str, source_repo: Optional[str] = None) -> Optional[str]:
         """Returns the runtime path of a runfile.
@@ -278,21 +664,7 @@ class Runfiles:
           TypeError: if `path` is not a string
           ValueError: if `path` is None or empty, or it's absolute or not normalized
         """
-        if not path:
-            raise ValueError()
-        if not isinstance(path, str):
-            raise TypeError()
-        if (
-            path.startswith("../")
-            or "/.." in path
-            or path.startswith("./")
-            or "/./" in path
-            or path.endswith("/.")
-            or "//" in path
-        ):
-            raise ValueError('path is not normalized: "%s"' % path)
-        if path[0] == "\\":
-            raise ValueError('path is absolute without a drive letter: "%s"' % path)
+        _ValidateRlocationPath(path)
         if os.path.isabs(path):
             return path
 
@@ -302,6 +674,10 @@ class Runfiles:
             # name is not necessary.
             source_repo = self.CurrentRepository(frame=2)
 
+        return self._strategy.RlocationChecked(self._MapRunfilesPath(path, source_repo))
+
+    def _MapRunfilesPath(self, path: str, source_repo: Optional[str]) -> str:
+        """Applies the repository mapping of `source_repo` to `path`."""
         # Split off the first path component, which contains the repository
         # name (apparent or canonical).
         target_repo, _, remainder = path.partition("/")
@@ -314,21 +690,84 @@ class Runfiles:
             #   have to be mapped.
             # - path did not contain a slash and referred to a root symlink,
             #   which also should not be mapped.
-            return self._strategy.RlocationChecked(path)
+            return path
 
         assert (
             source_repo is not None
         ), "BUG: if the `source_repo` is None, we should never go past the `if` statement above"
 
         # Look up the target repository using the repository mapping
-        if target_canonical is not None:
-            return self._strategy.RlocationChecked(
-                target_canonical + "/" + remainder
-            )
+        return target_canonical + "/" + remainder
+
+    def RlocationMany(
+        self, paths: Iterable[str], source_repo: Optional[str] = None
+    ) -> List[Optional[str]]:
+        """Returns the runtime paths of several runfiles.
+
+        This is equivalent to calling `Rlocation` for each path, but the
+        repository of the caller is determined only once for the whole batch.
 
-        # No mapping found - assume target_repo is already canonical or
-        # we're not using Bzlmod
-        return self._strategy.RlocationChecked(path)
+        :::{versionadded} VERSION_NEXT_FEATURE
+        :::
+
+        Args:
+          paths: iterable of strings; runfiles-root-relative paths of the
+            runfiles.
+          source_repo: string; optional; see `Rlocation`.
+        Returns:
+          a list with the result of `Rlocation` for each path, in order.
+        Raises:
+          TypeError: if a path is not a string
+          ValueError: if a path is None or empty, or it's absolute or not
+            normalized, or the caller's repository can't be determined
+        """
+        if source_repo is None and not self._repo_mapping.is_empty():
+            source_repo = self.CurrentRepository(frame=2)
+        return list(self._RlocationBatch(paths, source_repo))
+
+    def RlocationBatch(
+        self, paths: Iterable[str], source_repo: Optional[str] = None
+    ) -> Iterator[Optional[str]]:
+        """Returns an iterator over the runtime paths of several runfiles.
+
+        Like `RlocationMany`, but `paths` is consumed lazily and results are
+        produced one at a time, which suits resolving large datasets. Paths
+        under the same directory share the work of resolving that directory
+        against the runfiles manifest, so resolving every file of a tree
+        artifact costs about one lookup per file instead of one per path
+        component.
+
+        :::{versionadded} VERSION_NEXT_FEATURE
+        :::
+
+        Args:
+          paths: iterable of strings; runfiles-root-relative paths of the
+            runfiles.
+          source_repo: string; optional; see `Rlocation`.
+        Returns:
+          an iterator yielding the result of `Rlocation` for each path, in
+          order.
+        Raises:
+          TypeError: if a path is not a string
+          ValueError: if a path is None or empty, or it's absolute or not
+            normalized, or the caller's repository can't be determined
+        """
+        # The caller's repository must be determined here rather than in the
+        # generator, which runs in the frame of whoever iterates over it.
+        if source_repo is None and not self._repo_mapping.is_empty():
+            source_repo = self.CurrentRepository(frame=2)
+        return self._RlocationBatch(paths, source_repo)
+
+    def _RlocationBatch(
+        self, paths: Iterable[str], source_repo: Optional[str]
+    ) -> Iterator[Optional[str]]:
+        rlocation_checked = self._strategy.BatchRlocationChecked()
+        for path in paths:
+            _ValidateRlocationPath(path)
+            if os.path.isabs(path):
+                yield path
+            else:
+                yield rlocation_checked(self._MapRunfilesPath(path, source_repo))
 
     def EnvVars(self) -> Dict[str, str]:
         """Returns environment variables for subprocesses.
@@ -361,6 +800,9 @@ class Runfiles:
         caller is, for example if it is not represented by a Python source
         file. Use the `frame` argument to control the stack lookup.
 
+        The result is cached per caller file, so repeated calls from the same
+        file don't have to recompute it.
+
         Args:
             frame: int; the stack frame to return the repository name for.
             Defaults to 1, the caller of the CurrentRepository function.
@@ -375,9 +817,12 @@ class Runfiles:
         """
         try:
             # pylint: disable-next=protected-access
-            caller_path = inspect.getfile(sys._getframe(frame))
-        except (TypeError, ValueError) as exc:
+            caller_path = sys._getframe(frame).f_code.co_filename
+        except ValueError as exc:
             raise ValueError("failed to determine caller's file path") from exc
+        cached_repo = self._caller_repositories.get(caller_path)
+        if cached_repo is not None:
+            return cached_repo
         caller_runfiles_path = os.path.relpath(caller_path, self._python_runfiles_root)
         if caller_runfiles_path.startswith(".." + os.path.sep):
             # With Python 3.10 and earlier, sys.path contains the directory
@@ -409,22 +854,83 @@ class Runfiles:
         if caller_runfiles_directory == "_main":
             # The canonical name of the main repository (also known as the
             # workspace) is the empty string.
-            return ""
-        # For all other repositories, the name of the runfiles directory is the
-        # canonical name.
-        return caller_runfiles_directory
+            caller_repo = ""
+        else:
+            # For all other repositories, the name of the runfiles directory is
+            # the canonical name.
+            caller_repo = caller_runfiles_directory
+
+        # Only results derived purely from the caller's path are cached; the
+        # fallback above depends on sys.path, which may change at runtime.
+        cache = self._caller_repositories
+        if len(cache) >= _MAX_CACHED_CALLER_REPOSITORIES:
+            # Other threads using this instance may evict or add entries at the
+            # same time, so the oldest entry may already be gone or the dict
+            # may change while it is being looked up.
+            try:
+                cache.pop(next(iter(cache)), None)
+            except (RuntimeError, StopIteration):
+                pass
+        cache[caller_path] = caller_repo
+        return caller_repo
 
     # TODO: Update return type to Self when 3.11 is the min version
     # https://peps.python.org/pep-0673/
     @staticmethod
-    def CreateManifestBased(manifest_path: str) -> "Runfiles":
-        return Runfiles(_ManifestBased(manifest_path))
+    def CreateManifestBased(
+        manifest_path: str, lazy: bool = False, index: bool = False
+    ) -> "Runfiles":
+        """Returns a new manifest-based `Runfiles` instance.
+
+        Args:
+            manifest_path: string; path to the runfiles manifest file.
+            lazy: bool; if True, the manifest is mmap-ed and looked up with a
+                binary search on every call instead of being read into memory
+                upfront. This makes creation cheap for large manifests when
+                only a few runfiles are looked up. The manifest must be sorted
+                by runfiles path, which is always the case for manifests
+                written by Bazel.
+
+                :::{versionadded} VERSION_NEXT_FEATURE
+                :::
+            index: bool; if True, a compiled binary index of the manifest is
+                kept in a cache directory and mmap-ed by later processes that
+                use the same, unchanged manifest. The cache directory is
+                `$RUNFILES_INDEX_DIR`, or `rules_python/runfiles_index` under
+                `$XDG_CACHE_HOME` (default `~/.cache`). If the index can't be
+                written, the manifest is read into memory as usual. Takes
+                precedence over `lazy`.
+
+                :::{versionadded} VERSION_NEXT_FEATURE
+                :::
+
+        Raises:
+            IOError: if the manifest file cannot be read.
+        """
+        return Runfiles(_ManifestBased(manifest_path, lazy=lazy, index=index))
 
     # TODO: Update return type to Self when 3.11 is the min version
     # https://peps.python.org/pep-0673/
     @staticmethod
-    def CreateDirectoryBased(runfiles_dir_path: str) -> "Runfiles":
-        return Runfiles(_DirectoryBased(runfiles_dir_path))
+    def CreateDirectoryBased(
+        runfiles_dir_path: str, check_exists: bool = False
+    ) -> "Runfiles":
+        """Returns a new directory-based `Runfiles` instance.
+
+        Args:
+            runfiles_dir_path: string; path to the runfiles directory.
+            check_exists: bool; if True, `Rlocation` returns None for runfiles
+                that don't exist in the runfiles directory. Each directory is
+                listed with a single `os.scandir` call the first time a path
+                in it is looked up, and the listing is reused afterwards, so
+                checking many files in the same directory doesn't `stat` each
+                of them. Changes to the runfiles directory made after a
+                directory was listed are not picked up.
+
+                :::{versionadded} VERSION_NEXT_FEATURE
+                :::
+        """
+        return Runfiles(_DirectoryBased(runfiles_dir_path, check_exists=check_exists))
 
     # TODO: Update return type to Self when 3.11 is the min version
     # https://peps.python.org/pep-0673/
@@ -440,7 +946,9 @@ class Runfiles:
         If `env` contains "RUNFILES_MANIFEST_FILE" with non-empty value, this method
         returns a manifest-based implementation. The object eagerly reads and caches
         the whole manifest file upon instantiation; this may be relevant for
-        performance consideration.
+        performance consideration. If `env` also contains "RUNFILES_MANIFEST_INDEX"
+        set to "1", a persistent manifest index is used instead, see
+        `CreateManifestBased`.
 
         Otherwise, if `env` contains "RUNFILES_DIR" with non-empty value (checked in
         this priority order), this method returns a directory-based implementation.
@@ -456,7 +964,9 @@ class Runfiles:
         env_map = os.environ if env is None else env
         manifest = env_map.get("RUNFILES_MANIFEST_FILE")
         if manifest:
-            return CreateManifestBased(manifest)
+            return CreateManifestBased(
+                manifest, index=env_map.get("RUNFILES_MANIFEST_INDEX") == "1"
+            )
 
         directory = env_map.get("RUNFILES_DIR")
         if directory:
@@ -464,10 +974,265 @@ class Runfiles:
 
         return None
 
+    # TODO: Update return type to Self when 3.11 is the min version
+    # https://peps.python.org/pep-0673/
+    @staticmethod
+    async def CreateAsync(env: Optional[Dict[str, str]] = None) -> Optional["Runfiles"]:
+        """Returns a new `Runfiles` instance without blocking the event loop.
+
+        This is the same as `Create`, except that the manifest and repository
+        mapping are read in a worker thread of the running event loop's
+        default executor. The returned object's lookups are synchronous, as
+        usual.
+
+        Concurrent calls on the same event loop that would create the same
+        kind of `Runfiles` object share a single load and all receive the same
+        instance. Cancelling one of the callers doesn't cancel the load for
+        the others.
+
+        :::{versionadded} VERSION_NEXT_FEATURE
+        :::
+
+        Args:
+        env: {string: string}; optional; the map of environment variables. If None,
+            this function uses the environment variable map of this process.
+        Raises:
+        IOError: if some IO error occurs.
+        """
+        # asyncio is only imported here to keep it out of the startup of
+        # binaries that don't use it.
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        env_map = os.environ if env is None else env
+        selected_env = {
+            name: env_map[name] for name in _RUNFILES_ENV_VARS if name in env_map
+        }
+        loop = asyncio.get_running_loop()
+        key = (loop, tuple(sorted(selected_env.items())))
+        load = _pending_async_creates.get(key)
+        if load is None:
+            load = loop.run_in_executor(None, Runfiles.Create, selected_env)
+            _pending_async_creates[key] = load
+            load.add_done_callback(lambda _: _pending_async_creates.pop(key, None))
+        return await asyncio.shield(load)
+
+    # TODO: Update return type to Self when 3.11 is the min version
+    # https://peps.python.org/pep-0673/
+    @staticmethod
+    def Default() -> Optional["Runfiles"]:
+        """Returns a process-wide `Runfiles` instance for the current environment.
+
+        The first call creates the instance with `Create()`; later calls with
+        the same values of the runfiles environment variables
+        (`RUNFILES_MANIFEST_FILE`, `RUNFILES_MANIFEST_INDEX` and `RUNFILES_DIR`)
+        return the same instance, so independent libraries in a process share
+        a single parsed manifest. Processes forked after the instance was
+        created inherit it and don't parse the manifest again.
+
+        :::{versionadded} VERSION_NEXT_FEATURE
+        :::
+
+        Returns:
+          the shared `Runfiles` instance, or None if the environment doesn't
+          describe any runfiles (see `Create`).
+        Raises:
+        IOError: if some IO error occurs.
+        """
+        key = tuple(os.environ.get(name) for name in _RUNFILES_ENV_VARS)
+        try:
+            return _default_runfiles[key]
+        except KeyError:
+            pass
+        with _default_runfiles_lock:
+            if key not in _default_runfiles:
+                _default_runfiles[key] = Runfiles.Create(
+                    {
+                        name: value
+                        for name, value in zip(_RUNFILES_ENV_VARS, key)
+                        if value is not None
+                    }
+                )
+            return _default_runfiles[key]
+
+    @staticmethod
+    def ClearDefault() -> None:
+        """Forgets the instances returned by `Default()`.
+
+        The next call to `Default()` creates a new instance. This is mostly
+        useful for tests that change the runfiles environment variables.
+
+        :::{versionadded} VERSION_NEXT_FEATURE
+        :::
+        """
+        with _default_runfiles_lock:
+            _default_runfiles.clear()
+
 
 # Support legacy imports by defining a private symbol.
 _Runfiles = Runfiles
 
+# Environment variables that determine which `Runfiles` object `Create()`
+# returns.
+_RUNFILES_ENV_VARS = (
+    "RUNFILES_MANIFEST_FILE",
+    "RUNFILES_MANIFEST_INDEX",
+    "RUNFILES_DIR",
+)
+
+# Instances returned by `Runfiles.Default()`, keyed by the values of
+# _RUNFILES_ENV_VARS.
+_default_runfiles: Dict[Tuple[Optional[str], ...], Optional[Runfiles]] = {}
+_default_runfiles_lock = threading.Lock()
+
+
+def _ReinitDefaultRunfilesLock() -> None:
+    # A forked child must not inherit the lock in the state the parent's other
+    # threads left it in.
+    global _default_runfiles_lock  # pylint: disable=global-statement
+    _default_runfiles_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_ReinitDefaultRunfilesLock)
+
+# Loads started by `Runfiles.CreateAsync` that haven't finished yet, keyed by
+# event loop and the environment variables that select the runfiles.
+_pending_async_creates: Dict[Tuple[Any, ...], Any] = {}
+
+
+class _RunfilesProfile:
+    """Collects statistics about runfiles lookups.
+
+    Profiling is enabled by setting `RUNFILES_PROFILE=1`. Instances of
+    `Runfiles` created while it is set get instrumented versions of their
+    lookup methods installed as instance attributes, so uninstrumented
+    instances don't pay for any of this. At exit, a JSON summary is written to
+    the file named by `RUNFILES_PROFILE_OUTPUT`, or to stderr.
+    """
+
+    _instance: Optional["_RunfilesProfile"] = None
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, Union[int, float]] = {
+            "runfiles_created": 0,
+            "rlocation_calls": 0,
+            "rlocation_seconds": 0.0,
+            "lookups": 0,
+            "lookup_misses": 0,
+            "prefix_fallback_hits": 0,
+            "repo_mapping_hits": 0,
+            "repo_mapping_misses": 0,
+        }
+
+    @staticmethod
+    def Get() -> "_RunfilesProfile":
+        """Returns the process-wide profile, creating it on first use."""
+        if _RunfilesProfile._instance is None:
+            _RunfilesProfile._instance = _RunfilesProfile()
+            atexit.register(_RunfilesProfile._instance.Dump)
+        return _RunfilesProfile._instance
+
+    def Instrument(self, runfiles: Runfiles) -> None:
+        """Installs counting wrappers around the lookups of `runfiles`."""
+        counters = self.counters
+        counters["runfiles_created"] += 1
+        # pylint: disable=protected-access
+        strategy = runfiles._strategy
+        repo_mapping = runfiles._repo_mapping
+        manifest = getattr(strategy, "_runfiles", None)
+
+        def CountLookup(path: str, result: Optional[str]) -> None:
+            counters["lookups"] += 1
+            if not result:
+                counters["lookup_misses"] += 1
+            elif manifest is not None and not manifest.get(path):
+                counters["prefix_fallback_hits"] += 1
+
+        rlocation_checked = strategy.RlocationChecked
+
+        def RlocationChecked(path: str) -> Optional[str]:
+            result = rlocation_checked(path)
+            CountLookup(path, result)
+            return result
+
+        batch_rlocation_checked = strategy.BatchRlocationChecked
+
+        def BatchRlocationChecked() -> Callable[[str], Optional[str]]:
+            batch_lookup = batch_rlocation_checked()
+
+            def RlocationChecked(path: str) -> Optional[str]:
+                result = batch_lookup(path)
+                CountLookup(path, result)
+                return result
+
+            return RlocationChecked
+
+        lookup = repo_mapping.lookup
+
+        def Lookup(source_repo: Optional[str], target_apparent: str) -> Optional[str]:
+            result = lookup(source_repo, target_apparent)
+            if result is None:
+                counters["repo_mapping_misses"] += 1
+            else:
+                counters["repo_mapping_hits"] += 1
+            return result
+
+        rlocation = runfiles.Rlocation
+
+        def Rlocation(path: str, source_repo: Optional[str] = None) -> Optional[str]:
+            start = time.perf_counter()
+            try:
+                # Resolve the caller here, since this wrapper adds a frame
+                # between the caller and the original method.
+                _ValidateRlocationPath(path)
+                if (
+                    source_repo is None
+                    and not os.path.isabs(path)
+                    and not repo_mapping.is_empty()
+                ):
+                    source_repo = runfiles.CurrentRepository(frame=2)
+                return rlocation(path, source_repo)
+            finally:
+                counters["rlocation_calls"] += 1
+                counters["rlocation_seconds"] += time.perf_counter() - start
+
+        strategy.RlocationChecked = RlocationChecked  # type: ignore[method-assign]
+        strategy.BatchRlocationChecked = BatchRlocationChecked  # type: ignore[method-assign]
+        repo_mapping.lookup = Lookup  # type: ignore[method-assign]
+        runfiles.Rlocation = Rlocation  # type: ignore[method-assign]
+
+    def Dump(self) -> None:
+        """Writes the collected statistics as JSON."""
+        # Only imported here to keep it out of the startup of every binary.
+        import json  # pylint: disable=import-outside-toplevel
+
+        summary = json.dumps(self.counters, indent=2, sort_keys=True)
+        output = os.environ.get("RUNFILES_PROFILE_OUTPUT")
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(summary + "\n")
+        else:
+            sys.stderr.write("runfiles profile: " + summary + "\n")
+
+
+def _ValidateRlocationPath(path: str) -> None:
+    """Raises an error if `path` can't be passed to `Runfiles.Rlocation`."""
+    if not path:
+        raise ValueError()
+    if not isinstance(path, str):
+        raise TypeError()
+    if (
+        path.startswith("../")
+        or "/.." in path
+        or path.startswith("./")
+        or "/./" in path
+        or path.endswith("/.")
+        or "//" in path
+    ):
+        raise ValueError('path is not normalized: "%s"' % path)
+    if path[0] == "\\":
+        raise ValueError('path is absolute without a drive letter: "%s"' % path)
+
 
 def _FindPythonRunfilesRoot() -> str:
     """Finds the root of the Python runfiles tree."""
@@ -481,13 +1246,29 @@ def _FindPythonRunfilesRoot() -> str:
     return root
 
 
-def CreateManifestBased(manifest_path: str) -> Runfiles:
-    return Runfiles.CreateManifestBased(manifest_path)
+def CreateManifestBased(
+    manifest_path: str, lazy: bool = False, index: bool = False
+) -> Runfiles:
+    return Runfiles.CreateManifestBased(manifest_path, lazy=lazy, index=index)
 
 
-def CreateDirectoryBased(runfiles_dir_path: str) -> Runfiles:
-    return Runfiles.CreateDirectoryBased(runfiles_dir_path)
+def CreateDirectoryBased(
+    runfiles_dir_path: str, check_exists: bool = False
+) -> Runfiles:
+    return Runfiles.CreateDirectoryBased(runfiles_dir_path, check_exists=check_exists)
 
 
 def Create(env: Optional[Dict[str, str]] = None) -> Optional[Runfiles]:
     return Runfiles.Create(env)
+
+
+async def CreateAsync(env: Optional[Dict[str, str]] = None) -> Optional[Runfiles]:
+    return await Runfiles.CreateAsync(env)
+
+
+def Default() -> Optional[Runfiles]:
+    return Runfiles.Default()
+
+
+def ClearDefault() -> None:
+    Runfiles.ClearDefault()
@@ -0,0 +1,120 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from python.runfiles import runfiles
+
+_FORKSERVER_PATH = runfiles.Create().Rlocation(
+    "rules_python/python/private/bootstrap_forkserver.py"
+)
+
+
+def _load_forkserver():
+    spec = importlib.util.spec_from_file_location(
+        "bootstrap_forkserver", _FORKSERVER_PATH
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+bootstrap_forkserver = _load_forkserver()
+
+# Prints the interpreter state that the forkserver's key is made of, and the
+# options that reproduce it.
+_PRINT_STATE = """
+import importlib.util, json, sys
+spec = importlib.util.spec_from_file_location("bootstrap_forkserver", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(json.dumps({
+    "flags": repr(sys.flags),
+    "warnoptions": sys.warnoptions,
+    "xoptions": sorted(sys._xoptions.items()),
+    "args": module._interpreter_args(),
+}))
+"""
+
+
+class InterpreterArgsTest(unittest.TestCase):
+    def _state(self, args):
+        output = subprocess.check_output(
+            [sys.executable] + args + ["-c", _PRINT_STATE, _FORKSERVER_PATH],
+            # Flags set by the environment would be set in both runs.
+            env={},
+        )
+        return json.loads(output)
+
+    def test_options_round_trip(self):
+        for args in [
+            [],
+            ["-B", "-O", "-O", "-s"],
+            ["-I", "-b"],
+            ["-W", "error::DeprecationWarning", "-X", "utf8", "-X", "dev"],
+            ["-X", "int_max_str_digits=1000"],
+        ]:
+            with self.subTest(args=args):
+                want = self._state(args)
+                got = self._state(want["args"])
+                self.assertEqual(got, want)
+
+
+class PreloadableModulesTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp(dir=os.environ.get("TEST_TMPDIR"))
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.addCleanup(self._unimport, "forkserver_first_party")
+        self.addCleanup(self._unimport, "forkserver_third_party")
+
+    def _unimport(self, name):
+        sys.modules.pop(name, None)
+
+    def _import(self, directory, name):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name + ".py"), "w") as f:
+            f.write("")
+        sys.path.insert(0, directory)
+        try:
+            importlib.import_module(name)
+        finally:
+            sys.path.remove(directory)
+
+    def test_only_stdlib_and_site_packages(self):
+        self._import(os.path.join(self.tmp, "_main"), "forkserver_first_party")
+        self._import(
+            os.path.join(self.tmp, "pypi_foo", "site-packages"),
+            "forkserver_third_party",
+        )
+
+        modules = bootstrap_forkserver._preloadable_modules()
+
+        self.assertIn("forkserver_third_party", modules)
+        self.assertNotIn("forkserver_first_party", modules)
+        # Modules of the standard library, whether built in or from files.
+        self.assertIn("sys", modules)
+        self.assertIn("json", modules)
+        self.assertNotIn("__main__", modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# --- begin runfiles.bash initialization v3 ---
+# Copy-pasted from the Bazel Bash runfiles library v3.
+set -uo pipefail; set +e; f=bazel_tools/tools/bash/runfiles/runfiles.bash
+source "${RUNFILES_DIR:-/dev/null}/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "${RUNFILES_MANIFEST_FILE:-/dev/null}" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$0.runfiles/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.exe.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  { echo>&2 "ERROR: cannot find $f"; exit 1; }; f=; set -e
+# --- end runfiles.bash initialization v3 ---
+set +e
+
+bin=$(rlocation $BIN_RLOCATION)
+if [[ -z "$bin" ]]; then
+  echo "Unable to locate test binary: $BIN_RLOCATION"
+  exit 1
+fi
+
+export RULES_PYTHON_FORKSERVER=1
+# Unix socket paths are short, so the test's tmp dir may be too long.
+RULES_PYTHON_FORKSERVER_DIR=$(mktemp -d /tmp/forkserver.XXXXXX)
+export RULES_PYTHON_FORKSERVER_DIR
+export RULES_PYTHON_FORKSERVER_IDLE_SECS=10
+
+# Runs the binary in the background and sets `pid` to the launched process.
+function run_info() {
+  echo "$1" | FORKSERVER_TEST_VALUE="$1" $bin info > "$TEST_TMPDIR/stdout.txt" \
+    2> "$TEST_TMPDIR/stderr.txt" &
+  pid=$!
+  wait $pid
+  actual=$(cat "$TEST_TMPDIR/stdout.txt")
+}
+
+# The first run is a normal one, which starts the server when it exits. The
+# bootstrap execs the program, so it has the launched process's pid.
+run_info first
+if [[ "$actual" != *"pid: $pid"* ]]; then
+  echo "expected the first run to run the program itself (pid $pid): $actual"
+  exit 1
+fi
+for _ in $(seq 300); do
+  [[ -S "$(echo "$RULES_PYTHON_FORKSERVER_DIR"/*.sock)" ]] && break
+  sleep 0.1
+done
+
+# Later runs are forked by the server, with the client's cwd, environment
+# and stdio.
+cd "$TEST_TMPDIR"
+run_info second
+for expected in "cwd: $TEST_TMPDIR" "env: second" "stdin: second"; do
+  if [[ "$actual" != *"$expected"* ]]; then
+    echo "expected '$expected' in: $actual"
+    exit 1
+  fi
+done
+if [[ "$actual" == *"pid: $pid"* ]]; then
+  echo "expected the second run to be forked by the server: $actual"
+  exit 1
+fi
+if ! grep -q "stderr line" "$TEST_TMPDIR/stderr.txt"; then
+  echo "expected the program's stderr"
+  exit 1
+fi
+
+$bin exit 7
+exit_code=$?
+if [[ $exit_code != 7 ]]; then
+  echo "expected exit code 7, got $exit_code"
+  exit 1
+fi
+
+# Signals sent to the client reach the program.
+ready="$TEST_TMPDIR/ready"
+$bin wait_for_signal "$ready" &
+pid=$!
+for _ in $(seq 300); do
+  [[ -e "$ready" ]] && break
+  sleep 0.1
+done
+kill -TERM $pid
+wait $pid
+exit_code=$?
+if [[ $exit_code != 42 ]]; then
+  echo "expected exit code 42 from the SIGTERM handler, got $exit_code"
+  exit 1
+fi
+
+exit 0
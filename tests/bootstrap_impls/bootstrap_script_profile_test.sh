@@ -0,0 +1,68 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# --- begin runfiles.bash initialization v3 ---
+# Copy-pasted from the Bazel Bash runfiles library v3.
+set -uo pipefail; set +e; f=bazel_tools/tools/bash/runfiles/runfiles.bash
+source "${RUNFILES_DIR:-/dev/null}/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "${RUNFILES_MANIFEST_FILE:-/dev/null}" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$0.runfiles/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.exe.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  { echo>&2 "ERROR: cannot find $f"; exit 1; }; f=; set -e
+# --- end runfiles.bash initialization v3 ---
+set +e
+
+bin=$(rlocation $BIN_RLOCATION)
+if [[ -z "$bin" ]]; then
+  echo "Unable to locate test binary: $BIN_RLOCATION"
+  exit 1
+fi
+
+function fail() {
+  echo "$1"
+  echo "===== profile START ====="
+  cat "$profile"
+  echo "===== profile END ====="
+  echo "===== stderr START ====="
+  cat "$TEST_TMPDIR/stderr.txt"
+  echo "===== stderr END ====="
+  exit 1
+}
+
+profile="$TEST_TMPDIR/profile.json"
+RULES_PYTHON_BOOTSTRAP_PROFILE="$profile" $bin > "$TEST_TMPDIR/stdout.txt" 2> "$TEST_TMPDIR/stderr.txt"
+exit_code=$?
+if [[ $exit_code != 3 ]]; then
+  fail "expected exit code 3, got $exit_code"
+fi
+
+# The program's output is passed through, without the -X importtime output.
+grep -q "profile_bin stdout" "$TEST_TMPDIR/stdout.txt" || fail "stdout missing"
+grep -q "profile_bin stderr" "$TEST_TMPDIR/stderr.txt" || fail "stderr missing"
+grep -q "^import time: profile_bin$" "$TEST_TMPDIR/stderr.txt" \
+  || fail "the program's own \"import time:\" line was removed from stderr"
+if grep -v "^import time: profile_bin$" "$TEST_TMPDIR/stderr.txt" | grep -q "^import time:"; then
+  fail "stderr has -X importtime output"
+fi
+if [[ -e "$profile.stderr" ]]; then
+  fail "the copy of stderr wasn't deleted"
+fi
+
+[[ "$(head -n1 "$profile")" == "[" ]] || fail "profile isn't a JSON array"
+for name in "stage1" "stage1: venv" "interpreter startup" "site init" "stage2" "main" "fractions"; do
+  grep -q "\"name\": \"$name\"" "$profile" || fail "profile is missing event: $name"
+done
+
+exit 0
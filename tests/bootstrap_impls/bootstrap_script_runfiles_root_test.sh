@@ -0,0 +1,88 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Checks that a binary sees the same runfiles layout however its runfiles
+# root is found: from RUNFILES_DIR, from only RUNFILES_MANIFEST_FILE, from
+# the executable's path, or by extracting a zip.
+
+# --- begin runfiles.bash initialization v3 ---
+# Copy-pasted from the Bazel Bash runfiles library v3.
+set -uo pipefail; set +e; f=bazel_tools/tools/bash/runfiles/runfiles.bash
+source "${RUNFILES_DIR:-/dev/null}/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "${RUNFILES_MANIFEST_FILE:-/dev/null}" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$0.runfiles/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.exe.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  { echo>&2 "ERROR: cannot find $f"; exit 1; }; f=; set -e
+# --- end runfiles.bash initialization v3 ---
+set +e
+
+bin=$(rlocation $BIN_RLOCATION)
+if [[ -z "$bin" ]]; then
+  echo "Unable to locate test binary: $BIN_RLOCATION"
+  exit 1
+fi
+zip=$(rlocation $ZIP_RLOCATION)
+if [[ -z "$zip" ]]; then
+  echo "Unable to locate test zip: $ZIP_RLOCATION"
+  exit 1
+fi
+
+# The binary in the build output tree, next to its runfiles.
+real_bin=$(readlink -f "$bin")
+manifest="$real_bin.runfiles_manifest"
+if [[ ! -e "$manifest" ]]; then
+  manifest="$real_bin.runfiles/MANIFEST"
+fi
+# A copy isn't next to its runfiles, so only the manifest can find them.
+copied_bin=$TEST_TMPDIR/copied_bin
+cp "$real_bin" "$copied_bin"
+
+expected=$(RUNFILES_DIR="$real_bin.runfiles" RUNFILES_MANIFEST_FILE= "$bin")
+if [[ $? -ne 0 ]]; then
+  echo "Running with RUNFILES_DIR failed"
+  exit 1
+fi
+if ! (echo "$expected" | grep "^main: .*runfiles_root_bin.py$") >/dev/null; then
+  echo "Expected the main file to be under the runfiles root, but got:"
+  echo "$expected"
+  exit 1
+fi
+if ! (echo "$expected" | grep "^RULES_PYTHON_BOOTSTRAP_RUNFILES_ROOT: UNSET$") >/dev/null; then
+  echo "Expected the runfiles root to not be passed on to the program, but got:"
+  echo "$expected"
+  exit 1
+fi
+
+function check_same() {
+  local name="$1"
+  local actual="$2"
+  if [[ "$actual" != "$expected" ]]; then
+    echo "Output when $name does not match output when RUNFILES_DIR is set"
+    echo "Output when RUNFILES_DIR is set:"
+    echo "$expected"
+    echo "Output when $name:"
+    echo "$actual"
+    exit 1
+  fi
+}
+
+check_same "found from the executable's path" \
+  "$(RUNFILES_DIR= RUNFILES_MANIFEST_FILE= "$real_bin")"
+check_same "only RUNFILES_MANIFEST_FILE is set" \
+  "$(RUNFILES_DIR= RUNFILES_MANIFEST_FILE="$manifest" "$copied_bin")"
+check_same "run from a zip" \
+  "$(RUNFILES_DIR= RUNFILES_MANIFEST_FILE= python3 "$zip")"
+
+exit 0
@@ -0,0 +1,107 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# --- begin runfiles.bash initialization v3 ---
+# Copy-pasted from the Bazel Bash runfiles library v3.
+set -uo pipefail; set +e; f=bazel_tools/tools/bash/runfiles/runfiles.bash
+source "${RUNFILES_DIR:-/dev/null}/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "${RUNFILES_MANIFEST_FILE:-/dev/null}" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$0.runfiles/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.exe.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  { echo>&2 "ERROR: cannot find $f"; exit 1; }; f=; set -e
+# --- end runfiles.bash initialization v3 ---
+set +e
+
+bin=$(rlocation $ZIP_RLOCATION)
+if [[ -z "$bin" ]]; then
+  echo "Unable to locate test binary: $ZIP_RLOCATION"
+  exit 1
+fi
+export RULES_PYTHON_ZIP_CACHE=1
+export RULES_PYTHON_ZIP_CACHE_DIR="$TEST_TMPDIR/zip_cache"
+
+# Start a long-running launch and a few short ones at the same time, all with
+# a cold cache. Whichever wins the extraction, the others must only wait for
+# it to finish extracting, not for the long-running program to exit.
+ready="$TEST_TMPDIR/ready"
+python3 $bin wait_for_signal "$ready" &
+long_pid=$!
+short_pids=()
+for i in 1 2 3; do
+  timeout 30 python3 $bin exit 0 &
+  short_pids+=($!)
+done
+
+for pid in "${short_pids[@]}"; do
+  wait $pid
+  exit_code=$?
+  if [[ $exit_code != 0 ]]; then
+    echo "expected a concurrent launch to exit with 0, got $exit_code"
+    kill -KILL $long_pid
+    exit 1
+  fi
+done
+
+# A launch while the long-running program holds the cache entry also mustn't
+# wait for it.
+timeout 30 python3 $bin exit 0
+exit_code=$?
+if [[ $exit_code != 0 ]]; then
+  echo "expected a launch with a warm cache to exit with 0, got $exit_code"
+  kill -KILL $long_pid
+  exit 1
+fi
+
+for _ in $(seq 300); do
+  [[ -e "$ready" ]] && break
+  sleep 0.1
+done
+if ! kill -0 $long_pid 2>/dev/null; then
+  echo "expected the long-running program to still be running"
+  exit 1
+fi
+kill -TERM $long_pid
+wait $long_pid
+exit_code=$?
+if [[ $exit_code != 42 ]]; then
+  echo "expected exit code 42 from the SIGTERM handler, got $exit_code"
+  exit 1
+fi
+
+# Only the shared lock that keeps the entry from being evicted may be passed
+# on to the exec'ed program; the extraction lock must be released before.
+if [[ -d /proc/self/fd ]]; then
+  rm -fr "$RULES_PYTHON_ZIP_CACHE_DIR"
+  open_files=$(python3 $bin open_files)
+  if ! grep -q "\.lock$" <<< "$open_files"; then
+    echo "expected the program to hold the cache entry's lock, got:"
+    echo "$open_files"
+    exit 1
+  fi
+  if grep -q "\.extract$" <<< "$open_files"; then
+    echo "expected the program not to inherit the extraction lock, got:"
+    echo "$open_files"
+    exit 1
+  fi
+fi
+
+num_entries=$(ls -d "$RULES_PYTHON_ZIP_CACHE_DIR"/*/ | wc -l)
+if [[ $num_entries != 1 ]]; then
+  echo "expected 1 cache entry, got $num_entries:"
+  ls "$RULES_PYTHON_ZIP_CACHE_DIR"
+  exit 1
+fi
+
+exit 0
@@ -0,0 +1,77 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# --- begin runfiles.bash initialization v3 ---
+# Copy-pasted from the Bazel Bash runfiles library v3.
+set -uo pipefail; set +e; f=bazel_tools/tools/bash/runfiles/runfiles.bash
+source "${RUNFILES_DIR:-/dev/null}/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "${RUNFILES_MANIFEST_FILE:-/dev/null}" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$0.runfiles/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.exe.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  { echo>&2 "ERROR: cannot find $f"; exit 1; }; f=; set -e
+# --- end runfiles.bash initialization v3 ---
+set +e
+
+bin=$(rlocation $ZIP_RLOCATION)
+if [[ -z "$bin" ]]; then
+  echo "Unable to locate test binary: $ZIP_RLOCATION"
+  exit 1
+fi
+export RULES_PYTHON_ZIP_EXEC=1
+export TMPDIR="$TEST_TMPDIR/tmp"
+mkdir -p "$TMPDIR"
+
+python3 $bin exit 7
+exit_code=$?
+if [[ $exit_code != 7 ]]; then
+  echo "expected exit code 7, got $exit_code"
+  exit 1
+fi
+
+# The program replaces the bootstrap process, so it has the same pid.
+python3 $bin pid > "$TEST_TMPDIR/pid.txt" &
+pid=$!
+wait $pid
+if [[ "$(cat "$TEST_TMPDIR/pid.txt")" != "$pid" ]]; then
+  echo "expected the program to run as pid $pid, got: $(cat "$TEST_TMPDIR/pid.txt")"
+  exit 1
+fi
+
+# Signals sent to the launched process reach the program.
+ready="$TEST_TMPDIR/ready"
+python3 $bin wait_for_signal "$ready" &
+pid=$!
+for _ in $(seq 300); do
+  [[ -e "$ready" ]] && break
+  sleep 0.1
+done
+kill -TERM $pid
+wait $pid
+exit_code=$?
+if [[ $exit_code != 42 ]]; then
+  echo "expected exit code 42 from the SIGTERM handler, got $exit_code"
+  exit 1
+fi
+
+# Each launch deletes the runfiles of earlier ones that have exited, so
+# only the last one's are left.
+num_runfiles=$(ls -d "$TMPDIR"/Bazel.runfiles_* | wc -l)
+if [[ $num_runfiles != 1 ]]; then
+  echo "expected 1 runfiles directory, got $num_runfiles:"
+  ls "$TMPDIR"
+  exit 1
+fi
+
+exit 0
@@ -0,0 +1,33 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import signal
+import sys
+import time
+
+command = sys.argv[1]
+if command == "info":
+    print("pid:", os.getpid())
+    print("cwd:", os.getcwd())
+    print("env:", os.environ.get("FORKSERVER_TEST_VALUE"))
+    print("stdin:", sys.stdin.readline().strip())
+    print("stderr line", file=sys.stderr)
+elif command == "exit":
+    sys.exit(int(sys.argv[2]))
+elif command == "wait_for_signal":
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(42))
+    open(sys.argv[2], "w").close()
+    time.sleep(60)
+    sys.exit(1)
@@ -0,0 +1,63 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+from python.runfiles import runfiles
+
+
+class ImportAllReposTest(unittest.TestCase):
+    """Checks the runfiles root entries that site init adds to sys.path.
+
+    With --experimental_python_import_all_repositories (the default), every
+    directory in the runfiles root is added to sys.path.
+    """
+
+    def setUp(self):
+        rlocation_path = os.environ["EXTERNAL_DATA_RLOCATION"]
+        data_path = runfiles.Create().Rlocation(rlocation_path)
+        self.assertTrue(data_path.endswith(rlocation_path), data_path)
+        self.runfiles_root = os.path.normpath(data_path[: -len(rlocation_path)])
+        self.external_repo = rlocation_path.partition("/")[0]
+        self.main_repo = os.path.relpath(
+            os.path.normpath(os.path.abspath(__file__)), self.runfiles_root
+        ).split(os.sep)[0]
+        self.sys_path = set()
+        for path in sys.path:
+            path = os.path.normpath(os.path.abspath(path))
+            if path.startswith(self.runfiles_root + os.sep):
+                self.sys_path.add(os.path.relpath(path, self.runfiles_root))
+
+    def test_main_repo(self):
+        self.assertIn(self.main_repo, self.sys_path)
+
+    def test_external_repo(self):
+        self.assertIn(self.external_repo, self.sys_path)
+
+    def test_root_symlink_directory(self):
+        self.assertIn("import_all_root_symlink_dir", self.sys_path)
+
+    def test_root_symlink_file_is_not_added(self):
+        self.assertTrue(
+            os.path.isfile(
+                os.path.join(self.runfiles_root, "import_all_root_symlink_file")
+            )
+        )
+        self.assertNotIn("import_all_root_symlink_file", self.sys_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,22 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from tests.bootstrap_impls import lazy_zip_lib
+
+print("lib:", lazy_zip_lib.__file__)
+print("data:", lazy_zip_lib.read_data())
+print("main extracted:", os.path.exists(__file__))
+print("lib extracted:", os.path.exists(lazy_zip_lib.__file__))
@@ -0,0 +1,28 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+
+# Runs another binary while RULES_PYTHON_LAZY_ZIP is set for this one.
+result = subprocess.run([sys.argv[1]], capture_output=True, text=True)
+print(result.stdout, end="")
+print(result.stderr, end="", file=sys.stderr)
+print("inner exit code:", result.returncode)
+# The other binary's main file must not be extracted into our runfiles.
+print(
+    "inner main in outer runfiles:",
+    os.path.exists(os.path.join(os.path.dirname(__file__), "lazy_zip_bin.py")),
+)
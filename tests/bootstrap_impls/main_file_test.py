@@ -0,0 +1,36 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+
+class MainFileTest(unittest.TestCase):
+    def test_main_globals(self):
+        # These match what runpy.run_path sets for a source file.
+        self.assertIsNone(__spec__)
+        self.assertIsNone(__loader__)
+        self.assertIsNone(__cached__)
+        self.assertEqual(__package__, "")
+        self.assertEqual(os.path.basename(__file__), "main_file_test.py")
+
+    def test_main_module_is_this_file(self):
+        self.assertIs(sys.modules["__main__"].__dict__, globals())
+
+
+if __name__ == "__main__":
+    unittest.main()
+else:
+    sys.exit(f"__name__ should be __main__, got {__name__}")
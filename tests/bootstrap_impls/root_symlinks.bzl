@@ -0,0 +1,31 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"Rule to add files to the runfiles root with root symlinks, for tests."
+
+def _root_symlinks_impl(ctx):
+    root_symlinks = {}
+    for target, path in ctx.attr.symlinks.items():
+        root_symlinks[path] = target.files.to_list()[0]
+    return [DefaultInfo(runfiles = ctx.runfiles(root_symlinks = root_symlinks))]
+
+root_symlinks = rule(
+    implementation = _root_symlinks_impl,
+    attrs = {
+        "symlinks": attr.label_keyed_string_dict(
+            allow_files = True,
+            doc = "Maps files to their runfiles-root-relative paths.",
+        ),
+    },
+)
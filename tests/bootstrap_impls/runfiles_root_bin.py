@@ -0,0 +1,44 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Prints what the bootstrap set up relative to the runfiles root, so that runs
+# that find the runfiles in different ways can be compared.
+
+import os
+import sys
+
+runfiles_root = os.environ.get("RUNFILES_DIR")
+if not runfiles_root:
+    # Strip the `_manifest` of `.runfiles_manifest` or `/MANIFEST`.
+    runfiles_root = os.environ["RUNFILES_MANIFEST_FILE"][:-9]
+runfiles_root = os.path.normpath(os.path.abspath(runfiles_root))
+
+
+def relative(path):
+    # Runfiles are symlinks, so they aren't resolved.
+    path = os.path.normpath(os.path.abspath(path))
+    if path != runfiles_root and not path.startswith(runfiles_root + os.sep):
+        return None
+    return os.path.relpath(path, runfiles_root)
+
+
+print("main:", relative(__file__))
+print(
+    "RULES_PYTHON_BOOTSTRAP_RUNFILES_ROOT:",
+    os.environ.get("RULES_PYTHON_BOOTSTRAP_RUNFILES_ROOT", "UNSET"),
+)
+for path in sys.path:
+    rel_path = relative(path)
+    if rel_path is not None:
+        print("sys.path:", rel_path)
@@ -0,0 +1,215 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from tests.support import stage2_bootstrap as stage2_bootstrap_loader
+
+stage2_bootstrap = stage2_bootstrap_loader.load()
+
+
+class _SymlinkTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = os.path.realpath(tempfile.mkdtemp(dir=os.environ.get("TEST_TMPDIR")))
+        self.addCleanup(shutil.rmtree, self.tmp)
+        # Runfiles are symlinks to the real files, which may be under a
+        # symlinked directory, like bazel-out.
+        self._write("real/pkg/a.py")
+        self._write("real/pkg/b.py")
+        os.symlink(os.path.join(self.tmp, "real"), os.path.join(self.tmp, "out"))
+        self._symlink("runfiles/_main/pkg/a.py", os.path.join(self.tmp, "out/pkg/a.py"))
+        self._symlink("runfiles/_main/pkg/b.py", os.path.join(self.tmp, "out/pkg/b.py"))
+        self._symlink("runfiles/_main/pkg/d.py", "../../../out/pkg/b.py")
+        self._symlink(
+            "runfiles/_main/pkg/c.py", os.path.join(self.tmp, "runfiles/_main/pkg/a.py")
+        )
+        self._write("runfiles/_main/pkg/generated.py")
+
+    def _path(self, path):
+        return os.path.join(self.tmp, path)
+
+    def _write(self, path, content=""):
+        path = self._path(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def _symlink(self, path, target):
+        path = self._path(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.symlink(target, path)
+        return path
+
+
+class ResolveRunfileTest(_SymlinkTestCase):
+    def test_matches_realpath(self):
+        real_dirs = {}
+        for name in ["a.py", "b.py", "c.py", "d.py", "generated.py", "missing.py"]:
+            path = self._path("runfiles/_main/pkg/" + name)
+            self.assertEqual(
+                stage2_bootstrap._resolve_runfile(path, real_dirs),
+                os.path.realpath(path),
+                name,
+            )
+
+    def test_resolves_each_directory_once(self):
+        real_dirs = {}
+        with mock.patch.object(
+            stage2_bootstrap.os.path, "realpath", wraps=os.path.realpath
+        ) as realpath:
+            for name in ["a.py", "b.py"]:
+                stage2_bootstrap._resolve_runfile(
+                    self._path("runfiles/_main/pkg/" + name), real_dirs
+                )
+        self.assertEqual(realpath.call_count, 1)
+        self.assertEqual(real_dirs, {self._path("out/pkg"): self._path("real/pkg")})
+
+
+class InstrumentedFilePathsTest(_SymlinkTestCase):
+    def test_fast_matches_realpath(self):
+        manifest = self._write(
+            "coverage_manifest",
+            "".join(
+                self._path("runfiles/_main/pkg/" + name) + "\n"
+                for name in ["a.py", "d.py", "generated.py"]
+            ),
+        )
+        with mock.patch.dict(os.environ, {"COVERAGE_MANIFEST": manifest}):
+            fast = list(stage2_bootstrap.instrumented_file_paths(fast=True))
+            slow = list(stage2_bootstrap.instrumented_file_paths())
+        self.assertEqual(fast, slow)
+        # Files that aren't symlinks need no fixing up.
+        self.assertEqual(
+            fast,
+            [
+                (self._path("real/pkg/a.py"), self._path("runfiles/_main/pkg/a.py")),
+                (self._path("real/pkg/b.py"), self._path("runfiles/_main/pkg/d.py")),
+            ],
+        )
+
+
+class _FakeCoverage:
+    """Records the calls the bootstrap makes to `coverage.Coverage`."""
+
+    fail_in = None
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.core_when_started = None
+        self.reported = False
+        _FakeCoverage.instances.append(self)
+        if self.fail_in == "init":
+            raise RuntimeError("init failed")
+
+    def start(self):
+        self.core_when_started = os.environ.get("COVERAGE_CORE")
+        if self.fail_in == "start":
+            raise RuntimeError("start failed")
+
+    def stop(self):
+        pass
+
+    def lcov_report(self, outfile, ignore_errors):
+        self.reported = True
+        with open(outfile, "w") as f:
+            f.write(self.lcov)
+
+
+class MaybeCollectCoverageTest(_SymlinkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.coverage_dir = os.path.dirname(self._write("coverage/.keep"))
+        manifest = self._write(
+            "coverage_manifest", self._path("runfiles/_main/pkg/a.py") + "\n"
+        )
+        self._patch(
+            mock.patch.dict(
+                os.environ,
+                {
+                    "COVERAGE_DIR": self.coverage_dir,
+                    "COVERAGE_MANIFEST": manifest,
+                    "RULES_PYTHON_FAST_COVERAGE": "1",
+                },
+            )
+        )
+        os.environ.pop("COVERAGE_CORE", None)
+        os.environ.pop("RULES_PYTHON_COVERAGE_RAW_DATA", None)
+
+        coverage_module = types.ModuleType("coverage")
+        coverage_module.Coverage = _FakeCoverage
+        coverage_module.env = types.SimpleNamespace(
+            PYBEHAVIOR=types.SimpleNamespace(pep669=True, branch_right_left=True)
+        )
+        self._patch(mock.patch.dict(sys.modules, {"coverage": coverage_module}))
+        self._patch(mock.patch.object(_FakeCoverage, "instances", []))
+        self._patch(
+            mock.patch.object(
+                _FakeCoverage,
+                "lcov",
+                "SF:{}\nDA:1,1\nend_of_record\n".format(self._path("real/pkg/a.py")),
+                create=True,
+            )
+        )
+
+    def _patch(self, patcher):
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _collect(self):
+        with stage2_bootstrap._maybe_collect_coverage(enable=True):
+            self.assertNotIn("COVERAGE_CORE", os.environ)
+
+    def test_fast_coverage(self):
+        self._collect()
+        (cov,) = _FakeCoverage.instances
+        self.assertEqual(cov.core_when_started, "sysmon")
+        self.assertTrue(cov.reported)
+        self.assertNotIn("COVERAGE_CORE", os.environ)
+        with open(os.path.join(self.coverage_dir, "pylcov.dat")) as f:
+            self.assertEqual(
+                f.read(),
+                "SF:{}\nDA:1,1\nend_of_record\n".format(
+                    self._path("runfiles/_main/pkg/a.py")
+                ),
+            )
+        # The rc file was removed.
+        self.assertEqual(sorted(os.listdir(self.coverage_dir)), [".keep", "pylcov.dat"])
+
+    def test_keeps_coverage_core_set_by_user(self):
+        os.environ["COVERAGE_CORE"] = "ctrace"
+        with stage2_bootstrap._maybe_collect_coverage(enable=True):
+            pass
+        (cov,) = _FakeCoverage.instances
+        self.assertEqual(cov.core_when_started, "ctrace")
+        self.assertEqual(os.environ["COVERAGE_CORE"], "ctrace")
+
+    def test_restores_environment_if_coverage_fails_to_start(self):
+        for fail_in in ["init", "start"]:
+            with mock.patch.object(_FakeCoverage, "fail_in", fail_in):
+                with self.assertRaisesRegex(RuntimeError, fail_in):
+                    self._collect()
+                self.assertNotIn("COVERAGE_CORE", os.environ)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import signal
+import sys
+import time
+
+command = sys.argv[1]
+if command == "exit":
+    sys.exit(int(sys.argv[2]))
+elif command == "pid":
+    print(os.getpid())
+elif command == "open_files":
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            print(os.readlink(os.path.join("/proc/self/fd", fd)))
+        except OSError:
+            pass
+elif command == "wait_for_signal":
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(42))
+    # Tell the test that the handler is installed.
+    open(sys.argv[2], "w").close()
+    time.sleep(60)
+    sys.exit("timed out waiting for SIGTERM")
+else:
+    sys.exit(f"unknown command: {command}")
@@ -12,10 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import json
 import os
+import shutil
 import tempfile
+import threading
 import unittest
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
+from unittest import mock
 
 from python.runfiles import runfiles
 from python.runfiles.runfiles import _RepositoryMapping
@@ -218,6 +223,208 @@ class RunfilesTest(unittest.TestCase):
             else:
                 self.assertEqual(r.Rlocation("/foo"), "/foo")
 
+    def testLazyManifestBasedRlocationMatchesEager(self) -> None:
+        with _MockFile(
+            contents=[
+                " Foo\\sBar\\bDir\\nNewline/runfile5 F:\\bActual Path\\bwith\\nnewline/runfile5",
+                "Foo/Bar/Dir E:\\Actual Path\\Directory",
+                "Foo/Bar/runfile3 D:\\the path\\run file 3.txt",
+                "Foo/dup first",
+                "Foo/dup second",
+                "Foo/runfile1 ",
+                "Foo/runfile2 C:/Actual Path\\runfile2",
+                "_repo_mapping /does/not/exist",
+            ]
+        ) as mf:
+            eager = runfiles.CreateManifestBased(mf.Path())
+            lazy = runfiles.CreateManifestBased(mf.Path(), lazy=True)
+            for path in [
+                "Foo/runfile1",
+                "Foo/runfile2",
+                "Foo/Bar/runfile3",
+                "Foo/Bar/Dir",
+                "Foo/Bar/Dir/runfile4",
+                "Foo/Bar/Dir/Deeply/Nested/runfile4",
+                "Foo Bar\\Dir\nNewline/runfile5",
+                "Foo/dup",
+                "Foo",
+                "Foo/Bar",
+                "Foo/runfile",
+                "Foo/runfile10",
+                "A",
+                "zzz",
+                "unknown",
+            ]:
+                self.assertEqual(lazy.Rlocation(path), eager.Rlocation(path), path)
+            self.assertEqual(lazy.Rlocation("Foo/dup"), "second")
+            self.assertEqual(lazy.EnvVars(), eager.EnvVars())
+
+        with _MockFile(contents=[]) as mf:
+            r = runfiles.CreateManifestBased(mf.Path(), lazy=True)
+            self.assertIsNone(r.Rlocation("foo"))
+
+    def testIndexedManifestBasedRlocationMatchesEager(self) -> None:
+        with _MockFile(
+            contents=[
+                "Foo/runfile2 C:/Actual Path\\runfile2",
+                "Foo/runfile1 ",
+                "Foo/Bar/Dir E:\\Actual Path\\Directory",
+                " Foo\\sBar\\bDir\\nNewline/runfile5 F:\\bActual Path\\bwith\\nnewline/runfile5",
+                "Foo/dup first",
+                "Foo/dup second",
+            ]
+        ) as mf:
+            index_dir = tempfile.mkdtemp(dir=os.environ.get("TEST_TMPDIR"))
+            self.addCleanup(shutil.rmtree, index_dir)
+            with mock.patch.dict(os.environ, {"RUNFILES_INDEX_DIR": index_dir}):
+                eager = runfiles.CreateManifestBased(mf.Path())
+                # The first instance builds the index, the second one uses it.
+                cold = runfiles.CreateManifestBased(mf.Path(), index=True)
+                self.assertEqual(len(os.listdir(index_dir)), 1)
+                warm = runfiles.Create(
+                    {
+                        "RUNFILES_MANIFEST_FILE": mf.Path(),
+                        "RUNFILES_MANIFEST_INDEX": "1",
+                    }
+                )
+                assert warm is not None  # mypy doesn't understand the unittest api.
+                # pylint: disable=protected-access
+                assert isinstance(warm._strategy, runfiles._ManifestBased)
+                self.assertIsInstance(
+                    warm._strategy._runfiles, runfiles._IndexedManifest
+                )
+                # pylint: enable=protected-access
+
+            for path in [
+                "Foo/runfile1",
+                "Foo/runfile2",
+                "Foo/Bar/Dir",
+                "Foo/Bar/Dir/Deeply/Nested/runfile4",
+                "Foo Bar\\Dir\nNewline/runfile5",
+                "Foo/dup",
+                "Foo",
+                "Foo/runfile",
+                "A",
+                "zzz",
+            ]:
+                self.assertEqual(cold.Rlocation(path), eager.Rlocation(path), path)
+                self.assertEqual(warm.Rlocation(path), eager.Rlocation(path), path)
+
+    def testIndexedManifestBasedRebuildsIndexInPlace(self) -> None:
+        with _MockFile(contents=["a/b c/d"]) as mf:
+            index_dir = tempfile.mkdtemp(dir=os.environ.get("TEST_TMPDIR"))
+            self.addCleanup(shutil.rmtree, index_dir)
+            with mock.patch.dict(os.environ, {"RUNFILES_INDEX_DIR": index_dir}):
+                r = runfiles.CreateManifestBased(mf.Path(), index=True)
+                self.assertEqual(r.Rlocation("a/b"), "c/d")
+                index_files = os.listdir(index_dir)
+                self.assertEqual(len(index_files), 1)
+
+                # A rebuilt manifest replaces the index of the old one instead
+                # of adding another index file.
+                with open(mf.Path(), "wt", encoding="utf-8", newline="\n") as f:
+                    f.write("a/b e/f\nx/y z\n")
+                stat = os.stat(mf.Path())
+                os.utime(mf.Path(), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+                for _ in range(2):
+                    r = runfiles.CreateManifestBased(mf.Path(), index=True)
+                    self.assertEqual(r.Rlocation("a/b"), "e/f")
+                    self.assertEqual(r.Rlocation("x/y"), "z")
+                    self.assertEqual(os.listdir(index_dir), index_files)
+
+    def testIndexedManifestBasedFallsBackIfIndexCannotBeWritten(self) -> None:
+        with _MockFile(contents=["a/b c/d"]) as mf, _MockFile() as not_a_dir:
+            with mock.patch.dict(os.environ, {"RUNFILES_INDEX_DIR": not_a_dir.Path()}):
+                r = runfiles.CreateManifestBased(mf.Path(), index=True)
+            self.assertEqual(r.Rlocation("a/b"), "c/d")
+            self.assertIsNone(r.Rlocation("foo"))
+
+    def testCreateAsyncSharesInFlightLoad(self) -> None:
+        with _MockFile(contents=["a/b c/d"]) as mf:
+            env = {"RUNFILES_MANIFEST_FILE": mf.Path()}
+
+            async def CreateConcurrently() -> List[Optional[runfiles.Runfiles]]:
+                return list(
+                    await asyncio.gather(
+                        runfiles.CreateAsync(env), runfiles.CreateAsync(env)
+                    )
+                )
+
+            with mock.patch.object(
+                runfiles.Runfiles, "Create", wraps=runfiles.Runfiles.Create
+            ) as create:
+                first, second = asyncio.run(CreateConcurrently())
+                self.assertEqual(create.call_count, 1)
+            self.assertIs(first, second)
+            assert first is not None  # mypy doesn't understand the unittest api.
+            self.assertEqual(first.Rlocation("a/b"), "c/d")
+            # pylint: disable-next=protected-access
+            self.assertEqual(runfiles._pending_async_creates, {})
+
+        self.assertIsNone(asyncio.run(runfiles.CreateAsync({"FOO": "bar"})))
+
+        def _Run():
+            asyncio.run(
+                runfiles.CreateAsync({"RUNFILES_MANIFEST_FILE": "non-existing path"})
+            )
+
+        self.assertRaisesRegex(IOError, "non-existing path", _Run)
+
+    def testDefaultIsSharedPerEnvironment(self) -> None:
+        runfiles.ClearDefault()
+        self.addCleanup(runfiles.ClearDefault)
+        with _MockFile(contents=["a/b c/d"]) as mf:
+            with mock.patch.dict(
+                os.environ, {"RUNFILES_MANIFEST_FILE": mf.Path()}, clear=True
+            ):
+                first = runfiles.Default()
+                assert first is not None  # mypy doesn't understand the unittest api.
+                self.assertEqual(first.Rlocation("a/b"), "c/d")
+                self.assertIs(runfiles.Default(), first)
+
+                os.environ["RUNFILES_MANIFEST_FILE"] = ""
+                os.environ["RUNFILES_DIR"] = "whatever"
+                other = runfiles.Default()
+                self.assertIsNot(other, first)
+                self.assertIs(runfiles.Default(), other)
+
+                os.environ["RUNFILES_MANIFEST_FILE"] = mf.Path()
+                del os.environ["RUNFILES_DIR"]
+                self.assertIs(runfiles.Default(), first)
+                runfiles.ClearDefault()
+                self.assertIsNot(runfiles.Default(), first)
+
+            with mock.patch.dict(os.environ, {}, clear=True):
+                self.assertIsNone(runfiles.Default())
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+    def testDefaultIsInheritedByForkedProcesses(self) -> None:
+        runfiles.ClearDefault()
+        self.addCleanup(runfiles.ClearDefault)
+        with _MockFile(contents=["a/b c/d"]) as mf:
+            with mock.patch.dict(
+                os.environ, {"RUNFILES_MANIFEST_FILE": mf.Path()}, clear=True
+            ):
+                parent = runfiles.Default()
+                assert parent is not None  # mypy doesn't understand the unittest api.
+                pid = os.fork()
+                if pid == 0:
+                    # The child must reuse the parent's instance without
+                    # creating a new one.
+                    code = 1
+                    try:
+                        with mock.patch.object(
+                            runfiles.Runfiles, "Create", side_effect=AssertionError
+                        ):
+                            child = runfiles.Default()
+                            if child is parent and child.Rlocation("a/b") == "c/d":
+                                code = 0
+                    finally:
+                        os._exit(code)  # pylint: disable=protected-access
+                _, status = os.waitpid(pid, 0)
+                self.assertTrue(os.WIFEXITED(status))
+                self.assertEqual(os.WEXITSTATUS(status), 0)
+
     def testManifestBasedRlocationWithRepoMappingFromMain(self) -> None:
         with _MockFile(
             contents=[
@@ -387,6 +594,32 @@ class RunfilesTest(unittest.TestCase):
         else:
             self.assertEqual(r.Rlocation("/foo"), "/foo")
 
+    def testDirectoryBasedRlocationWithExistenceCheck(self) -> None:
+        root = tempfile.mkdtemp(dir=os.environ.get("TEST_TMPDIR"))
+        self.addCleanup(shutil.rmtree, root)
+        os.makedirs(os.path.join(root, "foo", "bar"))
+        for name in ["a.txt", "b.txt"]:
+            with open(os.path.join(root, "foo", "bar", name), "w"):
+                pass
+
+        r = runfiles.CreateDirectoryBased(root, check_exists=True)
+        with mock.patch.object(os, "scandir", wraps=os.scandir) as scandir:
+            self.assertEqual(r.Rlocation("foo/bar/a.txt"), root + "/foo/bar/a.txt")
+            self.assertEqual(r.Rlocation("foo/bar/b.txt"), root + "/foo/bar/b.txt")
+            self.assertIsNone(r.Rlocation("foo/bar/c.txt"))
+            self.assertEqual(scandir.call_count, 1)
+
+            self.assertEqual(r.Rlocation("foo/bar"), root + "/foo/bar")
+            self.assertIsNone(r.Rlocation("foo/baz/a.txt"))
+            self.assertIsNone(r.Rlocation("foo/bar/a.txt/x"))
+            self.assertEqual(
+                list(r.RlocationBatch(["foo/bar/a.txt", "foo/qux"], "")),
+                [root + "/foo/bar/a.txt", None],
+            )
+
+        r = runfiles.CreateDirectoryBased(root)
+        self.assertEqual(r.Rlocation("foo/bar/c.txt"), root + "/foo/bar/c.txt")
+
     def testDirectoryBasedRlocationWithRepoMappingFromMain(self) -> None:
         with _MockFile(
             name="_repo_mapping",
@@ -673,6 +906,23 @@ class RunfilesTest(unittest.TestCase):
             "external_dep~exact",
         )
 
+        # Test that the first matching prefix wins, even if a longer one matches
+        ordered_mapping = _RepositoryMapping(
+            {},
+            {
+                ("deps+", "lib"): "lib~general",
+                ("deps+specific+", "lib"): "lib~specific",
+                ("deps+specific+repo", "lib"): "lib~very_specific",
+                ("other+", "lib"): "lib~other",
+            },
+        )
+        self.assertEqual(
+            ordered_mapping.lookup("deps+specific+repo", "lib"), "lib~general"
+        )
+        self.assertEqual(ordered_mapping.lookup("other+repo", "lib"), "lib~other")
+        self.assertIsNone(ordered_mapping.lookup("deps", "lib"))
+        self.assertIsNone(ordered_mapping.lookup("other+repo", "other_lib"))
+
         # Test non-existent mapping
         self.assertIsNone(repo_mapping.lookup("nonexistent", "repo"))
         self.assertIsNone(repo_mapping.lookup("unknown+repo", "missing"))
@@ -696,6 +946,185 @@ class RunfilesTest(unittest.TestCase):
         assert r is not None  # mypy doesn't understand the unittest api.
         self.assertEqual(r.CurrentRepository(), expected)
 
+    def testCurrentRepositoryIsCached(self) -> None:
+        r = runfiles.Create({"RUNFILES_DIR": "whatever"})
+        assert r is not None  # mypy doesn't understand the unittest api.
+        first = r.CurrentRepository()
+        self.assertEqual(r.CurrentRepository(), first)
+        # pylint: disable-next=protected-access
+        self.assertEqual(r._caller_repositories, {__file__: first})
+
+    def testCurrentRepositoryCacheEvictionIsThreadSafe(self) -> None:
+        r = runfiles.Create({"RUNFILES_DIR": "whatever"})
+        assert r is not None  # mypy doesn't understand the unittest api.
+        # pylint: disable-next=protected-access
+        root = r._python_runfiles_root
+        callers = []
+        for i in range(64):
+            namespace: Dict[str, Any] = {}
+            exec(  # pylint: disable=exec-used
+                compile(
+                    "def caller(r):\n    return r.CurrentRepository()\n",
+                    os.path.join(root, "repo{}".format(i), "caller.py"),
+                    "exec",
+                ),
+                namespace,
+            )
+            callers.append((namespace["caller"], "repo{}".format(i)))
+
+        errors: List[BaseException] = []
+
+        def _Lookup() -> None:
+            try:
+                for _ in range(200):
+                    for caller, expected in callers:
+                        self.assertEqual(caller(r), expected)
+            except BaseException as e:  # pylint: disable=broad-exception-caught
+                errors.append(e)
+
+        with mock.patch.object(runfiles, "_MAX_CACHED_CALLER_REPOSITORIES", 4):
+            threads = [threading.Thread(target=_Lookup) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(errors, [])
+        # pylint: disable-next=protected-access
+        self.assertLessEqual(len(r._caller_repositories), 4 + len(threads))
+
+    def testRlocationMany(self) -> None:
+        with _MockFile(
+            contents=[
+                ",my_module,_main",
+                ",my_protobuf,protobuf~3.19.2",
+                "protobuf~3.19.2,protobuf,protobuf~3.19.2",
+            ]
+        ) as rm, _MockFile(
+            contents=[
+                "_repo_mapping " + rm.Path(),
+                "_main/bar/runfile /the/path/to/runfile",
+                "protobuf~3.19.2/bar/dir E:\\Actual Path\\Directory",
+            ],
+        ) as mf:
+            r = runfiles.CreateManifestBased(mf.Path())
+            self.assertEqual(
+                r.RlocationMany(
+                    [
+                        "my_module/bar/runfile",
+                        "my_protobuf/bar/dir/file",
+                        "protobuf/bar/dir/file",
+                        "unknown",
+                    ],
+                    "",
+                ),
+                [
+                    "/the/path/to/runfile",
+                    "E:\\Actual Path\\Directory/file",
+                    None,
+                    None,
+                ],
+            )
+            self.assertEqual(
+                r.RlocationMany(
+                    ["protobuf/bar/dir/file", "my_protobuf/bar/dir/file"],
+                    "protobuf~3.19.2",
+                ),
+                ["E:\\Actual Path\\Directory/file", None],
+            )
+            self.assertEqual(r.RlocationMany([], ""), [])
+            self.assertRaises(ValueError, lambda: r.RlocationMany(["../foo"], ""))
+
+    def testRlocationBatch(self) -> None:
+        with _MockFile(
+            contents=[
+                "Foo/runfile1 ",
+                "Foo/runfile2 C:/Actual Path\\runfile2",
+                "Foo/Bar/Dir E:\\Actual Path\\Directory",
+                "Foo/Bar/Dir/Sub/Dir F:\\Other Directory",
+            ]
+        ) as mf:
+            r = runfiles.CreateManifestBased(mf.Path())
+            paths = [
+                "Foo/runfile1",
+                "Foo/runfile2",
+                "Foo/Bar/Dir",
+                "Foo/Bar/Dir/runfile4",
+                "Foo/Bar/Dir/Deeply/Nested/runfile4",
+                "Foo/Bar/Dir/Deeply/Nested/runfile5",
+                "Foo/Bar/Dir/Sub/Dir/runfile6",
+                "Foo/Bar/Dir/Sub/runfile7",
+                "Foo/Bar/runfile8",
+                "unknown",
+                "/foo" if not RunfilesTest.IsWindows() else "c:/foo",
+            ]
+            results = r.RlocationBatch(iter(paths), "")
+            self.assertNotIsInstance(results, list)
+            self.assertEqual(list(results), [r.Rlocation(path, "") for path in paths])
+            self.assertEqual(
+                list(r.RlocationBatch(paths[3:6], "")),
+                [
+                    "E:\\Actual Path\\Directory/runfile4",
+                    "E:\\Actual Path\\Directory/Deeply/Nested/runfile4",
+                    "E:\\Actual Path\\Directory/Deeply/Nested/runfile5",
+                ],
+            )
+            self.assertRaises(
+                ValueError, lambda: list(r.RlocationBatch(["foo//bar"], ""))
+            )
+
+        r = runfiles.CreateDirectoryBased("foo/bar baz//qux/")
+        self.assertEqual(
+            list(r.RlocationBatch(["arg", "a/b"], "")),
+            ["foo/bar baz//qux/arg", "foo/bar baz//qux/a/b"],
+        )
+
+    def testProfileCountsLookups(self) -> None:
+        with _MockFile(contents=[",my_module,_main"]) as rm, _MockFile(
+            contents=[
+                "_repo_mapping " + rm.Path(),
+                "_main/bar/runfile /the/path/to/runfile",
+                "_main/bar/dir /the/path/to/dir",
+            ],
+        ) as mf:
+            r = runfiles.CreateManifestBased(mf.Path())
+            profile = runfiles._RunfilesProfile()
+            profile.Instrument(r)
+
+            self.assertEqual(
+                r.Rlocation("my_module/bar/runfile", ""), "/the/path/to/runfile"
+            )
+            self.assertEqual(
+                r.Rlocation("_main/bar/dir/file", ""), "/the/path/to/dir/file"
+            )
+            self.assertIsNone(r.Rlocation("my_module/unknown", ""))
+            self.assertEqual(
+                r.RlocationMany(["_main/bar/dir/a", "_main/bar/dir/b"], ""),
+                ["/the/path/to/dir/a", "/the/path/to/dir/b"],
+            )
+            self.assertRaises(ValueError, lambda: r.Rlocation("../foo"))
+
+            counters = dict(profile.counters)
+            self.assertGreater(counters.pop("rlocation_seconds"), 0)
+            self.assertEqual(
+                counters,
+                {
+                    "runfiles_created": 1,
+                    "rlocation_calls": 4,
+                    "lookups": 5,
+                    "lookup_misses": 1,
+                    "prefix_fallback_hits": 3,
+                    "repo_mapping_hits": 2,
+                    "repo_mapping_misses": 3,
+                },
+            )
+
+            output = os.path.join(os.path.dirname(mf.Path()), "profile.json")
+            with mock.patch.dict(os.environ, {"RUNFILES_PROFILE_OUTPUT": output}):
+                profile.Dump()
+            with open(output, encoding="utf-8") as f:
+                self.assertEqual(json.load(f)["rlocation_calls"], 4)
+            os.remove(output)
+
     @staticmethod
     def IsWindows() -> bool:
         return os.name == "nt"
@@ -0,0 +1,40 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Loads the stage 2 bootstrap template so tests can call its functions."""
+
+import importlib.util
+import os
+import sys
+from unittest import mock
+
+from python.runfiles import runfiles
+
+
+def load():
+    """Imports the stage 2 bootstrap template without running a program.
+
+    Returns:
+        The template as a module.
+    """
+    path = runfiles.Create().Rlocation(
+        "rules_python/python/private/stage2_bootstrap_template.py"
+    )
+    spec = importlib.util.spec_from_file_location("stage2_bootstrap", path)
+    module = importlib.util.module_from_spec(spec)
+    # Importing it changes sys.path and the environment for the program it
+    # would run.
+    with mock.patch.object(sys, "path", list(sys.path)), mock.patch.dict(os.environ):
+        spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,169 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from tests.support import stage2_bootstrap as stage2_bootstrap_loader
+from tools.coverage_merger import coverage_merger
+
+try:
+    coverage = coverage_merger._import_coverage()
+except ImportError:
+    # Only available if the toolchain has a coverage tool and the test runs
+    # with `bazel coverage`, or if coverage is installed.
+    coverage = None
+
+
+class FindDataFilesTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp(dir=os.environ.get("TEST_TMPDIR"))
+        self.extract_dir = os.path.join(self.tmp, "extracted")
+        os.mkdir(self.extract_dir)
+
+    def _write(self, path, content):
+        path = os.path.join(self.tmp, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def _read_all(self, paths):
+        contents = []
+        for path in paths:
+            with open(path) as f:
+                contents.append(f.read())
+        return contents
+
+    def test_data_file(self):
+        path = self._write("pycoverage-1.db", "a")
+        self.assertEqual(
+            coverage_merger.find_data_files([path], self.extract_dir), [path]
+        )
+
+    def test_directory(self):
+        self._write("testlogs/b/test.outputs/pycoverage-2.db", "b")
+        self._write("testlogs/a/test.outputs/pycoverage-1.db", "a")
+        self._write("testlogs/a/test.outputs/other.db", "other")
+        self._write("testlogs/a/coverage.dat", "lcov")
+
+        got = coverage_merger.find_data_files(
+            [os.path.join(self.tmp, "testlogs")], self.extract_dir
+        )
+        self.assertEqual(self._read_all(got), ["a", "b"])
+
+    def test_undeclared_outputs_zips(self):
+        for shard in ("shard_1_of_2", "shard_2_of_2"):
+            path = os.path.join(self.tmp, "testlogs", shard, "test.outputs")
+            os.makedirs(path)
+            with zipfile.ZipFile(os.path.join(path, "outputs.zip"), "w") as zf:
+                zf.writestr("pycoverage-1.db", shard)
+                zf.writestr("other.txt", "other")
+
+        got = coverage_merger.find_data_files(
+            [os.path.join(self.tmp, "testlogs")], self.extract_dir
+        )
+        self.assertEqual(self._read_all(got), ["shard_1_of_2", "shard_2_of_2"])
+        for path in got:
+            self.assertEqual(os.path.dirname(path), self.extract_dir)
+
+
+class SplitTest(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(
+            coverage_merger._split([1, 2, 3, 4, 5], 2), [[1, 2, 3], [4, 5]]
+        )
+        self.assertEqual(coverage_merger._split([1, 2], 4), [[1], [2]])
+        self.assertEqual(coverage_merger._split([], 4), [])
+
+
+_MODULE_SOURCE = """\
+def branch(x):
+    if x:
+        return "yes"
+    return "no"
+"""
+
+
+@unittest.skipIf(coverage is None, "the coverage library isn't available")
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = os.path.realpath(tempfile.mkdtemp(dir=os.environ.get("TEST_TMPDIR")))
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.source_root = os.path.join(self.tmp, "src")
+        self.outputs_dir = os.path.join(self.tmp, "outputs")
+        os.makedirs(os.path.join(self.source_root, "pkg"))
+        os.mkdir(self.outputs_dir)
+        # The file the test measures is a symlink to the real file, as for
+        # runfiles.
+        self.real_path = os.path.join(self.tmp, "real", "mod.py")
+        os.mkdir(os.path.dirname(self.real_path))
+        with open(self.real_path, "w") as f:
+            f.write(_MODULE_SOURCE)
+        shutil.copy(self.real_path, os.path.join(self.source_root, "pkg", "mod.py"))
+        self.stage2_bootstrap = stage2_bootstrap_loader.load()
+
+    def _run_test(self, arg, unique_id):
+        """Measures a call of `branch(arg)` and saves the raw data like a test."""
+        code = compile(_MODULE_SOURCE, self.real_path, "exec")
+        namespace = {}
+        cov = coverage.Coverage(
+            data_file=None, branch=True, include=[self.real_path], config_file=False
+        )
+        cov.start()
+        try:
+            exec(code, namespace)
+            namespace["branch"](arg)
+        finally:
+            cov.stop()
+        with mock.patch.dict(
+            os.environ, {"TEST_UNDECLARED_OUTPUTS_DIR": self.outputs_dir}
+        ):
+            self.stage2_bootstrap._save_raw_coverage_data(
+                cov, {self.real_path: "pkg/mod.py"}, unique_id
+            )
+
+    def test_merge(self):
+        self._run_test(True, "1")
+        self._run_test(False, "2")
+        data_files = coverage_merger.find_data_files(
+            [self.outputs_dir], os.path.join(self.tmp, "extracted")
+        )
+        self.assertEqual(
+            [os.path.basename(path) for path in data_files],
+            ["pycoverage-1.db", "pycoverage-2.db"],
+        )
+
+        output = os.path.join(self.tmp, "coverage.dat")
+        work_dir = os.path.join(self.tmp, "work")
+        os.mkdir(work_dir)
+        cwd = os.getcwd()
+        os.chdir(self.source_root)
+        try:
+            coverage_merger.merge(data_files, output, jobs=2, work_dir=work_dir)
+        finally:
+            os.chdir(cwd)
+
+        with open(output) as f:
+            records = f.read().splitlines()
+        self.assertEqual(
+            [line for line in records if line.startswith("SF:")], ["SF:pkg/mod.py"]
+        )
+        self.assertEqual(records[-1], "end_of_record")
+        # Together, the two runs executed every line and took both branches.
+        lines = {}
+        for line in records:
+            if line.startswith("DA:"):
+                number, count = line[3:].split(",")[:2]
+                lines[int(number)] = int(count)
+        self.assertEqual(lines, {1: 1, 2: 1, 3: 1, 4: 1})
+        branches = [line[5:].split(",") for line in records if line.startswith("BRDA:")]
+        self.assertEqual([int(branch[0]) for branch in branches], [2, 2])
+        self.assertEqual([branch[-1] for branch in branches], ["1", "1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
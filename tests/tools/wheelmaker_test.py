@@ -1,4 +1,8 @@
+import os
+import tempfile
 import unittest
+import zipfile
+from unittest import mock
 
 import tools.wheelmaker as wheelmaker
 
@@ -34,5 +38,289 @@ class ArcNameFromTest(unittest.TestCase):
                 self.assertEqual(got, want)
 
 
+class ExpandRequiresDistTest(unittest.TestCase):
+    def write_requirements(self, contents):
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as f:
+            f.write(contents)
+        return path
+
+    def test_requirements_file(self):
+        reqs = self.write_requirements(
+            "# A comment\n"
+            "-r other.txt\n"
+            "\n"
+            "foo[b,a]>=1.0  # pinned\n"
+            "bar; python_version < '3.10'\n"
+        )
+        empty = self.write_requirements("# Nothing\n")
+        metadata = (
+            "Metadata-Version: 2.1\r\n"
+            f"Requires-Dist: @{reqs}\r\n"
+            f"Requires-Dist: @{empty}; extra == 'empty'\r\n"
+            f"Requires-Dist: @{reqs}; extra == 'test'\r\n"
+            "Requires-Dist: baz\r\n"
+            "Provides-Extra: test\r\n"
+        )
+        self.assertEqual(
+            wheelmaker.expand_requires_dist(metadata),
+            "Metadata-Version: 2.1\r\n"
+            "Requires-Dist: foo[a,b]>=1.0\n"
+            'Requires-Dist: bar; python_version < "3.10"\r\n'
+            "Requires-Dist: foo[a,b]>=1.0; extra == 'test'\n"
+            "Requires-Dist: bar; (python_version < \"3.10\") and extra == 'test'\r\n"
+            "Requires-Dist: baz\r\n"
+            "Provides-Extra: test\r\n",
+        )
+
+    def test_requirement_with_marker(self):
+        self.assertEqual(
+            wheelmaker.expand_requires_dist(
+                "Requires-Dist: foo >= 1.0 ; python_version<'3.10'\n"
+            ),
+            "Requires-Dist: foo>=1.0; python_version<'3.10'\n",
+        )
+
+
+class _WheelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        # Package filename to the path of the file with its contents.
+        self.files = {}
+
+    def write_file(self, name, contents):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "wb") as f:
+            f.write(contents)
+        self.files[f"mylib/{name}"] = path
+
+    def build(self, name, *, compress=True, **kwargs):
+        out = os.path.join(self.tmpdir.name, name)
+        with wheelmaker.WheelMaker(
+            name="mylib",
+            version="1.0.0",
+            build_tag="",
+            python_tag="py3",
+            abi="none",
+            platform="any",
+            compress=compress,
+            outfile=out,
+            **kwargs,
+        ) as maker:
+            for package_filename, path in sorted(self.files.items()):
+                maker.add_file(package_filename, path)
+            maker.add_wheelfile()
+            maker.add_metadata("Name: mylib\n", name="mylib", description=None)
+            maker.add_recordfile()
+        with open(out, "rb") as f:
+            return out, f.read()
+
+    def build_previous(self, name, **kwargs):
+        """Builds a wheel that records its settings, for use as a previous wheel."""
+        missing = os.path.join(self.tmpdir.name, "missing.whl")
+        return self.build(name, previous_wheel=missing, **kwargs)
+
+
+class PreviousWheelTest(_WheelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_file("a.py", b"# a.py\n" * 100)
+        self.write_file("b.py", b"# b.py\n" * 100)
+        self.write_file("empty.py", b"")
+
+    def test_unchanged_members_are_copied(self):
+        previous, want = self.build_previous("previous.whl")
+        with open(self.files["mylib/b.py"], "a") as f:
+            f.write("# changed\n")
+        _, want = self.build("fresh.whl")
+
+        with mock.patch.object(
+            wheelmaker._WhlFile,
+            "open",
+            autospec=True,
+            side_effect=zipfile.ZipFile.open,
+        ) as mock_open:
+            _, got = self.build("incremental.whl", previous_wheel=previous)
+
+        self.assertEqual(got, want)
+        # Of the added files, only the changed one is compressed again.
+        written = [
+            call.args[1].filename
+            for call in mock_open.call_args_list
+            if call.args[1].filename.startswith("mylib/")
+        ]
+        self.assertEqual(written, ["mylib/b.py"])
+
+    def test_members_with_other_compression_are_not_copied(self):
+        previous, _ = self.build_previous("previous.whl", compress=False)
+        _, want = self.build("fresh.whl")
+        _, got = self.build("incremental.whl", previous_wheel=previous)
+        self.assertEqual(got, want)
+
+    def test_members_of_wheel_with_other_settings_are_not_copied(self):
+        self.write_file("data.npz", b"\0" * 1000)
+        for previous_settings, settings in [
+            ({"compress_level": 1}, {"compress_level": 9}),
+            (
+                {"compression_policy": [("*.npz", "auto")], "auto_min_savings": 10},
+                {"compression_policy": [("*.npz", "auto")], "auto_min_savings": 100},
+            ),
+            ({"compression_policy": [("*.npz", "auto")]}, {}),
+        ]:
+            with self.subTest(previous=previous_settings, now=settings):
+                previous, _ = self.build_previous("previous.whl", **previous_settings)
+                _, want = self.build("fresh.whl", **settings)
+                with mock.patch.object(
+                    wheelmaker._WhlFile, "_open_previous", autospec=True
+                ) as mock_open_previous:
+                    _, got = self.build(
+                        "incremental.whl", previous_wheel=previous, **settings
+                    )
+                self.assertEqual(got, want)
+                mock_open_previous.assert_not_called()
+
+    def test_members_of_wheel_without_settings_are_not_copied(self):
+        previous, _ = self.build("previous.whl")
+        with mock.patch.object(
+            wheelmaker._WhlFile, "_open_previous", autospec=True
+        ) as mock_open_previous:
+            out, _ = self.build("incremental.whl", previous_wheel=previous)
+        mock_open_previous.assert_not_called()
+        # The settings are recorded for the next build.
+        self.assertTrue(os.path.exists(out + ".settings.json"))
+
+    def test_keep_previous_compression(self):
+        previous, _ = self.build("previous.whl", compress=False)
+        with open(self.files["mylib/b.py"], "a") as f:
+            f.write("# changed\n")
+        out = os.path.join(self.tmpdir.name, "repacked.whl")
+        with wheelmaker._WhlFile(
+            out,
+            mode="w",
+            distribution_prefix="mylib-1.0.0",
+            previous_wheel=previous,
+            keep_previous_compression=True,
+        ) as whl:
+            for package_filename, path in sorted(self.files.items()):
+                whl.add_file(package_filename, path)
+            whl.add_recordfile()
+        with zipfile.ZipFile(out) as zf:
+            self.assertIsNone(zf.testzip())
+            compress_types = {
+                zinfo.filename: zinfo.compress_type
+                for zinfo in zf.infolist()
+                if zinfo.filename.startswith("mylib/")
+            }
+        self.assertEqual(
+            compress_types,
+            {
+                "mylib/a.py": zipfile.ZIP_STORED,
+                "mylib/b.py": zipfile.ZIP_DEFLATED,
+                "mylib/empty.py": zipfile.ZIP_STORED,
+            },
+        )
+
+    def test_previous_wheel_must_not_be_output(self):
+        previous, _ = self.build("previous.whl")
+        with self.assertRaises(ValueError):
+            self.build("previous.whl", previous_wheel=previous)
+
+
+class RecordTest(_WheelTestCase):
+    def test_record_spooled_to_disk(self):
+        self.write_file("a.py", b"a")
+        self.write_file("with,comma.py", b"")
+        with mock.patch.object(wheelmaker, "_RECORD_SPOOL_SIZE", 1):
+            out, _ = self.build("spooled.whl")
+        with zipfile.ZipFile(out) as zf:
+            record = zf.read("mylib-1.0.0.dist-info/RECORD").decode("utf-8")
+        lines = record.splitlines()
+        self.assertEqual(
+            lines[:2],
+            [
+                "mylib/a.py,sha256=ypeBEsobvcr6wjGzmiPcTaeG7_gUfE5yuYB3ha_uSLs,1",
+                '"mylib/with,comma.py",'
+                + "sha256=47DEQpj8HBSa-_TImW-5JCeuQeRkm5NMpJWZG3hSuFU,0",
+            ],
+        )
+        self.assertEqual(lines[-1], "mylib-1.0.0.dist-info/RECORD,,")
+        self.assertTrue(record.endswith("\n"))
+
+
+class CompressionPolicyTest(_WheelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_file("a.py", b"# a.py\n" * 100)
+        self.write_file("ext.so", b"\0" * 1000)
+        self.write_file("compressible.npz", b"\0" * 1000)
+        self.write_file("incompressible.npz", os.urandom(1000))
+
+    def compress_types(self, wheel):
+        with zipfile.ZipFile(wheel) as zf:
+            return {zinfo.filename: zinfo.compress_type for zinfo in zf.infolist()}
+
+    def test_policy(self):
+        wheel, _ = self.build(
+            "policy.whl",
+            compression_policy=[("*.so", "stored"), ("*.npz", "auto")],
+        )
+        self.assertEqual(
+            self.compress_types(wheel),
+            {
+                "mylib/a.py": zipfile.ZIP_DEFLATED,
+                "mylib/compressible.npz": zipfile.ZIP_DEFLATED,
+                "mylib/ext.so": zipfile.ZIP_STORED,
+                "mylib/incompressible.npz": zipfile.ZIP_STORED,
+                "mylib-1.0.0.dist-info/WHEEL": zipfile.ZIP_DEFLATED,
+                "mylib-1.0.0.dist-info/METADATA": zipfile.ZIP_DEFLATED,
+                "mylib-1.0.0.dist-info/RECORD": zipfile.ZIP_DEFLATED,
+            },
+        )
+        with zipfile.ZipFile(wheel) as zf:
+            self.assertIsNone(zf.testzip())
+
+    def test_policy_overrides_no_compress(self):
+        wheel, _ = self.build(
+            "policy.whl", compress=False, compression_policy=[("*.py", "deflated")]
+        )
+        compress_types = self.compress_types(wheel)
+        self.assertEqual(compress_types.pop("mylib/a.py"), zipfile.ZIP_DEFLATED)
+        self.assertEqual(set(compress_types.values()), {zipfile.ZIP_STORED})
+
+    def test_auto_min_savings(self):
+        # Deflating can't save all of a file's size.
+        wheel, _ = self.build(
+            "policy.whl", compression_policy=[("*", "auto")], auto_min_savings=100
+        )
+        self.assertEqual(self.compress_types(wheel)["mylib/a.py"], zipfile.ZIP_STORED)
+
+    def test_compress_level(self):
+        wheel, _ = self.build("level.whl", compress_level=0)
+        with zipfile.ZipFile(wheel) as zf:
+            zinfo = zf.getinfo("mylib/a.py")
+            self.assertEqual(zinfo.compress_type, zipfile.ZIP_DEFLATED)
+            # Level 0 deflate doesn't compress.
+            self.assertGreater(zinfo.compress_size, zinfo.file_size)
+
+    def test_previous_wheel_with_compress_level(self):
+        previous, _ = self.build_previous("previous.whl", compress_level=9)
+        _, want = self.build("fresh.whl", compress_level=9)
+        _, got = self.build(
+            "incremental.whl", compress_level=9, previous_wheel=previous
+        )
+        self.assertEqual(got, want)
+
+    def test_previous_wheel_with_auto(self):
+        policy = [("*.npz", "auto")]
+        previous, _ = self.build_previous("previous.whl", compression_policy=policy)
+        _, want = self.build("fresh.whl", compression_policy=policy)
+        _, got = self.build(
+            "incremental.whl", compression_policy=policy, previous_wheel=previous
+        )
+        self.assertEqual(got, want)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,227 @@
+# Copyright 2025 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Merges raw Python coverage data from many tests into one lcov report.
+
+Tests run with `RULES_PYTHON_COVERAGE_RAW_DATA=1` save their raw coverage data
+instead of converting it to lcov. This combines the data files of all the
+tests (and their shards) in parallel, then converts the result to lcov once,
+splitting the files to report on between processes.
+
+The `coverage` library must be importable, or `PYTHON_COVERAGE` must be set to
+its entry point, as for tests.
+"""
+
+import argparse
+import concurrent.futures
+import fnmatch
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+
+# The names that the stage 2 bootstrap saves raw coverage data with.
+DATA_FILE_PATTERN = "pycoverage-*.db"
+
+# Where Bazel puts the files a test writes to TEST_UNDECLARED_OUTPUTS_DIR.
+_UNDECLARED_OUTPUTS_ZIP = "outputs.zip"
+
+
+def _import_coverage():
+    try:
+        import coverage
+    except ImportError:
+        # The entry point is `<dir>/coverage/__main__.py`.
+        coverage_tool = os.environ.get("PYTHON_COVERAGE")
+        if not coverage_tool:
+            raise
+        sys.path.insert(0, os.path.dirname(os.path.dirname(coverage_tool)))
+        import coverage
+    return coverage
+
+
+def find_data_files(paths, extract_dir):
+    """Finds the raw coverage data files in the given paths.
+
+    Args:
+        paths: list[str], data files, zip files of undeclared test outputs, or
+            directories to search for either, e.g. `bazel-testlogs`.
+        extract_dir: str, the directory to extract data files in zip files to.
+
+    Returns:
+        list[str], the paths of the data files.
+    """
+    data_files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            data_files.extend(_maybe_extract(path, extract_dir))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if fnmatch.fnmatch(name, DATA_FILE_PATTERN) or (
+                    name == _UNDECLARED_OUTPUTS_ZIP
+                ):
+                    data_files.extend(
+                        _maybe_extract(os.path.join(root, name), extract_dir)
+                    )
+    return data_files
+
+
+def _maybe_extract(path, extract_dir):
+    if not path.endswith(".zip"):
+        return [path]
+    extracted = []
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if not fnmatch.fnmatch(os.path.basename(info.filename), DATA_FILE_PATTERN):
+                continue
+            # Every test's outputs have the same names.
+            fd, dest = tempfile.mkstemp(suffix=".db", dir=extract_dir)
+            with zf.open(info) as src, os.fdopen(fd, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            extracted.append(dest)
+    return extracted
+
+
+def _combine(data_files, output):
+    """Combines data files into a new data file. Runs in a worker process."""
+    coverage = _import_coverage()
+    combined = coverage.CoverageData(basename=output)
+    for data_file in data_files:
+        data = coverage.CoverageData(basename=data_file)
+        data.read()
+        combined.update(data)
+    combined.write()
+    return output
+
+
+def _report(data_file, filenames, output):
+    """Writes the lcov report for some of the files. Runs in a worker process."""
+    coverage = _import_coverage()
+    cov = coverage.Coverage(data_file=data_file, config_file=False)
+    cov.set_option("run:relative_files", True)
+    cov.load()
+    try:
+        cov.lcov_report(
+            morfs=filenames,
+            outfile=output,
+            # Sources that can't be read, e.g. ones that were generated in a
+            # temporary directory, are skipped, as they are by tests.
+            ignore_errors=True,
+        )
+    except coverage.CoverageException as e:
+        # None of the files could be reported.
+        print("coverage_merger: {}".format(e), file=sys.stderr)
+        open(output, "w").close()
+    return output
+
+
+def _split(items, count):
+    """Splits a list into up to `count` contiguous, similarly sized parts."""
+    size = max(-(-len(items) // max(count, 1)), 1)
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def merge(data_files, output, jobs, work_dir):
+    """Merges raw coverage data files into one lcov report.
+
+    Args:
+        data_files: list[str], the raw coverage data files.
+        output: str, the lcov file to write.
+        jobs: int, how many processes to use.
+        work_dir: str, a directory for intermediate files.
+    """
+    coverage = _import_coverage()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, initializer=_import_coverage
+    ) as executor:
+        # Each process combines some of the data files, and then their results
+        # are combined.
+        partials = [
+            executor.submit(
+                _combine, part, os.path.join(work_dir, "partial-{}.db".format(i))
+            )
+            for i, part in enumerate(_split(data_files, jobs))
+        ]
+        combined_path = _combine(
+            [partial.result() for partial in partials],
+            os.path.join(work_dir, "combined.db"),
+        )
+        combined = coverage.CoverageData(basename=combined_path)
+        combined.read()
+
+        # Each process reports on some of the files, and the reports are
+        # concatenated, since lcov has a separate record for each file.
+        reports = [
+            executor.submit(
+                _report,
+                combined_path,
+                part,
+                os.path.join(work_dir, "report-{}.dat".format(i)),
+            )
+            for i, part in enumerate(_split(sorted(combined.measured_files()), jobs))
+        ]
+        with open(output, "wb") as out:
+            for report in reports:
+                with open(report.result(), "rb") as f:
+                    shutil.copyfileobj(f, out)
+
+
+def _create_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Raw coverage data files, zip files of undeclared test outputs, "
+        + "or directories to search for either, e.g. bazel-testlogs.",
+    )
+    parser.add_argument("--output", required=True, help="The lcov file to write.")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="How many processes to use. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--source_root",
+        default=os.environ.get("BUILD_WORKSPACE_DIRECTORY") or os.getcwd(),
+        help="The directory that the source files' paths are relative to. "
+        + "Defaults to the workspace when run with `bazel run`.",
+    )
+    return parser
+
+
+def main(argv=None):
+    options = _create_parser().parse_args(argv)
+    # Relative paths are relative to where the tool was run from, which
+    # `bazel run` changes.
+    cwd = os.environ.get("BUILD_WORKING_DIRECTORY") or os.getcwd()
+    paths = [os.path.join(cwd, path) for path in options.paths]
+    output = os.path.join(cwd, options.output)
+    with tempfile.TemporaryDirectory() as work_dir:
+        extract_dir = os.path.join(work_dir, "extracted")
+        os.mkdir(extract_dir)
+        data_files = find_data_files(paths, extract_dir)
+        if not data_files:
+            print("coverage_merger: no coverage data files found", file=sys.stderr)
+            return 1
+        os.chdir(options.source_root)
+        merge(data_files, output, options.jobs, work_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,18 +17,35 @@ from __future__ import annotations
 import argparse
 import base64
 import csv
+import fnmatch
+import functools
 import hashlib
 import io
+import json
 import os
 import re
 import stat
+import struct
 import sys
+import tempfile
 import zipfile
+import zlib
 from collections.abc import Iterable
 from pathlib import Path
 
 _ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
 
+# How much of the RECORD file is kept in memory before it's spooled to disk.
+_RECORD_SPOOL_SIZE = 2**23
+
+# The modes that a `compression_policy` can give a member. An "auto" member is
+# stored if deflating it saves too little.
+COMPRESSION_MODES = ("stored", "deflated", "auto")
+
+# Appended to a wheel's path to get the file that records the settings it was
+# built with, when it's built with a previous wheel.
+_SETTINGS_SUFFIX = ".settings.json"
+
 
 def commonpath(path1, path2):
     ret = []
@@ -123,6 +140,11 @@ def arcname_from(
     return normalized_arcname
 
 
+def _read_blocks(f):
+    """Returns an iterator over the blocks of a binary file object."""
+    return iter(functools.partial(f.read, 2**20), b"")
+
+
 class _WhlFile(zipfile.ZipFile):
     def __init__(
         self,
@@ -132,13 +154,64 @@ class _WhlFile(zipfile.ZipFile):
         distribution_prefix: str,
         strip_path_prefixes=None,
         compression=zipfile.ZIP_DEFLATED,
+        compression_policy=None,
+        auto_min_savings=10,
+        previous_wheel=None,
+        keep_previous_compression=False,
         **kwargs,
     ):
         self._distribution_prefix = distribution_prefix
+        # (pattern, mode) tuples for the members that don't use `compression`.
+        # The first pattern that matches a member's name is used.
+        self._compression_policy = compression_policy or []
+        # The percentage of an "auto" member's size that deflating it must
+        # save for it to be deflated.
+        self._auto_min_savings = auto_min_savings
 
         self._strip_path_prefixes = strip_path_prefixes or []
-        # Entries for the RECORD file as (filename, hash, size) tuples.
-        self._record = []
+        # The rows of the RECORD file, written as the files are added. Their
+        # CSV is batched in a buffer and then encoded to a file that is spooled
+        # to disk when it gets large, so that wheels with very many files don't
+        # need much memory for it.
+        self._record = tempfile.SpooledTemporaryFile(max_size=_RECORD_SPOOL_SIZE)
+        self._record_buffer = io.StringIO()
+        self._record_writer = csv.writer(self._record_buffer, lineterminator="\n")
+
+        # The wheel to copy unchanged members from, and its RECORD entries as
+        # a dict of filename to (hash, size).
+        self._previous_fp = None
+        self._previous = None
+        self._previous_record = {}
+        # Whether previous members are copied even if they were compressed
+        # differently than they would be now.
+        self._keep_previous_compression = keep_previous_compression
+        # Where the settings that decide how members are compressed are
+        # written, so that a later build can tell if it may copy this wheel's
+        # members. Unless the previous compression is kept, members are only
+        # copied from a wheel that was built with the same settings.
+        self._settings_path = None
+        self._settings = {
+            "compression": compression,
+            "compresslevel": kwargs.get("compresslevel"),
+            "compression_policy": [list(p) for p in self._compression_policy],
+            "auto_min_savings": auto_min_savings,
+        }
+        if previous_wheel:
+            if (
+                os.path.exists(filename)
+                and os.path.exists(previous_wheel)
+                and os.path.samefile(filename, previous_wheel)
+            ):
+                raise ValueError(
+                    f"The previous wheel must not be the output: {previous_wheel}"
+                )
+            if keep_previous_compression:
+                self._open_previous(previous_wheel)
+            else:
+                self._settings_path = f"{filename}{_SETTINGS_SUFFIX}"
+                # The previous wheel may not exist yet, e.g. on the first build.
+                if self._read_settings(previous_wheel) == self._settings:
+                    self._open_previous(previous_wheel)
 
         super().__init__(filename, mode=mode, compression=compression, **kwargs)
 
@@ -166,28 +239,219 @@ class _WhlFile(zipfile.ZipFile):
             strip_path_prefixes=self._strip_path_prefixes,
         )
         zinfo = self._zipinfo(arcname)
+        if self._copy_unchanged(zinfo, real_filename):
+            return
+
+        with open(real_filename, "rb") as fsrc:
+            if self._compression_mode(arcname) == "auto":
+                self._choose_compress_type(zinfo, _read_blocks(fsrc))
+                fsrc.seek(0)
+            digest, size = self._write_member(zinfo, fsrc, force_zip64=True)
+
+        self._add_to_record(arcname, digest, size)
 
-        # Write file to the zip archive while computing the hash and length
+    def _write_member(self, zinfo, fsrc, force_zip64=False):
+        """Writes a member from a file object and returns its digest and size.
+
+        `ZipFile.open()` always deflates with zlib's default level, so members
+        deflated with another level are read into memory and written with
+        `writestr()`, which takes the level.
+        """
         hash = hashlib.sha256()
         size = 0
-        with open(real_filename, "rb") as fsrc:
-            with self.open(zinfo, "w", force_zip64=True) as fdst:
-                while True:
-                    block = fsrc.read(2**20)
-                    if not block:
-                        break
-                    fdst.write(block)
-                    hash.update(block)
-                    size += len(block)
+        if self._uses_writestr(zinfo):
+            contents = fsrc.read()
+            self.writestr(zinfo, contents, compresslevel=self.compresslevel)
+            hash.update(contents)
+            return self._serialize_digest(hash), len(contents)
+
+        with self.open(zinfo, "w", force_zip64=force_zip64) as fdst:
+            for block in _read_blocks(fsrc):
+                fdst.write(block)
+                hash.update(block)
+                size += len(block)
+        return self._serialize_digest(hash), size
+
+    def _uses_writestr(self, zinfo):
+        """Whether `_write_member()` writes a member with `writestr()`."""
+        return (
+            zinfo.compress_type != zipfile.ZIP_STORED and self.compresslevel is not None
+        )
+
+    def _compression_mode(self, arcname):
+        """Returns the `compression_policy` mode of a member, if any."""
+        for pattern, mode in self._compression_policy:
+            if fnmatch.fnmatchcase(arcname, pattern):
+                return mode
+        return None
+
+    def _choose_compress_type(self, zinfo, blocks):
+        """Stores an "auto" member if deflating it saves too little.
+
+        The member's contents are deflated the way writing them would, but
+        only to count the compressed size, so that the compression is chosen
+        before the member is written.
+
+        Args:
+            zinfo: The ZipInfo for the member to write.
+            blocks: The member's contents, as an iterable of bytes.
+        """
+        if zinfo.compress_type != zipfile.ZIP_DEFLATED:
+            return
+        level = self.compresslevel
+        if level is None:
+            level = zlib.Z_DEFAULT_COMPRESSION
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        file_size = 0
+        compress_size = 0
+        for block in blocks:
+            file_size += len(block)
+            compress_size += len(compressor.compress(block))
+        compress_size += len(compressor.flush())
+        saved = file_size - compress_size
+        if saved * 100 < self._auto_min_savings * file_size:
+            zinfo.compress_type = zipfile.ZIP_STORED
+
+    def _open_previous(self, previous_wheel):
+        self._previous_fp = open(previous_wheel, "rb")
+        try:
+            self._previous = zipfile.ZipFile(self._previous_fp)
+            record_name = self.distinfo_path("RECORD")
+            if record_name not in self._previous.NameToInfo:
+                # E.g. the version changed, so nothing can be reused.
+                return
+            record = self._previous.read(record_name).decode("utf-8", "surrogateescape")
+        except (OSError, zipfile.BadZipFile):
+            self._close_previous()
+            raise
+        for row in csv.reader(io.StringIO(record)):
+            if len(row) == 3 and row[1] and row[2].isdigit():
+                filename, digest, size = row
+                self._previous_record[filename] = (
+                    digest.encode("utf-8", "surrogateescape"),
+                    int(size),
+                )
+
+    @staticmethod
+    def _read_settings(wheel):
+        """Returns the settings a wheel was built with, or None if unknown."""
+        if not os.path.exists(wheel):
+            return None
+        try:
+            with open(f"{wheel}{_SETTINGS_SUFFIX}") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _close_previous(self):
+        if self._previous is not None:
+            self._previous.close()
+            self._previous = None
+        if self._previous_fp is not None:
+            self._previous_fp.close()
+            self._previous_fp = None
+        self._previous_record = {}
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._close_previous()
+            self._record.close()
+        if self._settings_path:
+            with open(self._settings_path, "w") as f:
+                json.dump(self._settings, f, sort_keys=True)
+            self._settings_path = None
+
+    def _copy_unchanged(self, zinfo, real_filename):
+        """Copies a member from the previous wheel if its file is unchanged.
+
+        The member's compressed bytes are copied as they are, so the file is
+        only hashed, not compressed again.
+
+        Args:
+            zinfo: The ZipInfo for the member to write.
+            real_filename: The path of the file with the member's contents.
+
+        Returns:
+            bool, whether the member was copied.
+        """
+        previous_record = self._previous_record.get(zinfo.filename)
+        if previous_record is None or not self._seekable:
+            return False
+        digest, size = previous_record
+        previous_info = self._previous.NameToInfo.get(zinfo.filename)
+        if (
+            previous_info is None
+            or (
+                previous_info.compress_type != zinfo.compress_type
+                and not self._keep_previous_compression
+                # "auto" members may have been stored.
+                and self._compression_mode(zinfo.filename) != "auto"
+            )
+            # Encrypted.
+            or previous_info.flag_bits & 0x1
+            or previous_info.file_size != size
+            or os.path.getsize(real_filename) != size
+        ):
+            return False
+
+        hash = hashlib.sha256()
+        with open(real_filename, "rb") as f:
+            while True:
+                block = f.read(2**20)
+                if not block:
+                    break
+                hash.update(block)
+        if self._serialize_digest(hash) != digest:
+            return False
+
+        # The data follows the local file header, whose name and extra field
+        # can differ from the central directory's.
+        self._previous_fp.seek(previous_info.header_offset)
+        header = self._previous_fp.read(zipfile.sizeFileHeader)
+        name_size, extra_size = struct.unpack("<HH", header[26:30])
+        self._previous_fp.seek(name_size + extra_size, os.SEEK_CUR)
+
+        # This matches what writing the file with `_write_member()` does.
+        zinfo.compress_type = previous_info.compress_type
+        zinfo.flag_bits = 0x00
+        zinfo.file_size = size
+        zinfo.compress_size = previous_info.compress_size
+        zinfo.CRC = previous_info.CRC
+        self.fp.seek(self.start_dir)
+        zinfo.header_offset = self.fp.tell()
+        self._writecheck(zinfo)
+        self._didModify = True
+        if self._uses_writestr(zinfo):
+            zip64 = size * 1.05 > zipfile.ZIP64_LIMIT
+        else:
+            zip64 = True
+        self.fp.write(zinfo.FileHeader(zip64=zip64))
+        remaining = previous_info.compress_size
+        while remaining:
+            block = self._previous_fp.read(min(remaining, 2**20))
+            if not block:
+                raise zipfile.BadZipFile(
+                    f"Truncated member in previous wheel: {zinfo.filename}"
+                )
+            self.fp.write(block)
+            remaining -= len(block)
+        self.start_dir = self.fp.tell()
+        self.filelist.append(zinfo)
+        self.NameToInfo[zinfo.filename] = zinfo
 
-        self._add_to_record(arcname, self._serialize_digest(hash), size)
+        self._add_to_record(zinfo.filename, digest, size)
+        return True
 
     def add_string(self, filename, contents):
         """Add given 'contents' as filename to the distribution."""
         if isinstance(contents, str):
             contents = contents.encode("utf-8", "surrogateescape")
         zinfo = self._zipinfo(filename)
-        self.writestr(zinfo, contents)
+        if self._compression_mode(zinfo.filename) == "auto":
+            self._choose_compress_type(zinfo, [contents])
+        self.writestr(zinfo, contents, compresslevel=self.compresslevel)
         hash = hashlib.sha256()
         hash.update(contents)
         self._add_to_record(filename, self._serialize_digest(hash), len(contents))
@@ -200,8 +464,23 @@ class _WhlFile(zipfile.ZipFile):
         return digest
 
     def _add_to_record(self, filename, hash, size):
-        size = str(size).encode("ascii")
-        self._record.append((filename, hash, size))
+        if isinstance(filename, str):
+            filename = filename.lstrip("/")
+        self._record_writer.writerow(
+            (
+                c if isinstance(c, str) else c.decode("utf-8", "surrogateescape")
+                for c in (filename, hash, str(size))
+            )
+        )
+        if self._record_buffer.tell() >= 2**16:
+            self._flush_record_buffer()
+
+    def _flush_record_buffer(self):
+        self._record.write(
+            self._record_buffer.getvalue().encode("utf-8", "surrogateescape")
+        )
+        self._record_buffer.seek(0)
+        self._record_buffer.truncate()
 
     def _zipinfo(self, filename):
         """Construct deterministic ZipInfo entry for a file named filename"""
@@ -220,32 +499,33 @@ class _WhlFile(zipfile.ZipFile):
         zinfo.external_attr = (
             stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO | stat.S_IFREG
         ) << 16  # permissions: -rwxrwxrwx
-        zinfo.compress_type = self.compression
+        mode = self._compression_mode(arcname)
+        if mode == "stored":
+            zinfo.compress_type = zipfile.ZIP_STORED
+        elif mode:
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+        else:
+            zinfo.compress_type = self.compression
         return zinfo
 
     def add_recordfile(self):
-        """Write RECORD file to the distribution."""
+        """Write RECORD file to the distribution.
+
+        The file is copied into the archive from where its rows were spooled,
+        rather than built in memory.
+        """
         record_path = self.distinfo_path("RECORD")
-        entries = self._record + [(record_path, b"", b"")]
-        with io.StringIO() as contents_io:
-            writer = csv.writer(contents_io, lineterminator="\n")
-            for filename, digest, size in entries:
-                if isinstance(filename, str):
-                    filename = filename.lstrip("/")
-                writer.writerow(
-                    (
-                        (
-                            c
-                            if isinstance(c, str)
-                            else c.decode("utf-8", "surrogateescape")
-                        )
-                        for c in (filename, digest, size)
-                    )
-                )
+        self._add_to_record(record_path, "", "")
+        self._flush_record_buffer()
 
-            contents = contents_io.getvalue()
-            self.add_string(record_path, contents)
-            return contents.encode("utf-8", "surrogateescape")
+        zinfo = self._zipinfo(record_path)
+        if self._compression_mode(zinfo.filename) == "auto":
+            self._record.seek(0)
+            self._choose_compress_type(zinfo, _read_blocks(self._record))
+        # Like `writestr()`, only use ZIP64 if the file is large.
+        zinfo.file_size = self._record.seek(0, os.SEEK_END)
+        self._record.seek(0)
+        self._write_member(zinfo, self._record)
 
 
 class WheelMaker(object):
@@ -260,6 +540,10 @@ class WheelMaker(object):
         compress,
         outfile=None,
         strip_path_prefixes=None,
+        previous_wheel=None,
+        compress_level=None,
+        compression_policy=None,
+        auto_min_savings=10,
     ):
         self._name = name
         self._version = normalize_pep440(version)
@@ -270,6 +554,10 @@ class WheelMaker(object):
         self._outfile = outfile
         self._strip_path_prefixes = strip_path_prefixes
         self._compress = compress
+        self._previous_wheel = previous_wheel
+        self._compress_level = compress_level
+        self._compression_policy = compression_policy
+        self._auto_min_savings = auto_min_savings
         self._wheelname_fragment_distribution_name = escape_filename_distribution_name(
             self._name
         )
@@ -287,6 +575,10 @@ class WheelMaker(object):
             distribution_prefix=self._distribution_prefix,
             strip_path_prefixes=self._strip_path_prefixes,
             compression=zipfile.ZIP_DEFLATED if self._compress else zipfile.ZIP_STORED,
+            compresslevel=self._compress_level,
+            compression_policy=self._compression_policy,
+            auto_min_savings=self._auto_min_savings,
+            previous_wheel=self._previous_wheel,
         )
         return self
 
@@ -353,6 +645,94 @@ Root-Is-Purelib: {}
         self._whlfile.add_recordfile()
 
 
+_REQUIRES_DIST = "Requires-Dist: "
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_requirement(reqs_text):
+    """Returns a requirement without its marker, and its marker, if any."""
+    # This is not imported at the top of the file due to the reliance
+    # on this file in the `whl_library` repository rule which does not
+    # provide `packaging` but does import symbols defined here.
+    from packaging.requirements import Requirement
+
+    req = Requirement(reqs_text)
+    # Extras are a set, so they're sorted for a reproducible order.
+    req_extra_deps = f"[{','.join(sorted(req.extras))}]" if req.extras else ""
+    return (
+        f"{req.name}{req_extra_deps}{req.specifier}",
+        str(req.marker) if req.marker else None,
+    )
+
+
+def _requirement_line(reqs_text, extra):
+    requirement, marker = _parse_requirement(reqs_text.strip())
+    if marker:
+        if extra:
+            return f"{_REQUIRES_DIST}{requirement}; ({marker}) and {extra}"
+        else:
+            return f"{_REQUIRES_DIST}{requirement}; {marker}"
+    else:
+        return f"{_REQUIRES_DIST}{requirement}; {extra}".strip(" ;")
+
+
+def expand_requires_dist(metadata):
+    """Expands and normalizes the `Requires-Dist` lines of METADATA contents.
+
+    A `Requires-Dist: @<path>[; <marker>]` line is replaced by a line for
+    each requirement in the requirements file at `<path>`, with the marker
+    added to them, or removed if the file has no requirements. Requirements
+    with a marker are normalized. The other lines are unchanged.
+
+    The metadata is transformed in a single pass over its lines, and the
+    same requirements are only parsed once.
+
+    Args:
+        metadata: str, the contents of the METADATA file.
+
+    Returns:
+        str, the expanded metadata.
+    """
+    lines = []
+    for line in metadata.splitlines(keepends=True):
+        meta_line = line.rstrip("\r\n")
+        if not meta_line.startswith(_REQUIRES_DIST):
+            lines.append(line)
+            continue
+        line_ending = line[len(meta_line) :]
+
+        if not meta_line[len(_REQUIRES_DIST) :].startswith("@"):
+            # This is a normal requirement.
+            package, _, extra = meta_line[len(_REQUIRES_DIST) :].rpartition(";")
+            if not package:
+                # This is when the package requirement does not have markers.
+                lines.append(line)
+                continue
+            lines.append(_requirement_line(package, extra.strip()) + line_ending)
+            continue
+
+        # This is a requirement that refers to a file.
+        file, _, extra = meta_line[len(_REQUIRES_DIST) + 1 :].partition(";")
+        extra = extra.strip()
+
+        reqs = []
+        for reqs_line in Path(file).read_text(encoding="utf-8").splitlines():
+            reqs_text = reqs_line.strip()
+            if not reqs_text or reqs_text.startswith(("#", "-")):
+                continue
+
+            # Strip any comments
+            reqs_text, _, _ = reqs_text.partition("#")
+
+            reqs.append(_requirement_line(reqs_text, extra))
+
+        # If the file is empty, the line is removed entirely.
+        if reqs:
+            lines.append("\n".join(reqs) + line_ending)
+
+    return "".join(lines)
+
+
 def get_files_to_package(input_files):
     """Find files to be added to the distribution.
 
@@ -426,6 +806,41 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Disable compression of the final archive",
     )
+    output_group.add_argument(
+        "--compression_level",
+        type=int,
+        choices=range(-1, 10),
+        default=None,
+        help="The zlib compression level of deflated files. Defaults to zlib's "
+        "default.",
+    )
+    output_group.add_argument(
+        "--compression_policy",
+        action="append",
+        default=[],
+        help="'pattern;mode' pairs giving the compression of the files whose "
+        "path in the wheel matches the glob pattern: one of "
+        + ", ".join(COMPRESSION_MODES)
+        + ". 'auto' stores a file if deflating it saves less than "
+        "--compression_auto_min_savings. The first matching pattern is used. "
+        "Can be supplied multiple times.",
+    )
+    output_group.add_argument(
+        "--compression_auto_min_savings",
+        type=int,
+        default=10,
+        help="The percentage of its size that deflating an 'auto' file must "
+        "save for it to be deflated.",
+    )
+    output_group.add_argument(
+        "--previous_wheel",
+        type=Path,
+        help="A wheel previously built with --previous_wheel. If it was built "
+        "with the same compression settings, which are recorded next to it in "
+        "a '<wheel>" + _SETTINGS_SUFFIX + "' file, the members whose files are "
+        "unchanged are copied from it without compressing them again. It may "
+        "not exist yet, and must not be the output file.",
+    )
     output_group.add_argument(
         "--name_file",
         type=Path,
@@ -498,7 +913,15 @@ def parse_args() -> argparse.Namespace:
         help="Pass in the stamp info file for stamping",
     )
 
-    return parser.parse_args(sys.argv[1:])
+    arguments = parser.parse_args(sys.argv[1:])
+    policy = []
+    for pair in arguments.compression_policy:
+        pattern, _, mode = pair.rpartition(";")
+        if mode not in COMPRESSION_MODES:
+            parser.error(f"Invalid --compression_policy mode: {pair}")
+        policy.append((pattern, mode))
+    arguments.compression_policy = policy
+    return arguments
 
 
 def _parse_file_pairs(content: List[str]) -> List[List[str]]:
@@ -555,6 +978,10 @@ def main() -> None:
         outfile=arguments.out,
         strip_path_prefixes=strip_prefixes,
         compress=not arguments.no_compress,
+        previous_wheel=arguments.previous_wheel,
+        compress_level=arguments.compression_level,
+        compression_policy=arguments.compression_policy,
+        auto_min_savings=arguments.compression_auto_min_savings,
     ) as maker:
         for package_filename, real_filename in all_files:
             maker.add_file(package_filename, real_filename)
@@ -569,66 +996,9 @@ def main() -> None:
 
         metadata = arguments.metadata_file.read_text(encoding="utf-8")
 
-        # This is not imported at the top of the file due to the reliance
-        # on this file in the `whl_library` repository rule which does not
-        # provide `packaging` but does import symbols defined here.
-        from packaging.requirements import Requirement
-
         # Search for any `Requires-Dist` entries that refer to other files and
         # expand them.
-
-        def get_new_requirement_line(reqs_text, extra):
-            req = Requirement(reqs_text.strip())
-            req_extra_deps = f"[{','.join(req.extras)}]" if req.extras else ""
-            if req.marker:
-                if extra:
-                    return f"Requires-Dist: {req.name}{req_extra_deps}{req.specifier}; ({req.marker}) and {extra}"
-                else:
-                    return f"Requires-Dist: {req.name}{req_extra_deps}{req.specifier}; {req.marker}"
-            else:
-                return f"Requires-Dist: {req.name}{req_extra_deps}{req.specifier}; {extra}".strip(
-                    " ;"
-                )
-
-        for meta_line in metadata.splitlines():
-            if not meta_line.startswith("Requires-Dist: "):
-                continue
-
-            if not meta_line[len("Requires-Dist: ") :].startswith("@"):
-                # This is a normal requirement.
-                package, _, extra = meta_line[len("Requires-Dist: ") :].rpartition(";")
-                if not package:
-                    # This is when the package requirement does not have markers.
-                    continue
-                extra = extra.strip()
-                metadata = metadata.replace(
-                    meta_line, get_new_requirement_line(package, extra)
-                )
-                continue
-
-            # This is a requirement that refers to a file.
-            file, _, extra = meta_line[len("Requires-Dist: @") :].partition(";")
-            extra = extra.strip()
-
-            reqs = []
-            for reqs_line in Path(file).read_text(encoding="utf-8").splitlines():
-                reqs_text = reqs_line.strip()
-                if not reqs_text or reqs_text.startswith(("#", "-")):
-                    continue
-
-                # Strip any comments
-                reqs_text, _, _ = reqs_text.partition("#")
-
-                reqs.append(get_new_requirement_line(reqs_text, extra))
-
-            if reqs:
-                metadata = metadata.replace(meta_line, "\n".join(reqs))
-            # File is empty
-            # So replace the meta_line entirely, including removing newline chars
-            else:
-                metadata = re.sub(
-                    re.escape(meta_line) + r"(?:\r?\n)?", "", metadata, count=1
-                )
+        metadata = expand_requires_dist(metadata)
 
         maker.add_metadata(
             metadata=metadata,